@@ -0,0 +1,74 @@
+"""
+Cold start benchmark: time one-shot Legions commands, each in a fresh interpreter.
+
+    python benchmarks/startup.py -n 10
+    python benchmarks/startup.py --json -- query code --address 0x0000000000000000000000000000000000000000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# One-shot commands which do not need a node
+DEFAULT_COMMANDS = [
+    ["--help"],
+    ["version"],
+    ["conversions", "toHex", "--value", "legions"],
+]
+
+
+def time_command(argv: list, runs: int) -> list:
+    """
+    Wall clock seconds of runs cold executions of legions with argv
+    """
+    cmd = [sys.executable, os.path.join(ROOT, "legions.py")] + argv
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=5, help="runs per command")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("argv", nargs="*", help="legions arguments to time")
+    args = parser.parse_args()
+
+    commands = [args.argv] if args.argv else DEFAULT_COMMANDS
+    results = []
+    for argv in commands:
+        timings = time_command(argv, args.runs)
+        results.append(
+            {
+                "command": " ".join(argv),
+                "runs": args.runs,
+                "min": min(timings),
+                "median": statistics.median(timings),
+                "max": max(timings),
+            }
+        )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(
+            "{command:<40} min {min:.3f}s  median {median:.3f}s  max {max:.3f}s".format(
+                **result
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,91 @@
 # Legion - Shayan Eskandari, ConsenSys Diligence
 
 import asyncio
+import collections
+import json
 import os
 import socket
+import sys
+import textwrap
+import time
 import typing
-import requests
+from concurrent import futures
+from decimal import Decimal
 from nubia import command, argument
 from termcolor import cprint
 
 from legions.context import context
 from legions.version import __version__
-from legions.network.web3 import Web3
-from legions.utils.helper_functions import getChainName
+from legions.network.session import (
+    LazyWeb3,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_LOG_CHUNK,
+    BLOCK_MODES,
+    TOKEN_CACHE_FILE,
+)
+from legions.network.pool import ConnectionPool
+from legions.utils.helper_functions import getChainName, decodeStorageSlot
+from legions.utils.export import (
+    EXPORT_FORMATS,
+    Checkpoint,
+    open_writer,
+    read_column,
+    read_rows,
+)
+from legions.utils.concurrency import run_concurrently
+from legions.utils.events import Event
+from legions.utils.cache import JSONFileCache
 
 
 INFURA_URL = "https://mainnet.infura.io/v3/c3914c0859de473b9edcd6f723b4ea69"
 PEER_SAMPLE = "enode://000331f91e4343a7145be69f1d455b470d9ba90bdb6d74fe671b28af481361c931b632f03c03dde5ec4c34f2289064ccd4775f758fb95e9496a1bd5a619ae0fe@lfbn-lyo-1-210-35.w86-202.abo.wanadoo.fr:30303"
 # TODO ^ a real verbose node for this!
 
-w3 = Web3()
-w3.connect(INFURA_URL)
+# Columns of query blocks CSV exports
+BLOCK_CSV_FIELDS = [
+    "number",
+    "hash",
+    "parentHash",
+    "timestamp",
+    "miner",
+    "gasUsed",
+    "gasLimit",
+    "size",
+    "transactionCount",
+]
+
+# Columns of query logs CSV exports
+LOG_CSV_FIELDS = [
+    "blockNumber",
+    "transactionHash",
+    "logIndex",
+    "address",
+    "topics",
+    "data",
+    "event",
+    "args",
+]
+
+# Columns of query balances CSV exports
+BALANCE_CSV_FIELDS = ["address", "wei", "ether"]
+
+# Columns of query tokens CSV exports
+TOKEN_CSV_FIELDS = ["holder", "token", "symbol", "balance", "amount"]
+
+# Columns of query ecrecover exports
+ECRECOVER_CSV_FIELDS = ["message", "signature", "address", "error"]
+
+# Whether query balances and query tokens go through Multicall3
+MULTICALL_MODES = ["auto", "on", "off"]
+
+# Created and connected to INFURA_URL the first time a command uses it
+w3 = LazyWeb3(INFURA_URL)
+
+# Connections of the commands run on several chains at once (--chains)
+pool = ConnectionPool(variables={"INFURA_API_KEY": INFURA_URL.rsplit("/", 1)[1]})
+CHAINS_DESCRIPTION = (
+    "(Optional) Run on these chains at once (chainId, shortName or node URL)"
+)
 
 LEGION_TEST_PASS = (
     "Legion2019"  # TODO: there should be a better (recoverable) way to do this.
@@ -31,8 +97,15 @@ host = None
 
 
 @command(aliases=["sethost"])
-@argument("host", description="Address of the RPC Node", aliases=["u"])
-def sethost(host: str):
+@argument(
+    "host",
+    description="Address of the RPC Node (or nodes of the same chain separated by commas)",
+    aliases=["u"],
+)
+@argument(
+    "poolSize", description="Keep-alive connections kept open per host (HTTP nodes)"
+)
+def sethost(host: str, poolSize: int = None):
     """
     Setup the Web3 connection (RPC, IPC, HTTP) - This should be the first step 
     """
@@ -44,7 +117,7 @@ def sethost(host: str):
     cprint("Input: {}".format(host), "yellow")
     cprint("Verbose? {}".format(ctx.verbose), "yellow")
 
-    w3.connect(host)
+    w3.connect(host, pool_size=poolSize)
 
     if w3.isConnected():
         cprint("Web3 API Version: {}".format(w3.api), "green")
@@ -60,43 +133,296 @@ def sethost(host: str):
 
 
 @command("getnodeinfo")
-def getnodeinfo():
+@argument(
+    "timeout",
+    description="Seconds to wait for each field before giving up on it",
+    aliases=["t"],
+)
+def getnodeinfo(timeout: int = 5):
     """
     Prints information about the node (run setnode before this) 
     """
-    if w3.isConnected():
-        cprint("Web3 API Version: {}".format(w3.api), "white")
-        cprint(
-            "connected to: {}".format(w3.node_uri), "white",
-        )
-        cprint("Version: {}".format(w3.clientVersion), "green")
-        cprint("--" * 32)
-        cprint("Last Block Number: {}".format(w3.eth.blockNumber), "green")
+    cprint("Web3 API Version: {}".format(w3.api), "white")
+    cprint(
+        "connected to: {}".format(w3.node_uri), "white",
+    )
+    cprint("--" * 32)
+
+    # Every field is fetched concurrently and printed as soon as it arrives, so a
+    # slow or failing call does not hold back the others
+    probes = {
+        "Version": lambda: w3.clientVersion,
+        "Last Block Number": lambda: w3.eth.blockNumber,
+        "Chain": lambda: w3.eth.chainId,
+        "Protocol Version": lambda: w3.eth.protocolVersion,
+        "Is Listening": lambda: w3.net.listening,
+        "Peer Count": lambda: w3.net.peerCount,
+        "Is Syncing": lambda: w3.eth.syncing,
+        "Is Mining": lambda: w3.eth.mining,
+        "Hash Rate": lambda: w3.eth.hashrate,
+        "Gas Price": lambda: w3.eth.gasPrice,
+        "Coinbase Account": lambda: w3.eth.coinbase,
+        "Accounts": lambda: w3.eth.accounts,
+    }
+    answered = 0
+    for name, value, error in run_concurrently(
+        probes, max_workers=len(probes), timeout=timeout
+    ):
+        if error is not None:
+            cprint("{} not available: {}".format(name, error), "yellow")
+            continue
+
+        answered += 1
+        if name == "Chain":
+            cprint(
+                "Chain: {} (ChainID: {})".format(getChainName(value), value), "green"
+            )
+        elif name == "Accounts":
+            cprint("Accounts", "green")
+            for account in value:
+                cprint("- {}".format(account), "green")
+        else:
+            cprint("{}: {}".format(name, value), "green")
+
+    if answered == 0:
+        cprint("Cannot connect to: {} ".format(w3.node_uri), "red")
+        cprint("Did you run sethost?", "red")
+    return 0
+
+
+@command("pin")
+@argument(
+    "ttl",
+    description="(Optional) Seconds after which the pinned block is refreshed (default never)",
+    aliases=["t"],
+)
+@argument("off", description="Stop pinning, query the latest block again")
+def pin(ttl: int = None, off: bool = False):
+    """
+    Pin the current head block and run every following query at it (run again to refresh)
+    """
+    if off:
+        w3.unpin_block()
+        cprint("Block pinning is off, queries use the latest block", "yellow")
+        return 0
+
+    try:
+        block = w3.pin_block(ttl)
+    except Exception as e:
+        cprint("Failed to pin block: {}".format(e), "red")
+        return 0
+
+    if ttl:
+        cprint("Pinned block {} (refreshed every {}s)".format(block, ttl), "green")
+    else:
+        cprint("Pinned block {}".format(block), "green")
+    return 0
+
+
+@command("rpccache")
+@argument(
+    "confirmations",
+    description="(Optional) Turn the cache on, caching blocks this deep or more on disk",
+)
+@argument("off", description="Turn the cache off")
+@argument("clear", description="Drop every cached result")
+def rpccache(confirmations: int = None, off: bool = False, clear: bool = False):
+    """
+    Cache of immutable RPC results (code, storage, blocks... at final blocks), shows its stats
+    """
+    if off:
+        w3.disable_cache()
+        cprint("RPC cache is off", "yellow")
+        return 0
+    if confirmations is not None:
+        w3.enable_cache(confirmations=confirmations)
+    if w3.rpc_cache is None:
+        cprint("RPC cache is off (set confirmations to turn it on)", "yellow")
+        return 0
+    if clear:
+        w3.rpc_cache.clear()
+        cprint("RPC cache cleared", "green")
+
+    cprint(
+        "RPC cache on, blocks {} deep or more are final".format(
+            w3.rpc_cache.confirmations
+        ),
+        "green",
+    )
+    for name, value in w3.rpc_cache.stats().items():
+        cprint("{}: {}".format(name, value), "green")
+    return 0
+
+
+@command("ratelimit")
+@argument("rate", description="(Optional) Requests per second allowed to the node")
+@argument("burst", description="(Optional) Requests allowed at once above the rate")
+@argument(
+    "retries", description="(Optional) Retries of rate limited or failed requests"
+)
+@argument(
+    "failures",
+    description="(Optional) Failures in a row after which the node is failed fast",
+)
+@argument("reset", description="(Optional) Seconds a failing node is failed fast")
+def ratelimit(
+    rate: float = None,
+    burst: int = None,
+    retries: int = None,
+    failures: int = None,
+    reset: float = None,
+):
+    """
+    Rate limit, retries and circuit breaker of the connected node, shows their stats per host
+    """
+    from legions.network import limits
+
+    settings = {
+        "rate": rate,
+        "burst": burst,
+        "retries": retries,
+        "failures": failures,
+        "reset": reset,
+    }
+    if any(value is not None for value in settings.values()):
+        if not w3.set_limits(**settings):
+            cprint("Limits only apply to HTTP nodes", "yellow")
+
+    hosts = limits.policies()
+    if not hosts:
+        cprint("No request sent over HTTP yet", "yellow")
+    for host, policy in sorted(hosts.items()):
         cprint(
-            "Chain: {} (ChainID: {})".format(
-                getChainName(w3.eth.chainId), w3.eth.chainId
+            "{}: {}".format(
+                host, ", ".join("{}={}".format(k, v) for k, v in policy.stats().items())
             ),
             "green",
         )
-        cprint("Protocol Version: {}".format(w3.eth.protocolVersion), "green")
-        cprint("Is Listening: {}".format(w3.net.listening), "green")
-        cprint("Peer Count: {}".format(w3.net.peerCount), "green")
-        cprint("Is Syncing: {}".format(w3.eth.syncing), "green")
-        cprint("Is Mining: {}".format(w3.eth.mining), "green")
-        cprint("Hash Rate: {}".format(w3.eth.hashrate), "green")
-        cprint("Gas Price: {}".format(w3.eth.gasPrice), "green")
-        cprint("--" * 32)
-        try:
-            cprint("Coinbase Account: {}".format(w3.eth.coinbase), "green")
-        except Exception as e:
-            cprint("Coinbase not available: {}".format(e), "red")
-        cprint("Accounts", "green")
-        for account in w3.eth.accounts:
-            cprint("- {}".format(account), "green")
-    else:
-        cprint("Web3 API Version: {}".format(w3.api), "red")
-        cprint("Cannot connect to: {} ".format(host), "red")
-        cprint("Did you run sethost?", "red")
+    return 0
+
+
+def format_ms(seconds) -> str:
+    return "-" if seconds is None else "{:.1f}".format(seconds * 1000)
+
+
+@command("stats")
+@argument("last", description="(Optional) Number of recent commands to show")
+@argument(
+    "output",
+    description="(Optional) Export the metrics as JSON to this file ('-' for stdout)",
+)
+@argument("reset", description="Forget the metrics recorded so far")
+def stats(last: int = 10, output: str = None, reset: bool = False):
+    """
+    RPC calls sent to the node(s), per command and for the session: counts, errors, latency, bytes
+    """
+    from tabulate import tabulate
+
+    from legions.network import metrics
+
+    if reset:
+        metrics.reset()
+        cprint("RPC metrics reset", "green")
+        return 0
+    if output:
+        if output == "-":
+            print(json.dumps(metrics.export(), indent=2))
+        else:
+            with open(output, "w") as f:
+                json.dump(metrics.export(), f, indent=2)
+            cprint("RPC metrics written to {}".format(output), "green")
+        return 0
+
+    # Without this very command
+    current = metrics.current()
+    rows = []
+    commands = [entry for entry in metrics.commands() if entry is not current]
+    for command_stats in commands[-last:]:
+        total = command_stats.total().as_dict()
+        rows.append(
+            [
+                command_stats.name,
+                command_stats.status,
+                total["calls"],
+                command_stats.requests,
+                total["errors"],
+                format_ms(total["p50"]),
+                format_ms(total["p95"]),
+                total["bytes"],
+            ]
+        )
+    if rows:
+        cprint(
+            tabulate(
+                rows,
+                headers=[
+                    "Command",
+                    "Status",
+                    "Calls",
+                    "Requests",
+                    "Errors",
+                    "p50 ms",
+                    "p95 ms",
+                    "Bytes",
+                ],
+                tablefmt="pretty",
+                stralign="left",
+            )
+        )
+
+    session = metrics.session()
+    methods = session.as_dict()["methods"]
+    if not methods:
+        cprint("No RPC call sent yet", "yellow")
+        return 0
+    cprint(
+        tabulate(
+            [
+                [
+                    method,
+                    values["calls"],
+                    values["errors"],
+                    format_ms(values["p50"]),
+                    format_ms(values["p95"]),
+                    format_ms(values["max"]),
+                    values["bytes"],
+                ]
+                for method, values in sorted(
+                    methods.items(), key=lambda item: -item[1]["calls"]
+                )
+            ],
+            headers=[
+                "Method",
+                "Calls",
+                "Errors",
+                "p50 ms",
+                "p95 ms",
+                "max ms",
+                "Bytes",
+            ],
+            tablefmt="pretty",
+            stralign="left",
+        )
+    )
+    total = session.total()
+    cprint(
+        tabulate(
+            [
+                [metrics.bucket_label(i), count]
+                for i, count in enumerate(total.buckets)
+                if count
+            ],
+            headers=["Latency", "Calls"],
+            tablefmt="pretty",
+            stralign="left",
+        )
+    )
+    cprint(
+        "Session: {} calls in {} requests, {} errors, {} bytes".format(
+            total.calls, session.requests, total.errors, total.bytes
+        ),
+        "green",
+    )
     return 0
 
 
@@ -116,6 +442,112 @@ def version():
         cprint("Not connected to any hosts.", "red")
 
 
+# Outcomes of an investigate probe, in the columns of its summary
+PROBE_STATUSES = ["exposed", "denied", "timed out"]
+
+
+def probe_status(error) -> str:
+    """
+    "exposed" if the probe answered, "timed out" if it did not answer in time,
+    "denied" if the node refused it
+    """
+    if error is None:
+        return "exposed"
+    from requests.exceptions import Timeout
+
+    if isinstance(error, (futures.TimeoutError, socket.timeout, TimeoutError, Timeout)):
+        return "timed out"
+    return "denied"
+
+
+def run_probes(
+    probes: dict,
+    timeout: float,
+    budget_end: float,
+    concurrency: int = 16,
+    formats: dict = None,
+) -> list:
+    """
+    Run the probes (name -> callable) concurrently, each one given timeout
+    seconds and all of them done by budget_end, and print their outcome as it
+    arrives. Returns the (name, status, result or error) of every probe.
+
+    A probe is named after the RPC method it calls, optionally followed by its
+    argument (e.g. "eth_getBalance 0x..."). formats maps a name to the function
+    printing its result.
+    """
+    formats = formats or {}
+    results = []
+    for name, value, error in run_concurrently(
+        probes,
+        max_workers=concurrency,
+        timeout=timeout,
+        total_timeout=max(0, budget_end - time.monotonic()),
+    ):
+        status = probe_status(error)
+        if status == "exposed":
+            cprint("{}: {}".format(name, formats.get(name, str)(value)), "green")
+        elif status == "denied":
+            cprint("{}: {}".format(name, error), "yellow")
+        else:
+            cprint("{}: {}".format(name, error or "timed out"), "red")
+        results.append((name, status, value if error is None else error))
+    return results
+
+
+def probe_value(results: list, name: str, default=None):
+    """
+    Result of the probe name if it answered, default otherwise
+    """
+    return next(
+        (result for n, s, result in results if n == name and s == "exposed"), default
+    )
+
+
+def summarize_probes(results: list) -> list:
+    """
+    One [namespace, exposed, denied, timed out] row per RPC namespace probed,
+    each cell listing its methods (with a count when probed several times)
+    """
+    namespaces = collections.OrderedDict()
+    for name, status, _ in results:
+        method = name.split()[0]
+        cells = namespaces.setdefault(
+            method.split("_")[0],
+            {status: collections.Counter() for status in PROBE_STATUSES},
+        )
+        cells[status][method] += 1
+    return [
+        [namespace]
+        + [
+            ", ".join(
+                method if count == 1 else "{} x{}".format(method, count)
+                for method, count in cells[status].items()
+            )
+            for status in PROBE_STATUSES
+        ]
+        for namespace, cells in namespaces.items()
+    ]
+
+
+def print_probe_summary(results: list, started: float) -> None:
+    from tabulate import tabulate
+
+    cprint("--" * 32)
+    cprint(
+        tabulate(
+            summarize_probes(results),
+            headers=["Namespace", "Exposed", "Denied", "Timed out"],
+            tablefmt="pretty",
+            stralign="left",
+        )
+    )
+    cprint(
+        "{} probes in {:.1f}s".format(len(results), time.monotonic() - started),
+        "white",
+    )
+
+
 @command
 class Investigate:
     "Investigate further in the node (e.g. check if accounts are unlocked, etc)"
@@ -136,126 +568,103 @@ class Investigate:
         description="Be intrusive, try to make new accounts, etc",
         aliases=["i"],
     )
+    @argument(
+        "timeout", description="Seconds to wait for each probe", aliases=["t"],
+    )
+    @argument("budget", description="Seconds to wait for all the probes")
+    @argument("concurrency", description="Number of probes at once")
     def investigate_accounts(
-        self, all: bool = True, intrusive: bool = True
+        self,
+        all: bool = True,
+        intrusive: bool = True,
+        timeout: int = 5,
+        budget: int = 30,
+        concurrency: int = 16,
     ):  # TODO: make these default to False for public use
         """
         Investigate accounts (e.g. check if accounts are unlocked, etc)
         """
-        if w3.isConnected():
-            coinbase = None
-            try:
-                coinbase = w3.eth.coinbase
-            except Exception as e:
-                cprint("Coinbase not available: {}".format(e), "red")
-            accounts = w3.eth.accounts
-            if len(accounts) == 0:
-                cprint("No accounts found", "red")
-                if (
-                    type(coinbase) is None
-                ):  # TODO: check if we need this. If accounts = [] , then there shouldn't be coinbase (?)
-                    cprint("Nothing to do here")
-                    return 0
-
-            if all:
-                for account in accounts:
-                    cprint(
-                        "Balance of {} is : {}".format(
-                            account, w3.eth.getBalance(account)
-                        ),
-                        "white",
-                    )
-                    # try:
-                    #     cprint("Trying to unlock {}: {}".format(account, w3.parity.personal.unlockAccount(account, "")), "white")
-                    # except Exception as e:
-                    #     cprint("Failed to unlock: {}".format(e))
-                    pass
-            else:
-                cprint("Number of Accounts: {}".format(len(w3.eth.accounts)), "green")
-
-            # cprint("logs: {}".format(w3.eth.getLogs()), "white") #needs to pass filter_params --> maybe based on the accounts? filter events of the accounts hu?
-
-            if "parity" in (w3.clientVersion.lower()):
+        started = time.monotonic()
+        budget_end = started + budget
+        probes = {
+            "eth_coinbase": lambda: w3.eth.coinbase,
+            "eth_accounts": lambda: w3.eth.accounts,
+        }
+        if intrusive:
+            # Tells which personal namespace to use, within the deadlines too
+            probes["web3_clientVersion"] = lambda: w3.clientVersion
+        results = run_probes(
+            probes,
+            timeout,
+            budget_end,
+            formats={"eth_accounts": lambda a: "{} accounts".format(len(a))},
+        )
+        accounts = probe_value(results, "eth_accounts", [])
+        if len(accounts) == 0:
+            cprint("No accounts found", "red")
+
+        probes = {}
+        if all:
+            for account in accounts:
+                probes[
+                    "eth_getBalance {}".format(account)
+                ] = lambda account=account: w3.eth.getBalance(account)
+
+        # cprint("logs: {}".format(w3.eth.getLogs()), "white") #needs to pass filter_params --> maybe based on the accounts? filter events of the accounts hu?
+
+        if intrusive:
+            client_version = probe_value(results, "web3_clientVersion") or ""
+            if "parity" in client_version.lower():
                 ww3 = w3.parity
-            elif "geth" in (w3.clientVersion.lower()):
+            else:
                 ww3 = w3.geth
+            probes["personal_importRawKey"] = lambda: ww3.personal.importRawKey(
+                LEGION_TEST_PRV, LEGION_TEST_PASS
+            )
+            probes["personal_newAccount"] = lambda: ww3.personal.newAccount(
+                LEGION_TEST_PASS
+            )
 
-            if intrusive:
-                try:
-                    cprint(
-                        "importRawKey: {}".format(
-                            ww3.personal.importRawKey(LEGION_TEST_PRV, LEGION_TEST_PASS)
-                        ),
-                        "green",
-                    )
-                except Exception as e:
-                    cprint("importRawKey: {}".format(e), "yellow")
-                try:
-                    cprint(
-                        "newAccount: {}".format(
-                            ww3.personal.newAccount(LEGION_TEST_PASS)
-                        ),
-                        "white",
-                    )
-                except Exception as e:
-                    cprint("newAccount: {}".format(e), "yellow")
-
-            cprint("--" * 32)
+        results += run_probes(probes, timeout, budget_end, concurrency)
+        print_probe_summary(results, started)
+        return 0
 
     @command("admin")
     @argument(
         "intrusive", description="Be intrusive, try to add peers, etc", aliases=["i"]
     )
+    @argument(
+        "timeout", description="Seconds to wait for each probe", aliases=["t"],
+    )
+    @argument("budget", description="Seconds to wait for all the probes")
     def investigate_admin(
-        self, intrusive: bool = False
+        self, intrusive: bool = False, timeout: int = 5, budget: int = 30,
     ):  # TODO: make these default to False for public use
         """
         Investigate admin (e.g. functionalities under the admin_ namespace)
         """
-        cprint("clientVersion: {}".format(w3.clientVersion), "white")
+        started = time.monotonic()
+        budget_end = started + budget
+        results = run_probes(
+            {"web3_clientVersion": lambda: w3.clientVersion}, timeout, budget_end
+        )
+        client_version = (probe_value(results, "web3_clientVersion") or "").lower()
         # More interfaces here: https://web3py.readthedocs.io/en/stable/web3.geth.html
-        if "geth" in (
-            w3.clientVersion.lower()
-        ):  # TODO: make this figure out if the node is Geth or Parity and send the appropriate commands
+        probes = {}
+        if "geth" in client_version:
             if intrusive:
-                try:
-                    cprint(
-                        "AddPeer: {}".format(w3.geth.admin.add_peer(PEER_SAMPLE)),
-                        "green",
-                    )
-                except Exception as e:
-                    cprint("AddPeer: {}".format(e), "yellow")
-
-            try:
-                cprint("datadir: {}".format(w3.geth.admin.datadir()), "green")
-            except Exception as e:
-                cprint("datadir: {}".format(e), "yellow")
-            try:
-                cprint("nodeInfo: {}".format(w3.geth.admin.nodeInfo()), "green")
-            except Exception as e:
-                cprint("nodeInfo {}".format(e), "yellow")
-            try:
-                cprint("peers: {}".format(w3.geth.admin.peers()), "green")
-            except Exception as e:
-                cprint("peers {}".format(e), "yellow")
-            try:
-                cprint("txpool.status: {}".format(w3.geth.txpool.status()), "green")
-            except Exception as e:
-                cprint("txpool.status {}".format(e), "yellow")
-            try:
-                cprint("shh.version: {}".format(w3.geth.shh.version()), "green")
-            except Exception as e:
-                cprint("shh.version: {}".format(e), "yellow")
-            try:
-                cprint("Wshh.info: {}".format(w3.geth.shh.info()), "green")
-            except Exception as e:
-                cprint("shh.info: {}".format(e), "yellow")
-
-        elif "parity" in (w3.clientVersion.lower()):
-            try:
-                cprint("versionInfo: {}".format(w3.parity_versionInfo()), "green")
-            except Exception as e:
-                cprint("versionInfo: {}".format(e), "yellow")
+                probes["admin_addPeer"] = lambda: w3.geth.admin.add_peer(PEER_SAMPLE)
+            probes["admin_datadir"] = lambda: w3.geth.admin.datadir()
+            probes["admin_nodeInfo"] = lambda: w3.geth.admin.nodeInfo()
+            probes["admin_peers"] = lambda: w3.geth.admin.peers()
+            probes["txpool_status"] = lambda: w3.geth.txpool.status()
+            probes["shh_version"] = lambda: w3.geth.shh.version()
+            probes["shh_info"] = lambda: w3.geth.shh.info()
+
+        elif "parity" in client_version:
+            probes["parity_versionInfo"] = lambda: w3.manager.request_blocking(
+                "parity_versionInfo", []
+            )
         #     try:
         #         cprint("nodeInfo: {}".format(w3.parity_lockedHardwareAccountsInfo()), "green")
         #     except Exception as e:
@@ -277,55 +686,88 @@ class Investigate:
         #     except Exception as e:
         #         cprint("shh.info: {}".format(e), "yellow")
 
+        results += run_probes(probes, timeout, budget_end, len(probes))
+        print_probe_summary(results, started)
+        return 0
+
     @command("sign")
     # @argument("all", description="Show me all the details", aliases=["A"])
     # @argument("intrusive", description="Be intrusive, try to make new accounts, etc", aliases=["i"])
+    @argument(
+        "timeout", description="Seconds to wait for each probe", aliases=["t"],
+    )
+    @argument("budget", description="Seconds to wait for all the probes")
+    @argument("concurrency", description="Number of probes at once")
     def investigate_sign(
-        self, msg: str = "Legions Test", account: str = None, intrusive: bool = True
+        self,
+        msg: str = "Legions Test",
+        account: str = None,
+        intrusive: bool = True,
+        timeout: int = 5,
+        budget: int = 30,
+        concurrency: int = 16,
     ):
         """
         Investigate signature functionalities 
         """
-        if w3.isConnected():
-            coinbase = None
-            try:
-                coinbase = w3.eth.coinbase
-            except Exception as e:
-                cprint("Coinbase not available: {}".format(e), "red")
-            accounts = w3.eth.accounts
+        started = time.monotonic()
+        budget_end = started + budget
+        results = []
+        if account is None:
+            results = run_probes(
+                {"eth_accounts": lambda: w3.eth.accounts},
+                timeout,
+                budget_end,
+                formats={"eth_accounts": lambda a: "{} accounts".format(len(a))},
+            )
+            accounts = probe_value(results, "eth_accounts", [])
             if len(accounts) == 0:
                 cprint("No accounts found", "red")
-                if (
-                    type(coinbase) is None
-                ):  # TODO: check if we need this. If accounts = [] , then there shouldn't be coinbase (?)
-                    cprint("Nothing to do here")
-                    return 0
-
-            if account is None:
-                for account in accounts:
-                    try:
-                        cprint(
-                            'Signing "{}" by "{}" \n=> "{}"'.format(
-                                msg, account, w3.eth.sign(account, text=msg).hex()
-                            ),
-                            "white",
-                        )
-                    except Exception as e:
-                        cprint("failed to sign by {}: ".format(account, e))
-            else:
-                try:
-                    cprint(
-                        'Signing "{}" by "{}" \n=> "{}"'.format(
-                            msg, account, w3.eth.sign(account, text=msg).hex()
-                        ),
-                        "white",
-                    )
-                except Exception as e:
-                    cprint("failed to sign by {}: ".format(account, e))
+        else:
+            accounts = [account]
+
+        probes = {
+            "eth_sign {}".format(account): (
+                lambda account=account: w3.eth.sign(account, text=msg).hex()
+            )
+            for account in accounts
+        }
+        cprint('Signing "{}"'.format(msg), "white")
+        # TODO:
+        # Implement for other types and not just text: Eth.sign(account, data=None, hexstr=None, text=None)
+        # Also for : Eth.signTypedData
+        results += run_probes(probes, timeout, budget_end, concurrency)
+        print_probe_summary(results, started)
+        return 0
+
 
-            # TODO:
-            # Implement for other types and not just text: Eth.sign(account, data=None, hexstr=None, text=None)
-            # Also for : Eth.signTypedData
+def query_chains(chains: list, query, headers: list) -> int:
+    """
+    Run query(w3) on every chain concurrently and print the cells it returns in
+    one table, a row per chain in the order given
+    """
+    from tabulate import tabulate
+
+    started = time.monotonic()
+    rows = {}
+    for chain, cells, error in pool.run(chains, query):
+        if error is not None:
+            message = "{}".format(error) or type(error).__name__
+            # Connection errors carry the whole urllib3 chain, keep the table narrow
+            cells = [None] * len(headers) + [textwrap.shorten(message, 100)]
+        rows[chain] = [pool.label(chain)] + list(cells)
+    cprint(
+        tabulate(
+            [rows[chain] for chain in chains],
+            headers=["Chain"] + headers + ["Error"],
+            tablefmt="pretty",
+            stralign="left",
+        )
+    )
+    cprint(
+        "{} chains in {:.1f}s".format(len(chains), time.monotonic() - started), "white",
+    )
+    return 0
 
 
 @command
@@ -350,7 +792,10 @@ class Query:
         description="(Optional) Block number for the query (default latest)",
         aliases=["b"],
     )
-    def get_balance(self, address: str, block: int = None):  #  -> int:
+    @argument("chains", description=CHAINS_DESCRIPTION)
+    def get_balance(
+        self, address: str, block: int = None, chains: typing.List[str] = None
+    ):  #  -> int:
         """
         Get Balance of an account
         """
@@ -359,14 +804,23 @@ class Query:
             cprint("Missing Argument 'address'?", "red")
             return 0
 
-        if block is None:
-            block = w3.eth.blockNumber
+        if chains:
+
+            def balance(chain_w3):
+                wei = chain_w3.eth.getBalance(
+                    chain_w3.toChecksumAddress(address), block_identifier=block
+                )
+                return [wei, chain_w3.fromWei(wei, "ether")]
+
+            return query_chains(chains, balance, ["Balance (wei)", "Balance (Eth)"])
 
-        address = Web3.toChecksumAddress(address)
+        block = w3.resolve_block(block)
+
+        address = w3.toChecksumAddress(address)
         balance = w3.eth.getBalance(address, block_identifier=block)
         cprint(
             "Balance of {} is : {} wei ({} Eth)".format(
-                address, balance, Web3.fromWei(balance, "ether")
+                address, balance, w3.fromWei(balance, "ether")
             ),
             "green",
         )
@@ -384,8 +838,34 @@ class Query:
         description="(Optional) Block number for the query (default latest)",
         aliases=["b"],
     )
+    @argument(
+        "batchSize", description="Number of slots read per JSON-RPC batch request",
+    )
+    @argument(
+        "output",
+        description="(Optional) Export the slots to this file ('-' for stdout) instead of printing them",
+        aliases=["o"],
+    )
+    @argument(
+        "format",
+        description="Format of the export (ndjson or csv)",
+        choices=EXPORT_FORMATS,
+    )
+    @argument(
+        "resume",
+        description="Resume an interrupted export from its checkpoint file",
+        aliases=["r"],
+    )
     def get_storage(
-        self, address: str, count: int = 10, startFrom: str = "0", block: int = None
+        self,
+        address: str,
+        count: int = 10,
+        startFrom: str = "0",
+        block: int = None,
+        batchSize: int = DEFAULT_BATCH_SIZE,
+        output: str = None,
+        format: str = "ndjson",
+        resume: bool = False,
     ):
         """
         Get the first "count" number of an address. count default = 10
@@ -398,44 +878,108 @@ class Query:
             cprint("Missing Argument 'address'?", "red")
             return 0
 
-        if block is None:
-            block = w3.eth.blockNumber
+        if output is not None:
+            return self._export_storage(
+                w3.toChecksumAddress(address),
+                startFromInt,
+                count,
+                block,
+                batchSize,
+                output,
+                format,
+                resume,
+            )
 
-        cprint("Slot <number>\n = <hex value> (<decimal value>)\n", "cyan")
+        block = w3.resolve_block(block)
 
-        address = Web3.toChecksumAddress(address)
-        for i in range(0, count):
-            hex_text = None
-            # print(Web3.isAddress(Web3.toHex(w3.eth.getStorageAt(address, i))), Web3.toHex(w3.eth.getStorageAt(address, i))) #TODO: detect address
+        cprint("Slot <number>\n = <hex value> (<decimal value>)\n", "cyan")
 
-            try:  # TODO: make this smarter, detect the variable and show proper represantation of it .
-                hex_text = Web3.toText(
-                    w3.eth.getStorageAt(
-                        address, startFromInt + i, block_identifier=block
-                    )
+        address = w3.toChecksumAddress(address)
+        try:
+            # Each slot is read once (in batches) and decoded from the returned bytes
+            for slot, value in w3.iter_storage(
+                address, startFromInt, count, block=block, batch_size=batchSize
+            ):
+                # print(Web3.isAddress(w3.toHex(value)), w3.toHex(value)) #TODO: detect address
+                cprint(
+                    "Slot {0:#032x}\n = {1} ({2})".format(
+                        slot, w3.toHex(value), decodeStorageSlot(value)
+                    ),
+                    "green",
                 )
-            except:
-                try:
-                    hex_text = Web3.toInt(
-                        w3.eth.getStorageAt(
-                            address, startFromInt + i, block_identifier=block
-                        )
-                    )
-                except:
-                    hex_text = None
+        except Exception as e:
+            cprint("Failed to read storage of {}: {}".format(address, e), "yellow")
 
+    def _export_storage(
+        self, address, start, count, block, batch_size, output, fmt, resume
+    ):
+        """
+        Stream (slot, hex, decoded) records of the storage range to output, one
+        batch at a time, checkpointing after every flushed batch
+        """
+        end = start + count
+        checkpoint = None if output == "-" else Checkpoint(output)
+        state = checkpoint.load() if (checkpoint and resume) else None
+        offset = None
+
+        if state is not None:
+            if (state["address"], state["end"], state["format"]) != (
+                address,
+                end,
+                fmt,
+            ):
+                cprint(
+                    "Checkpoint {} belongs to another export, not resuming".format(
+                        checkpoint.path
+                    ),
+                    "red",
+                )
+                return 0
+            start, block, offset = state["next"], state["block"], state["offset"]
             cprint(
-                "Slot {0:#032x}\n = {1} ({2})".format(
-                    startFromInt + i,
-                    Web3.toHex(
-                        w3.eth.getStorageAt(
-                            address, startFromInt + i, block_identifier=block
+                "Resuming from slot {0:#x} at block {1}".format(start, block), "yellow"
+            )
+        else:
+            block = w3.resolve_block(block)
+
+        writer = open_writer(output, fmt, ["slot", "hex", "decoded"], offset=offset)
+        try:
+            for slot, value in w3.iter_storage(
+                address, start, end - start, block=block, batch_size=batch_size
+            ):
+                writer.write(
+                    {
+                        "slot": hex(slot),
+                        "hex": w3.toHex(value),
+                        "decoded": decodeStorageSlot(value),
+                    }
+                )
+                if (slot + 1 - start) % batch_size == 0 or slot + 1 == end:
+                    writer.flush()
+                    if checkpoint is not None:
+                        checkpoint.save(
+                            address=address,
+                            block=block,
+                            end=end,
+                            format=fmt,
+                            next=slot + 1,
+                            offset=writer.tell(),
                         )
-                    ),
-                    hex_text,
+        except Exception as e:
+            cprint(
+                "Export of {} interrupted: {} (use resume to continue)".format(
+                    address, e
                 ),
-                "green",
+                "yellow",
+                file=sys.stderr,
             )
+            return 0
+        finally:
+            writer.close()
+
+        if checkpoint is not None:
+            checkpoint.clear()
+            cprint("Exported {} slots to {}".format(count, output), "green")
 
     @command("code")
     @argument("address", description="Address of the account", aliases=["a"])
@@ -444,7 +988,10 @@ class Query:
         description="(Optional) Block number for the query (default latest)",
         aliases=["b"],
     )
-    def get_code(self, address: str, block: int = None):
+    @argument("chains", description=CHAINS_DESCRIPTION)
+    def get_code(
+        self, address: str, block: int = None, chains: typing.List[str] = None
+    ):
         """
         Get code of the smart contract at address
         """
@@ -453,17 +1000,60 @@ class Query:
             cprint("Missing Argument 'address'?", "red")
             return 0
 
-        if block is None:
-            block = w3.eth.blockNumber
+        if chains:
+
+            def code(chain_w3):
+                code = chain_w3.eth.getCode(
+                    chain_w3.toChecksumAddress(address), block_identifier=block
+                )
+                return [len(code), chain_w3.keccak(code).hex() if code else None]
+
+            return query_chains(chains, code, ["Code size", "Code hash"])
+
+        block = w3.resolve_block(block)
 
-        address = Web3.toChecksumAddress(address)
+        address = w3.toChecksumAddress(address)
         cprint(
             "Code of {} = \n {}".format(
-                address, Web3.toHex(w3.eth.getCode(address, block_identifier=block))
+                address, w3.toHex(w3.eth.getCode(address, block_identifier=block))
             ),
             "yellow",
         )
 
+    @command("nonce")
+    @argument("address", description="Address of the account", aliases=["a"])
+    @argument(
+        "block",
+        description="(Optional) Block number for the query (default latest)",
+        aliases=["b"],
+    )
+    @argument("chains", description=CHAINS_DESCRIPTION)
+    def get_nonce(
+        self, address: str, block: int = None, chains: typing.List[str] = None
+    ):
+        """
+        Get the number of transactions sent from an account
+        """
+        if chains:
+            return query_chains(
+                chains,
+                lambda chain_w3: [
+                    chain_w3.eth.getTransactionCount(
+                        chain_w3.toChecksumAddress(address), block_identifier=block
+                    )
+                ],
+                ["Nonce"],
+            )
+
+        block = w3.resolve_block(block)
+        address = w3.toChecksumAddress(address)
+        cprint(
+            "Nonce of {} is : {}".format(
+                address, w3.eth.getTransactionCount(address, block_identifier=block)
+            ),
+            "green",
+        )
+
     @command("block")
     @argument("block", description="Block number (default latest)", aliases=["b"])
     def get_block(self, block: int = None):
@@ -471,8 +1061,7 @@ class Query:
         Get block details by block number
         """
 
-        if block is None:
-            block = w3.eth.blockNumber
+        block = w3.resolve_block(block)
 
         cprint(
             "block {} details = \n {}".format(
@@ -481,6 +1070,388 @@ class Query:
             "yellow",
         )  # TODO: make this print pretty json
 
+    @command("blocks")
+    @argument("start", name="from", description="First block of the range")
+    @argument("end", name="to", description="Last block of the range (default latest)")
+    @argument(
+        "mode",
+        description="header (no transactions), hashes (transaction hashes) or full (transactions)",
+        choices=BLOCK_MODES,
+    )
+    @argument("concurrency", description="Number of batches fetched at once")
+    @argument("batchSize", description="Number of blocks per JSON-RPC batch request")
+    @argument(
+        "output",
+        description="(Optional) Write the blocks to this file (default stdout)",
+        aliases=["o"],
+    )
+    @argument(
+        "format",
+        description="Format of the export (ndjson or csv)",
+        choices=EXPORT_FORMATS,
+    )
+    def get_blocks(
+        self,
+        start: int,
+        end: int = None,
+        mode: str = "hashes",
+        concurrency: int = 4,
+        batchSize: int = 20,
+        output: str = "-",
+        format: str = "ndjson",
+    ):
+        """
+        Stream a range of blocks in order, fetched concurrently in batches
+        """
+        end = w3.resolve_block(end)
+        if end < start:
+            cprint("Empty range {} - {}".format(start, end), "red")
+            return 0
+
+        writer = open_writer(output, format, BLOCK_CSV_FIELDS)
+        started = time.monotonic()
+        fetched = 0
+        try:
+            for block in w3.iter_blocks(
+                start, end, mode=mode, batch_size=batchSize, concurrency=concurrency
+            ):
+                if format == "csv":
+                    block = dict(
+                        block, transactionCount=len(block.get("transactions", []))
+                    )
+                writer.write(block)
+                fetched += 1
+        except Exception as e:
+            cprint(
+                "Stopped after {} blocks: {}".format(fetched, e),
+                "yellow",
+                file=sys.stderr,
+            )
+        finally:
+            writer.close()
+
+        elapsed = time.monotonic() - started
+        cprint(
+            "Fetched {} blocks in {:.1f}s ({:.0f} blocks/s)".format(
+                fetched, elapsed, fetched / elapsed if elapsed else 0
+            ),
+            "green",
+            file=sys.stderr,
+        )
+        return 0
+
+    @command("logs")
+    @argument("start", name="from", description="First block of the range")
+    @argument("end", name="to", description="Last block of the range (default latest)")
+    @argument(
+        "address", description="(Optional) Contract address(es) emitting the logs"
+    )
+    @argument(
+        "topics",
+        description="(Optional) Topic filters by position ('*' for any, 'a|b' for either)",
+    )
+    @argument(
+        "event",
+        description="(Optional) Event signature to filter on and decode, e.g. 'Transfer(address indexed from, address indexed to, uint256 value)'",
+    )
+    @argument("chunkSize", description="Blocks per eth_getLogs call to start with")
+    @argument("concurrency", description="Number of eth_getLogs calls at once")
+    @argument(
+        "output",
+        description="(Optional) Write the logs to this file (default stdout)",
+        aliases=["o"],
+    )
+    @argument(
+        "format",
+        description="Format of the export (ndjson or csv)",
+        choices=EXPORT_FORMATS,
+    )
+    def get_logs(
+        self,
+        start: int,
+        end: int = None,
+        address: typing.List[str] = None,
+        topics: typing.List[str] = None,
+        event: str = None,
+        chunkSize: int = DEFAULT_LOG_CHUNK,
+        concurrency: int = 4,
+        output: str = "-",
+        format: str = "ndjson",
+    ):
+        """
+        Stream the event logs of a block range, narrowing the calls the node refuses
+        """
+        try:
+            event = Event(event) if event else None
+        except ValueError as e:
+            cprint("{}".format(e), "red")
+            return 0
+
+        filters = [
+            None if topic in ("", "*") else topic.split("|") if "|" in topic else topic
+            for topic in topics or []
+        ]
+        if event is not None:
+            filters = [event.topic] + filters[1:]
+
+        end = w3.resolve_block(end)
+        writer = open_writer(output, format, LOG_CSV_FIELDS)
+        found = 0
+        try:
+            for log in w3.iter_logs(
+                start,
+                end,
+                address=address,
+                topics=filters,
+                chunk_size=chunkSize,
+                concurrency=concurrency,
+            ):
+                record = {
+                    "blockNumber": int(log["blockNumber"], 16),
+                    "transactionHash": log["transactionHash"],
+                    "logIndex": int(log["logIndex"], 16),
+                    "address": log["address"],
+                    "topics": log["topics"],
+                    "data": log["data"],
+                }
+                if event is not None:
+                    record["event"] = event.name
+                    try:
+                        record["args"] = event.decode(log)
+                    except Exception:
+                        # Same topic, different indexing (e.g. ERC721 Transfer)
+                        record["args"] = None
+                if format == "csv":
+                    record["topics"] = " ".join(record["topics"])
+                    record["args"] = json.dumps(record.get("args"), default=str)
+                writer.write(record)
+                found += 1
+        except Exception as e:
+            cprint(
+                "Stopped after {} logs: {}".format(found, e), "yellow", file=sys.stderr,
+            )
+        finally:
+            writer.close()
+
+        cprint("Found {} logs".format(found), "green", file=sys.stderr)
+        return 0
+
+    @command("balances")
+    @argument(
+        "input",
+        description="File with one address per line, first column of a CSV ('-' for stdin)",
+        aliases=["i"],
+    )
+    @argument(
+        "block",
+        description="(Optional) Block number for the query (default latest)",
+        aliases=["b"],
+    )
+    @argument("batchSize", description="Number of eth_getBalance per batch")
+    @argument("concurrency", description="Number of batches or multicalls at once")
+    @argument(
+        "multicall",
+        description="Read balances through Multicall3 (auto: when it is deployed)",
+        choices=MULTICALL_MODES,
+    )
+    @argument(
+        "output",
+        description="(Optional) Write the balances to this file (default stdout)",
+        aliases=["o"],
+    )
+    @argument(
+        "format",
+        description="Format of the export (ndjson or csv)",
+        choices=EXPORT_FORMATS,
+    )
+    def get_balances(
+        self,
+        input: str = "-",
+        block: int = None,
+        batchSize: int = DEFAULT_BATCH_SIZE,
+        concurrency: int = 4,
+        multicall: str = "auto",
+        output: str = "-",
+        format: str = "csv",
+    ):
+        """
+        Stream the balances of a list of addresses, all read at the same block
+        """
+
+        def addresses():
+            for address in read_column(input):
+                if w3.isAddress(address):
+                    yield w3.toChecksumAddress(address)
+                else:
+                    cprint(
+                        "Skipping invalid address {}".format(address),
+                        "yellow",
+                        file=sys.stderr,
+                    )
+
+        block = w3.resolve_block(block)
+        writer = open_writer(output, format, BALANCE_CSV_FIELDS)
+        started = time.monotonic()
+        fetched = 0
+        try:
+            for address, wei in w3.iter_balances(
+                addresses(),
+                block,
+                batch_size=batchSize,
+                concurrency=concurrency,
+                multicall={"auto": None, "on": True, "off": False}[multicall],
+            ):
+                writer.write(
+                    {
+                        "address": address,
+                        "wei": wei,
+                        "ether": None if wei is None else w3.fromWei(wei, "ether"),
+                    }
+                )
+                fetched += 1
+        except Exception as e:
+            cprint(
+                "Stopped after {} balances: {}".format(fetched, e),
+                "yellow",
+                file=sys.stderr,
+            )
+        finally:
+            writer.close()
+
+        elapsed = time.monotonic() - started
+        cprint(
+            "Fetched {} balances at block {} in {:.1f}s ({:.0f} addresses/s)".format(
+                fetched, block, elapsed, fetched / elapsed if elapsed else 0
+            ),
+            "green",
+            file=sys.stderr,
+        )
+        return 0
+
+    @command("tokens")
+    @argument(
+        "holders",
+        description="Holder addresses, or files listing them ('-' for stdin)",
+        aliases=["a"],
+    )
+    @argument(
+        "tokens",
+        description="ERC-20 token addresses, or files listing them",
+        aliases=["t"],
+    )
+    @argument(
+        "block",
+        description="(Optional) Block number for the query (default latest)",
+        aliases=["b"],
+    )
+    @argument("nonzero", description="Only output the tokens a holder has")
+    @argument("concurrency", description="Number of multicalls at once")
+    @argument(
+        "multicall",
+        description="Aggregate the calls through Multicall3 (auto: when it is deployed)",
+        choices=MULTICALL_MODES,
+    )
+    @argument(
+        "output",
+        description="(Optional) Write the balances to this file (default stdout)",
+        aliases=["o"],
+    )
+    @argument(
+        "format",
+        description="Format of the export (ndjson or csv)",
+        choices=EXPORT_FORMATS,
+    )
+    def get_tokens(
+        self,
+        holders: typing.List[str],
+        tokens: typing.List[str],
+        block: int = None,
+        nonzero: bool = False,
+        concurrency: int = 4,
+        multicall: str = "auto",
+        output: str = "-",
+        format: str = "csv",
+    ):
+        """
+        Get the ERC-20 balances of every holder for every token, all read at the same block
+        """
+
+        def addresses(values):
+            for value in values:
+                if value == "-" or (not w3.isAddress(value) and os.path.isfile(value)):
+                    for address in addresses(read_column(value)):
+                        yield address
+                elif w3.isAddress(value):
+                    yield w3.toChecksumAddress(value)
+                else:
+                    cprint(
+                        "Skipping invalid address {}".format(value),
+                        "yellow",
+                        file=sys.stderr,
+                    )
+
+        tokens = list(addresses(tokens))
+        if not tokens:
+            cprint("No token to query", "red")
+            return 0
+
+        block = w3.resolve_block(block)
+        options = {
+            "concurrency": concurrency,
+            "multicall": {"auto": None, "on": True, "off": False}[multicall],
+        }
+        cache = JSONFileCache(TOKEN_CACHE_FILE)
+        try:
+            metadata = w3.token_metadata(tokens, block, cache=cache, **options)
+        except Exception as e:
+            cprint("Failed to read the tokens: {}".format(e), "red")
+            return 0
+        cache.save()
+
+        writer = open_writer(output, format, TOKEN_CSV_FIELDS)
+        started = time.monotonic()
+        fetched = 0
+        try:
+            for holder, token, balance in w3.iter_token_balances(
+                addresses(holders), tokens, block, **options
+            ):
+                fetched += 1
+                if nonzero and not balance:
+                    continue
+                symbol, decimals = (
+                    metadata[token]["symbol"],
+                    metadata[token]["decimals"],
+                )
+                writer.write(
+                    {
+                        "holder": holder,
+                        "token": token,
+                        "symbol": symbol,
+                        "balance": balance,
+                        "amount": None
+                        if balance is None or decimals is None
+                        else "{:f}".format(Decimal(balance).scaleb(-decimals)),
+                    }
+                )
+        except Exception as e:
+            cprint(
+                "Stopped after {} balances: {}".format(fetched, e),
+                "yellow",
+                file=sys.stderr,
+            )
+        finally:
+            writer.close()
+
+        elapsed = time.monotonic() - started
+        cprint(
+            "Fetched {} token balances at block {} in {:.1f}s ({:.0f} calls/s)".format(
+                fetched, block, elapsed, fetched / elapsed if elapsed else 0
+            ),
+            "green",
+            file=sys.stderr,
+        )
+        return 0
+
     @command("transaction")
     @argument("hash", description="Transaction hash to query", aliases=["t"])
     @argument(
@@ -497,9 +1468,6 @@ class Query:
             cprint("Missing Argument 'hash'?", "red")
             return 0
 
-        if block is None:
-            block = w3.eth.blockNumber
-
         cprint(
             "transaction {} details = \n {}".format(
                 hash, (w3.eth.getTransaction(hash))
@@ -515,7 +1483,7 @@ class Query:
         description="(Optional) Block number for the query (default latest)",
         aliases=["b"],
     )
-    def get_transaction(self, method: str, args: str = None, block: int = None):
+    def get_command(self, method: str, args: str = None, block: int = None):
         """
         Manual RPC method with args
         """
@@ -524,8 +1492,7 @@ class Query:
             cprint("Missing Argument 'method'?", "red")
             return 0
 
-        if block is None:
-            block = w3.eth.blockNumber
+        block = w3.resolve_block(block)
 
         try:
             cprint(
@@ -540,13 +1507,56 @@ class Query:
             cprint("failed {}({}) :  {} \n".format(method, args, e), "yellow")
 
     @command("ecrecover")
-    @argument("data", description="The data which hash was signed")
+    @argument(
+        "data",
+        description="The data which hash was signed (hex if it starts with 0x, text otherwise)",
+    )
     @argument("dataHash", description="The hash of the data")
     @argument("signedData", description="Signed data")
-    def get_ecrecover(self, signedData: str, data: str = None, dataHash: str = None):
+    @argument(
+        "input",
+        description="Recover every (data or hash, signature) row of this CSV file ('-' for stdin)",
+        aliases=["i"],
+    )
+    @argument(
+        "hashed",
+        description="The first column of the input is the hash, not the signed data",
+    )
+    @argument("processes", description="Worker processes (default one per core)")
+    @argument(
+        "output",
+        description="(Optional) Write the addresses to this file (default stdout)",
+        aliases=["o"],
+    )
+    @argument(
+        "format",
+        description="Format of the export (ndjson or csv)",
+        choices=EXPORT_FORMATS,
+    )
+    def get_ecrecover(
+        self,
+        signedData: str = None,
+        data: str = None,
+        dataHash: str = None,
+        input: str = None,
+        hashed: bool = False,
+        processes: int = None,
+        output: str = "-",
+        format: str = "csv",
+    ):
         """
-        Get address associated with the signature (ecrecover)
+        Get address associated with the signature (ecrecover), or of every signature of a file
         """
+        from web3 import Web3
+
+        from legions.utils.signatures import message_hash, recover
+
+        if input is not None:
+            return self._bulk_ecrecover(input, hashed, processes, output, format)
+
+        if signedData is None:
+            cprint("Missing Argument 'signedData' (or 'input')?", "red")
+            return 0
         if (data is None) and (dataHash is None):
             cprint(
                 "Missing Argument, either 'dataHash' or 'data' must be passed?", "red"
@@ -554,32 +1564,75 @@ class Query:
             return 0
 
         try:
-            if data is not None:
-                from eth_account.messages import encode_defunct, _hash_eip191_message
+            # data is hashed with the "\x19Ethereum Signed Message:\n" prefix
+            # (eth_sign, personal_sign), v may be 0/1, 27/28 or EIP-155
+            digest = message_hash(data=data, data_hash=dataHash)
+            address = recover(digest, signedData)
 
-                hex_message_hash = w3.toHex(
-                    _hash_eip191_message(encode_defunct(hexstr=data))
-                )
-            elif dataHash is not None:
-                hex_message_hash = dataHash
-
-            sig = w3.toBytes(hexstr=signedData)
+            sig = Web3.toBytes(hexstr=signedData)
             v, hex_r, hex_s = (
-                w3.toInt(sig[-1]),
-                w3.toHex(sig[:32]),
-                w3.toHex(sig[32:64]),
+                Web3.toInt(sig[-1]),
+                Web3.toHex(sig[:32]),
+                Web3.toHex(sig[32:64]),
             )
-            address = w3.eth.account.recoverHash(hex_message_hash, signature=sig)
-            # TODO: verify this! seems that sometimes it returns wrong address
-            # test with :
-            #           data="0xd46e8dd67c5d32be8d46e8dd67c5d32be8058bb8eb970870f072445675058bb8eb970870f072445675"
-            #           signedData="0xe7225f986f192f859a9bf84e34b2b7001dfa11aeb5c7164f81a2bee0d79943e2587be1faa11502eba0f803bb0ee071a082b6fe40fba025f3309263a1eef52c711c"
-            #       Correct address: 0xb60e8dd61c5d32be8058bb8eb970870f07233155  //based on https://wiki.parity.io/JSONRPC-personal-module.html#personal_ecrecover
-            #       Returned address: 0x02F0D4b967a73D6907a221DB6106446F1d3d4CDB
-
             cprint(
                 "Address: {}".format(address), "green"
             )  # TODO: make this print pretty json
             cprint("r: {}\ns: {}\nv: {} ".format(hex_r, hex_s, v), "white")
+            cprint("hash: {}".format(Web3.toHex(digest)), "white")
         except Exception as e:
             cprint("failed to get address: {} \n".format(e), "yellow")
+
+    def _bulk_ecrecover(
+        self, input: str, hashed: bool, processes: int, output: str, format: str
+    ):
+        from legions.utils.signatures import recover_many
+
+        rows = collections.deque()
+
+        def signatures():
+            for row in read_rows(input):
+                rows.append(row)
+                yield row if len(row) > 1 else (row[0], "")
+
+        writer = open_writer(output, format, ECRECOVER_CSV_FIELDS)
+        started = time.monotonic()
+        recovered = failed = 0
+        try:
+            for address, error in recover_many(
+                signatures(), hashed=hashed, processes=processes
+            ):
+                row = rows.popleft()
+                writer.write(
+                    {
+                        "message": row[0],
+                        "signature": row[1] if len(row) > 1 else None,
+                        "address": address,
+                        "error": error,
+                    }
+                )
+                if error is None:
+                    recovered += 1
+                else:
+                    failed += 1
+        except Exception as e:
+            cprint(
+                "Stopped after {} signatures: {}".format(recovered + failed, e),
+                "yellow",
+                file=sys.stderr,
+            )
+        finally:
+            writer.close()
+
+        elapsed = time.monotonic() - started
+        cprint(
+            "Recovered {} addresses ({} failed) in {:.1f}s ({:.0f} signatures/s)".format(
+                recovered,
+                failed,
+                elapsed,
+                (recovered + failed) / elapsed if elapsed else 0,
+            ),
+            "green",
+            file=sys.stderr,
+        )
+        return 0
@@ -1,11 +1,7 @@
-from ens import ENS as _ens
-from web3 import Web3
 from termcolor import cprint
 from nubia import command, argument
 from legions.commands.commands import w3
-import requests
 import json
-from tabulate import tabulate
 from datetime import datetime
 
 
@@ -14,8 +10,9 @@ class ens:
     "Ethereum Name Service Tools"
 
     def __init__(self) -> None:
+        from ens import ENS as _ens
+
         self.ns = _ens.fromWeb3(w3)
-        pass
 
     @command("toName")
     @argument("address", description="reverse lookup name resolved from an address")
@@ -112,8 +109,11 @@ class ens:
                 __typename  }}",
         }
 
+        from tabulate import tabulate
+        from legions.network import transport
+
         try:
-            response = requests.post(
+            response = transport.post(
                 "https://api.thegraph.com/subgraphs/name/ensdomains/ens", json=data
             )
             if response.status_code != 200:
@@ -205,8 +205,11 @@ class ens:
                 }}",
         }
 
+        from tabulate import tabulate
+        from legions.network import transport
+
         try:
-            response = requests.post(
+            response = transport.post(
                 "https://api.thegraph.com/subgraphs/name/ensdomains/ens", json=data
             )
             if response.status_code != 200:
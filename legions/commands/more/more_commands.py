@@ -1,9 +1,6 @@
 # Legion - Shayan Eskandari, ConsenSys Diligence
 
 from nubia import command, argument
-from web3 import Web3
-
-w3 = Web3()
 from termcolor import cprint
 
 
@@ -22,8 +19,10 @@ class Conversions:
         """
         Converts the input text to Hex
         """
+        from web3 import Web3
+
         try:
-            cprint("Hex of {}: {}".format(value, w3.toHex(text=value)), "green")
+            cprint("Hex of {}: {}".format(value, Web3.toHex(text=value)), "green")
         except Exception as e:
             cprint("Failed to convert {}: {} ".format(value, e), "yellow")
 
@@ -33,8 +32,10 @@ class Conversions:
         """
         Converts the input Hex to Text
         """
+        from web3 import Web3
+
         try:
-            cprint("Text of {}: {}".format(value, w3.toText(value)), "green")
+            cprint("Text of {}: {}".format(value, Web3.toText(value)), "green")
         except Exception as e:
             cprint("Failed to convert {}: {} ".format(value, e), "yellow")
 
@@ -44,8 +45,10 @@ class Conversions:
         """
         Converts the input to Bytes
         """
+        from web3 import Web3
+
         try:
-            cprint("Bytes of {}: {}".format(value, w3.toBytes(text=value)), "green")
+            cprint("Bytes of {}: {}".format(value, Web3.toBytes(text=value)), "green")
         except Exception as e:
             cprint("Failed to convert {}: {} ".format(value, e), "yellow")
 
@@ -56,8 +59,10 @@ class Conversions:
         """
         Converts the input to Wei 
         """
+        from web3 import Web3
+
         try:
-            cprint("toWei {}: {}".format(value, w3.toWei(value, currency)), "green")
+            cprint("toWei {}: {}".format(value, Web3.toWei(value, currency)), "green")
         except Exception as e:
             cprint(
                 "Failed to convert {} to {}: {}".format(value, currency, e), "yellow"
@@ -70,10 +75,12 @@ class Conversions:
         """
         Converts the input to ether (or specified currency)
         """
+        from web3 import Web3
+
         try:
             cprint(
                 "fromWei {} to {}: {:18f}".format(
-                    value, currency, w3.fromWei(value, currency)
+                    value, currency, Web3.fromWei(value, currency)
                 ),
                 "green",
             )
@@ -88,10 +95,12 @@ class Conversions:
         """
         Converts the input to Checksum Address
         """
+        from web3 import Web3
+
         try:
             cprint(
                 "toChecksumAddress of {}: {}".format(
-                    value, w3.toChecksumAddress(value)
+                    value, Web3.toChecksumAddress(value)
                 ),
                 "green",
             )
@@ -104,10 +113,12 @@ class Conversions:
         """
         keccak hash of the input
         """
+        from web3 import Web3
+
         # TODO: support hex_str too
         try:
             cprint(
-                "keccak of {}: {}".format(value, w3.toHex(w3.keccak(text=value))),
+                "keccak of {}: {}".format(value, Web3.toHex(Web3.keccak(text=value))),
                 "green",
             )
         except Exception as e:
@@ -1,13 +1,26 @@
+import hashlib
 import json
+import os
+import sys
+import threading
+import time
 import typing
+from concurrent import futures
 from legions.commands.commands import w3, INFURA_URL, PEER_SAMPLE
+from legions.utils.cache import CACHE_DIR, JSONFileCache
+from legions.utils.concurrency import run_concurrently
+from legions.utils.export import open_writer
+from legions.utils.helper_functions import lazy_import
 from nubia import command, argument
-from teatime.scanner import Scanner
-from teatime.plugins.context import NodeType
-from teatime.plugins.eth1 import *
+from teatime.plugins import Plugin
+from teatime.plugins.context import Context, NodeType
+from teatime.reporting import Issue, Report, Severity
 from termcolor import cprint
 from urllib.parse import urlparse
 
+# The plugin classes are only imported once a scan instantiates them
+eth1 = lazy_import("teatime.plugins.eth1")
+
 # TODO: Currently no information about severity levels and if intrusive.
 
 # Contains plugins supported by all clients.
@@ -58,6 +71,154 @@ SUPPORTED_BY = {
     + SUPPORTED_BY_ALL_CLIENTS,
 }
 
+# Plugins changing the node in a way that can break other probes (stopping the
+# RPC interface, dropping peers, upgrading the client). They run one at a time,
+# after every other plugin.
+DISRUPTIVE_PLUGINS = [
+    "eth1/GethStopRPC",
+    "eth1/GethStopWebsocket",
+    "eth1/ParityDropPeers",
+    "eth1/ParityUpgrade",
+]
+
+# Read-only RPC methods whose answers can be shared by all plugins of a scan
+MEMOIZABLE_METHODS = [
+    "web3_clientVersion",
+    "web3_sha3",
+    "net_listening",
+    "net_peerCount",
+    "eth_accounts",
+    "eth_blockNumber",
+    "eth_hashrate",
+    "eth_mining",
+    "eth_syncing",
+    "admin_datadir",
+    "admin_nodeInfo",
+    "admin_peers",
+    "txpool_content",
+    "txpool_inspect",
+    "txpool_status",
+    "parity_devLogs",
+    "parity_netPeers",
+    "parity_pendingTransactions",
+    "parity_pendingTransactionsStats",
+    "parity_upgradeReady",
+]
+
+
+class RPCMemo:
+    """
+    Per-scan memo in front of teatime's Plugin.get_rpc_json, sending identical
+    read-only requests of different plugins to the node only once
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.requests = 0
+        self.hits = 0
+
+    @staticmethod
+    def _key(target, method, params) -> tuple:
+        return (target, method, json.dumps(params or []))
+
+    def seed(self, target: str, method: str, params: list, result) -> None:
+        """
+        Store a result fetched outside of the scan (e.g. the clientVersion)
+        """
+        future = futures.Future()
+        future.set_result(result)
+        self._calls[self._key(target, method, params)] = future
+
+    def get_rpc_json(self, target: str, method: str, params=None, idx: int = 0):
+        if method not in MEMOIZABLE_METHODS:
+            with self._lock:
+                self.requests += 1
+            return Plugin.get_rpc_json(target, method, params, idx)
+
+        key = self._key(target, method, params)
+        with self._lock:
+            self.requests += 1
+            future = self._calls.get(key)
+            owner = future is None
+            if owner:
+                future = self._calls[key] = futures.Future()
+            else:
+                self.hits += 1
+
+        # Concurrent plugins asking for the same call wait for the first one
+        if owner:
+            try:
+                future.set_result(Plugin.get_rpc_json(target, method, params, idx))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def attach(self, plugin: Plugin) -> None:
+        # Intrusive plugins change the node and check the effect, they must not
+        # be served answers from before the change
+        if not plugin.INTRUSIVE:
+            plugin.get_rpc_json = self.get_rpc_json
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.requests, 3) if self.requests else 0,
+        }
+
+
+# Findings of previous scans, reused by incremental scans
+SCAN_CACHE_FILE = os.path.join(CACHE_DIR, "scan_cache.json")
+
+# Seconds a cached plugin result stays valid, unless overridden in scan.cache_ttl
+CACHE_TTL = 24 * 60 * 60
+
+
+def detect_node_type(client_version: str) -> NodeType:
+    """
+    NodeType of a node from its web3_clientVersion, None if unsupported
+    """
+    if "geth" in client_version.lower():
+        return NodeType.GETH
+    elif "parity" in client_version.lower():
+        return NodeType.PARITY
+    return None
+
+
+def parse_target(node_uri: str) -> tuple:
+    """
+    Break a node URI in prefix, host and port as expected by teatime
+    """
+    url = urlparse(node_uri)
+    prefix = url.scheme + "://"
+
+    if ":" in url.netloc:
+        end = url.netloc.index(":")  # Exclude port information
+        host = url.netloc[:end] + url.path
+    else:
+        host = url.netloc + url.path
+
+    if url.port is None:
+        port = 8545  # Default port
+    else:
+        port = url.port
+
+    return prefix, host, port
+
+
+def read_inventory(path: str) -> list:
+    """
+    Node endpoints listed in an inventory file, one per line (# for comments)
+    """
+    endpoints = []
+    with open(path, "r") as f:
+        for line in f:
+            endpoint = line.split("#", 1)[0].strip()
+            if endpoint and endpoint not in endpoints:
+                endpoints.append(endpoint)
+    return endpoints
+
 
 @command
 class scan:
@@ -131,119 +292,299 @@ class scan:
     # plugin_instantiator is a dict mapping plugin names to a function
     # instantiating and returning them.
     plugin_instantiator = {
-        "eth1/AccountCreation": lambda arg=password: AccountCreation(test_password=arg),
-        "eth1/TxPoolContent": lambda: TxPoolContent(),
-        "eth1/HashrateStatus": lambda arg=hash_rate: HashrateStatus(
+        "eth1/AccountCreation": lambda arg=password: eth1.AccountCreation(
+            test_password=arg
+        ),
+        "eth1/TxPoolContent": lambda: eth1.TxPoolContent(),
+        "eth1/HashrateStatus": lambda arg=hash_rate: eth1.HashrateStatus(
             expected_hashrate=arg
         ),
-        "eth1/NetworkListening": lambda: NetworkListening(),
-        "eth1/NodeSync": lambda arg1=infura_url, arg2=block_threshold: NodeSync(
+        "eth1/NetworkListening": lambda: eth1.NetworkListening(),
+        "eth1/NodeSync": lambda arg1=infura_url, arg2=block_threshold: eth1.NodeSync(
             infura_url=arg1, block_threshold=arg2
         ),
-        "eth1/SHA3Consistency": lambda arg1=test_input, arg2=test_output: SHA3Consistency(
+        "eth1/SHA3Consistency": lambda arg1=test_input, arg2=test_output: eth1.SHA3Consistency(
             test_input=arg1, test_output=arg2
         ),
-        "eth1/OpenAccounts": lambda arg=infura_url: OpenAccounts(infura_url=arg),
-        "eth1/AccountUnlock": lambda arg1=infura_url, arg2=wordlist, arg3=skip_below: AccountUnlock(
+        "eth1/OpenAccounts": lambda arg=infura_url: eth1.OpenAccounts(infura_url=arg),
+        "eth1/AccountUnlock": lambda arg1=infura_url, arg2=wordlist, arg3=skip_below: eth1.AccountUnlock(
             infura_url=arg1, wordlist=arg2, skip_below=arg3
         ),
-        "eth1/NodeVersion": lambda: NodeVersion(),
-        "eth1/PeerlistLeak": lambda: PeerlistLeak(),
-        "eth1/MiningStatus": lambda arg=should_mine: MiningStatus(should_mine=arg),
-        "eth1/PeerCountStatus": lambda arg=minimum_peercount: PeerCountStatus(
+        "eth1/NodeVersion": lambda: eth1.NodeVersion(),
+        "eth1/PeerlistLeak": lambda: eth1.PeerlistLeak(),
+        "eth1/MiningStatus": lambda arg=should_mine: eth1.MiningStatus(should_mine=arg),
+        "eth1/PeerCountStatus": lambda arg=minimum_peercount: eth1.PeerCountStatus(
             minimum_peercount=arg
         ),
-        "eth1/PeerlistManipulation": lambda arg=test_enode: PeerlistManipulation(
+        "eth1/PeerlistManipulation": lambda arg=test_enode: eth1.PeerlistManipulation(
             test_enode=arg
         ),
         # Geth
-        "eth1/GethNodeInfo": lambda: GethNodeInfo(),
-        "eth1/GethAccountImport": lambda arg1=keydata, arg2=password: GethAccountImport(
+        "eth1/GethNodeInfo": lambda: eth1.GethNodeInfo(),
+        "eth1/GethAccountImport": lambda arg1=keydata, arg2=password: eth1.GethAccountImport(
             keydata=arg1, password=arg2
         ),
-        "eth1/GethStartWebsocket": lambda: GethStartWebsocket(),
-        "eth1/GethStopWebsocket": lambda: GethStopWebsocket(),
-        "eth1/GethTxPoolInspection": lambda: GethTxPoolInspection(),
-        "eth1/GethTxPoolStatus": lambda: GethTxPoolStatus(),
-        "eth1/GethStartRPC": lambda: GethStartRPC(),
-        "eth1/GethStopRPC": lambda: GethStopRPC(),
-        "eth1/GethDatadir": lambda: GethDatadir(),
+        "eth1/GethStartWebsocket": lambda: eth1.GethStartWebsocket(),
+        "eth1/GethStopWebsocket": lambda: eth1.GethStopWebsocket(),
+        "eth1/GethTxPoolInspection": lambda: eth1.GethTxPoolInspection(),
+        "eth1/GethTxPoolStatus": lambda: eth1.GethTxPoolStatus(),
+        "eth1/GethStartRPC": lambda: eth1.GethStartRPC(),
+        "eth1/GethStopRPC": lambda: eth1.GethStopRPC(),
+        "eth1/GethDatadir": lambda: eth1.GethDatadir(),
         # Parity
-        "eth1/ParityGasCeiling": lambda arg=gas_target: ParityGasCeiling(
+        "eth1/ParityGasCeiling": lambda arg=gas_target: eth1.ParityGasCeiling(
             gas_target=arg
         ),
-        "eth1/ParityDevLogs": lambda: ParityDevLogs(),
-        "eth1/ParityGasFloor": lambda arg=gas_floor: ParityGasFloor(gas_floor=arg),
-        "eth1/ParityUpgrade": lambda: ParityUpgrade(),
-        "eth1/ParityTxPoolStatistics": lambda: ParityTxPoolStatistics(),
-        "eth1/ParityTxCeiling": lambda arg=gas_limit: ParityTxCeiling(gas_limit=arg),
-        "eth1/ParityMinGasPrice": lambda arg=gas_price: ParityMinGasPrice(
+        "eth1/ParityDevLogs": lambda: eth1.ParityDevLogs(),
+        "eth1/ParityGasFloor": lambda arg=gas_floor: eth1.ParityGasFloor(gas_floor=arg),
+        "eth1/ParityUpgrade": lambda: eth1.ParityUpgrade(),
+        "eth1/ParityTxPoolStatistics": lambda: eth1.ParityTxPoolStatistics(),
+        "eth1/ParityTxCeiling": lambda arg=gas_limit: eth1.ParityTxCeiling(
+            gas_limit=arg
+        ),
+        "eth1/ParityMinGasPrice": lambda arg=gas_price: eth1.ParityMinGasPrice(
             gas_price=arg
         ),
-        "eth1/ParitySyncMode": lambda arg=mode: ParitySyncMode(mode=arg),
-        "eth1/ParityChangeCoinbase": lambda arg=author: ParityChangeCoinbase(
+        "eth1/ParitySyncMode": lambda arg=mode: eth1.ParitySyncMode(mode=arg),
+        "eth1/ParityChangeCoinbase": lambda arg=author: eth1.ParityChangeCoinbase(
             author=arg
         ),
-        "eth1/ParityChangeTarget": lambda arg=target_chain: ParityChangeTarget(
+        "eth1/ParityChangeTarget": lambda arg=target_chain: eth1.ParityChangeTarget(
             target_chain=arg
         ),
-        "eth1/ParityChangeExtra": lambda arg=extra_data: ParityChangeExtra(
+        "eth1/ParityChangeExtra": lambda arg=extra_data: eth1.ParityChangeExtra(
             extra_data=arg
         ),
-        "eth1/ParityDropPeers": lambda: ParityDropPeers(),
+        "eth1/ParityDropPeers": lambda: eth1.ParityDropPeers(),
     }
 
     # Contains plugin names added with the `add` command.
     added_plugins = set()
 
+    # Per plugin TTL (seconds) of the cached results used by incremental scans.
+    # Plugins probing fast changing state are rechecked more often.
+    cache_ttl = {
+        "eth1/NodeSync": 10 * 60,
+        "eth1/PeerCountStatus": 60 * 60,
+        "eth1/MiningStatus": 60 * 60,
+        "eth1/HashrateStatus": 60 * 60,
+        "eth1/TxPoolContent": 60 * 60,
+        "eth1/GethTxPoolInspection": 60 * 60,
+        "eth1/GethTxPoolStatus": 60 * 60,
+        "eth1/ParityTxPoolStatistics": 60 * 60,
+    }
+
     def __init__(self) -> None:
-        # Set node_type.
-        if "geth" in w3.clientVersion.lower():
-            self.node_type = NodeType.GETH
-        elif "parity" in w3.clientVersion.lower():
-            self.node_type = NodeType.PARITY
-        else:
+        # Set node_type. Without a supported node only fleet scans are possible.
+        try:
+            self.client_version = w3.clientVersion
+            self.node_type = detect_node_type(self.client_version)
+        except Exception:
+            self.client_version = None
+            self.node_type = None
+        if self.node_type is None:
             cprint("Unsupported node type", "red")
 
         # Break w3.node_uri in prefix, host and port as expected by teatime.
-        url = urlparse(w3.node_uri)
-        self.prefix = url.scheme + "://"
-
-        if ":" in url.netloc:
-            end = url.netloc.index(":")  # Exclude port information
-            self.host = url.netloc[:end] + url.path
-        else:
-            self.host = url.netloc + url.path
-
-        if url.port is None:
-            self.port = 8545  # Default port
-        else:
-            self.port = url.port
+        self.prefix, self.host, self.port = parse_target(w3.node_uri)
 
     @command("execute")
-    def execute(self) -> str:
+    @argument("concurrency", description="Number of non-intrusive plugins run at once")
+    @argument(
+        "incremental",
+        description="Reuse cached findings of plugins whose cache entry has not expired",
+    )
+    @argument(
+        "output",
+        description="(Optional) Stream NDJSON events, one per finished plugin, to this file ('-' for stdout)",
+        aliases=["o"],
+    )
+    def execute(
+        self, concurrency: int = 8, incremental: bool = False, output: str = None
+    ) -> str:
         """
         Execute RPC scanner
         """
         if not self.added_plugins:
             cprint("No plugins selected", "red")
             return
+        if self.node_type is None:
+            cprint("Unsupported node type", "red")
+            return
 
-        # Create a list containing the instantiated plugins.
-        instantiated_plugins = [
-            self.plugin_instantiator[p]() for p in self.added_plugins
-        ]
-
-        # Run a new scanner.
-        report = Scanner(
-            self.host, self.port, self.node_type, instantiated_plugins, self.prefix
-        ).run()
+        writer, on_plugin = None, None
+        if output is not None:
+            writer = open_writer(output, "ndjson", [])
+
+            def on_plugin(name, plugin_report, cached):
+                writer.write(plugin_event(name, plugin_report, cached))
+                writer.flush()
+
+        # Run a new scan.
+        cache = JSONFileCache(SCAN_CACHE_FILE)
+        report = run_scan(
+            self.host,
+            self.port,
+            self.node_type,
+            sorted(self.added_plugins),
+            self.prefix,
+            concurrency=concurrency,
+            client_version=self.client_version,
+            cache=cache,
+            incremental=incremental,
+            on_plugin=on_plugin,
+        )
+        cache.save()
+
+        if writer is not None:
+            writer.write(summary_event(report))
+            writer.close()
+            return
 
         # Print report.
         out = json.dumps(report.to_dict(), indent=2)
         cprint("Scanreport:", "yellow")
         cprint("{}".format(out))
 
+    @command("fleet")
+    @argument(
+        "inventory",
+        description="File listing the node endpoints to scan, one per line",
+        aliases=["i"],
+    )
+    @argument("concurrency", description="Number of hosts scanned at once")
+    @argument(
+        "deadline",
+        description="Seconds after which the scan of a host is abandoned",
+        aliases=["d"],
+    )
+    @argument(
+        "incremental",
+        description="Reuse cached findings of plugins whose cache entry has not expired",
+    )
+    @argument(
+        "output",
+        description="(Optional) Stream NDJSON events, one per finished plugin and host, to this file ('-' for stdout)",
+        aliases=["o"],
+    )
+    def fleet(
+        self,
+        inventory: str,
+        concurrency: int = 8,
+        deadline: int = 120,
+        incremental: bool = False,
+        output: str = None,
+    ) -> None:
+        """
+        Execute RPC scanner against every host of an inventory file
+        """
+        if not self.added_plugins:
+            cprint("No plugins selected", "red")
+            return
+
+        try:
+            endpoints = read_inventory(inventory)
+        except OSError as e:
+            cprint("Failed to read inventory {}: {}".format(inventory, e), "red")
+            return
+
+        # Set once a host is done with or abandoned: its scan stops before the
+        # next plugin and whatever it still finds is dropped
+        cancelled = {endpoint: threading.Event() for endpoint in endpoints}
+        lock = threading.Lock()
+        writer = None
+        if output is not None:
+            writer = open_writer(output, "ndjson", [])
+
+        def emit(event, endpoint=None):
+            # Hosts are scanned (and report) from several threads
+            with lock:
+                if endpoint is not None and cancelled[endpoint].is_set():
+                    return
+                writer.write(event)
+                writer.flush()
+
+        def abandon(endpoint, event=None):
+            with lock:
+                cancelled[endpoint].set()
+                if event is not None:
+                    writer.write(event)
+                    writer.flush()
+
+        def reporter(endpoint):
+            if writer is None:
+                return None
+            return lambda name, plugin_report, cached: emit(
+                plugin_event(name, plugin_report, cached), endpoint
+            )
+
+        plugins = sorted(self.added_plugins)
+        cache = JSONFileCache(SCAN_CACHE_FILE)
+        tasks = {
+            endpoint: (
+                lambda endpoint=endpoint: scan_host(
+                    endpoint,
+                    plugins,
+                    timeout=min(10, deadline),
+                    cache=cache,
+                    incremental=incremental,
+                    on_plugin=reporter(endpoint),
+                    cancelled=cancelled[endpoint],
+                )
+            )
+            for endpoint in endpoints
+        }
+
+        failed = 0
+        for endpoint, result, error in run_concurrently(
+            tasks, max_workers=concurrency, timeout=deadline
+        ):
+            if error is not None:
+                failed += 1
+                if writer is not None:
+                    abandon(
+                        endpoint,
+                        {"event": "error", "host": endpoint, "error": str(error)},
+                    )
+                else:
+                    abandon(endpoint)
+                    cprint("Failed to scan {}: {}".format(endpoint, error), "red")
+            elif writer is not None:
+                event = summary_event(result.pop("report"))
+                event.update(result, host=endpoint)
+                emit(event)
+            else:
+                result["report"] = result["report"].to_dict()
+                cprint("Scanreport for {}:".format(endpoint), "yellow")
+                cprint("{}".format(json.dumps(result, indent=2)))
+
+        # Hosts still queued (none unless interrupted) must not write anymore
+        for endpoint in endpoints:
+            abandon(endpoint)
+        cache.save()
+        if writer is not None:
+            emit({"event": "fleet", "hosts": len(endpoints), "failed": failed})
+            writer.close()
+            return
+        cprint(
+            "Scanned {} hosts ({} failed)".format(len(endpoints), failed),
+            "green" if failed == 0 else "yellow",
+        )
+
+    @command("cache-ttl")
+    @argument(
+        "plugin",
+        description="plugin whose cached results TTL is set",
+        choices=plugin_instantiator,
+    )
+    @argument("seconds", description="seconds a cached result stays valid")
+    def set_cache_ttl(self, plugin: str, seconds: int) -> None:
+        """
+        Set how long cached results of a plugin are reused by incremental scans
+        """
+        self.cache_ttl[plugin] = seconds
+        cprint("Cached {} results expire after {}s".format(plugin, seconds), "green")
+
     # Add commands
 
     @command("add")
@@ -254,7 +595,7 @@ class scan:
         """
         Add plugin to RPC scanner
         """
-        if plugin in SUPPORTED_BY[self.node_type]:
+        if self._is_supported(plugin):
             self.added_plugins.add(plugin)
         else:
             cprint(
@@ -264,6 +605,13 @@ class scan:
                 "yellow",
             )
 
+    def _is_supported(self, plugin: str) -> bool:
+        # Without a node to check against (fleet scans) any known plugin goes,
+        # unsupported ones are skipped per host.
+        if self.node_type is None:
+            return plugin in self.plugin_instantiator
+        return plugin in SUPPORTED_BY[self.node_type]
+
     # If argument is type list we can not define `choices`, making it
     # unusable for interactive mode.
     @command("add-list")
@@ -273,7 +621,7 @@ class scan:
         Add plugin(s) to RPC scanner
         """
         for plugin in plugins:
-            if plugin in SUPPORTED_BY[self.node_type]:
+            if self._is_supported(plugin):
                 self.added_plugins.add(plugin)
             else:
                 cprint(
@@ -340,3 +688,262 @@ class scan:
         cprint("Plugins supported by Parity:", "yellow")
         for plugin in SUPPORTED_BY[NodeType.PARITY]:
             cprint("+ " + plugin)
+
+
+def scan_host(
+    node_uri: str,
+    plugins: list,
+    timeout: int = 10,
+    plugin_concurrency: int = 4,
+    cache: JSONFileCache = None,
+    incremental: bool = False,
+    on_plugin=None,
+    cancelled: threading.Event = None,
+) -> dict:
+    """
+    Detect the node type of node_uri and run the plugins it supports against it,
+    until cancelled is set (see run_scan)
+    """
+    from legions.network.web3 import Web3
+
+    host_w3 = Web3()
+    host_w3.connect(node_uri, timeout=timeout)
+    client_version = host_w3.clientVersion
+    node_type = detect_node_type(client_version)
+    if node_type is None:
+        raise ValueError("Unsupported node type: {}".format(client_version))
+
+    prefix, host, port = parse_target(node_uri)
+    if prefix not in ("http://", "https://"):
+        # teatime's plugins only speak JSON-RPC over HTTP
+        raise ValueError(
+            "{} node detected, but teatime can only scan HTTP endpoints".format(
+                node_type.name
+            )
+        )
+
+    selected = [p for p in plugins if p in SUPPORTED_BY[node_type]]
+    report = run_scan(
+        host,
+        port,
+        node_type,
+        selected,
+        prefix,
+        concurrency=plugin_concurrency,
+        client_version=client_version,
+        cache=cache,
+        incremental=incremental,
+        on_plugin=on_plugin,
+        cancelled=cancelled,
+    )
+
+    return {
+        "node_type": node_type.name,
+        "client_version": client_version,
+        "skipped_plugins": [p for p in plugins if p not in selected],
+        "report": report,
+    }
+
+
+def plugin_cache_key(
+    target: str, node_type: NodeType, client_version: str, name: str, plugin: Plugin
+) -> str:
+    """
+    Cache key of a plugin run: the host, the node it runs, the plugin and its arguments
+    """
+    arguments = {k: v for k, v in vars(plugin).items() if not callable(v)}
+    key = json.dumps(
+        [target, node_type.name, client_version, name, arguments],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def dump_plugin_report(report: Report) -> dict:
+    return {
+        "issues": [
+            {
+                "title": issue.title,
+                "description": issue.description,
+                "severity": issue.severity.name,
+                "raw_data": issue.raw_data,
+            }
+            for issue in report.issues
+        ],
+        "meta": report.meta,
+    }
+
+
+def load_plugin_report(target: str, entry: dict) -> Report:
+    report = Report(target=target)
+    for issue in entry["issues"]:
+        report.add_issue(
+            Issue(
+                title=issue["title"],
+                description=issue["description"],
+                severity=Severity[issue["severity"]],
+                raw_data=issue["raw_data"],
+            )
+        )
+    report.meta.update(entry["meta"])
+    return report
+
+
+def plugin_event(name: str, plugin_report: Report, cached: bool) -> dict:
+    """
+    Streamed record of a finished plugin
+    """
+    return {
+        "event": "plugin",
+        "target": plugin_report.target,
+        "plugin": name,
+        "cached": cached,
+        "issues": [issue.to_dict() for issue in plugin_report.issues],
+        "meta": plugin_report.meta,
+    }
+
+
+def summary_event(report: Report) -> dict:
+    """
+    Streamed record closing a scan: the report without the (already streamed) issues
+    """
+    summary = {"event": "summary"}
+    summary.update(report.to_dict())
+    summary["issue_count"] = len(summary.pop("issues"))
+    return summary
+
+
+class ScanCancelled(Exception):
+    """
+    The scan was abandoned (e.g. past its deadline) before it finished
+    """
+
+
+def run_scan(
+    host: str,
+    port: int,
+    node_type: NodeType,
+    plugins: list,
+    prefix: str = "http://",
+    concurrency: int = 8,
+    client_version: str = None,
+    cache: JSONFileCache = None,
+    incremental: bool = False,
+    on_plugin=None,
+    cancelled: threading.Event = None,
+) -> Report:
+    """
+    Run the plugins (by name) like teatime's Scanner.run() does, except that the
+    non-intrusive ones run concurrently. Intrusive plugins follow one at a time,
+    DISRUPTIVE_PLUGINS last, so they cannot interfere with the parallel probes.
+
+    Identical read-only RPC calls of the plugins are sent once (see RPCMemo),
+    the dedup statistics are added to the report's meta as rpc_memo.
+
+    Every plugin's findings are stored in cache. With incremental, plugins with
+    an unexpired entry (see scan.cache_ttl) are not run again, their cached
+    findings are reused and listed in the report's meta as cached_plugins.
+
+    on_plugin(name, plugin_report, cached) is called as soon as each plugin's
+    findings are known, to stream them out.
+
+    Once cancelled is set, no other plugin is started, the findings of the
+    running ones are dropped and ScanCancelled is raised.
+    """
+    target = "{}{}:{}".format(prefix, host, port)
+    start = time.time()
+    report = Report(target=target)
+
+    memo = RPCMemo()
+    if client_version is not None:
+        memo.seed(target, "web3_clientVersion", [], client_version)
+
+    instances = {name: scan.plugin_instantiator[name]() for name in plugins}
+    keys = {
+        name: plugin_cache_key(target, node_type, client_version, name, plugin)
+        for name, plugin in instances.items()
+    }
+
+    cached = []
+    if cache is not None and incremental:
+        for name in plugins:
+            entry = cache.get(keys[name], ttl=scan.cache_ttl.get(name, CACHE_TTL))
+            if entry is not None:
+                cached.append(name)
+                plugin_report = load_plugin_report(target, entry)
+                report.issues.extend(plugin_report.issues)
+                report.meta.update(plugin_report.meta)
+                if on_plugin is not None:
+                    on_plugin(name, plugin_report, True)
+
+    def check_cancelled():
+        if cancelled is not None and cancelled.is_set():
+            raise ScanCancelled("Scan of {} abandoned".format(target))
+
+    def run_plugin(name):
+        check_cancelled()
+        # Each plugin reports to its own context so its findings can be cached
+        context = Context(
+            target=target, report=Report(target=target), node_type=node_type
+        )
+        instances[name].run(context)
+        return context.report
+
+    def merge(name, plugin_report):
+        check_cancelled()
+        report.issues.extend(plugin_report.issues)
+        report.meta.update(plugin_report.meta)
+        if cache is not None:
+            cache.set(keys[name], dump_plugin_report(plugin_report))
+        if on_plugin is not None:
+            on_plugin(name, plugin_report, False)
+
+    for plugin in instances.values():
+        memo.attach(plugin)
+    to_run = [name for name in plugins if name not in cached]
+    parallel = [
+        name
+        for name in to_run
+        if not instances[name].INTRUSIVE and name not in DISRUPTIVE_PLUGINS
+    ]
+    serialized = sorted(
+        (name for name in to_run if name not in parallel),
+        key=lambda name: name in DISRUPTIVE_PLUGINS,
+    )
+
+    tasks = {name: (lambda name=name: run_plugin(name)) for name in parallel}
+    for name, plugin_report, error in run_concurrently(tasks, max_workers=concurrency):
+        if isinstance(error, ScanCancelled):
+            continue
+        if error is not None:
+            cprint(
+                "Plugin {} failed: {}".format(name, error), "yellow", file=sys.stderr
+            )
+        else:
+            merge(name, plugin_report)
+    check_cancelled()
+
+    for name in serialized:
+        if instances[name].INTRUSIVE:
+            cprint(
+                "Plugin {} is intrusive. Please make sure you have permission to run this scan on the target.".format(
+                    name
+                ),
+                "yellow",
+                file=sys.stderr,
+            )
+        try:
+            plugin_report = run_plugin(name)
+        except ScanCancelled:
+            raise
+        except Exception as e:
+            cprint("Plugin {} failed: {}".format(name, e), "yellow", file=sys.stderr)
+            continue
+        merge(name, plugin_report)
+
+    if cache is not None:
+        report.add_meta("cached_plugins", cached)
+    report.add_meta("rpc_memo", memo.stats())
+    report.add_meta("elapsed", time.time() - start)
+    return report
@@ -0,0 +1,297 @@
+import threading
+import time
+import typing
+from legions.commands.commands import w3
+from legions.network import subscriptions
+from legions.network.subscriptions import DEFAULT_QUEUE_SIZE, Subscription
+from legions.utils.export import open_writer
+from nubia import command, argument
+from termcolor import cprint
+
+
+def watch_uri(node: str) -> str:
+    """
+    WebSocket endpoint to subscribe to: node if given, else the connected node
+    """
+    uri = node or w3.node_uri or ""
+    if not uri.startswith(("ws://", "wss://")):
+        raise ValueError(
+            "Subscriptions need a WebSocket node, run sethost with a ws:// URL or pass node"
+        )
+    return uri
+
+
+def format_event(kind: str, event: dict) -> str:
+    if kind == "newHeads":
+        return "Block #{} {} (gas used {})".format(
+            int(event["number"], 16), event["hash"], int(event["gasUsed"], 16)
+        )
+    if kind == "logs":
+        return "Log {} block #{} tx {} topics {}".format(
+            event["address"],
+            int(event["blockNumber"], 16),
+            event["transactionHash"],
+            ",".join(event["topics"]),
+        )
+    return "Pending tx {}".format(event)
+
+
+@command
+class watch:
+    "Stream new heads, logs and pending transactions from a WebSocket node"
+
+    def __init__(self) -> None:
+        pass
+
+    def _consume(self, subscription, count, duration, writer):
+        """
+        Print or write the events of subscription until count events were seen,
+        duration seconds passed or it is stopped
+        """
+        end = None if duration is None else time.monotonic() + duration
+        seen = 0
+        try:
+            while count is None or seen < count:
+                timeout = None if end is None else end - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                event = subscription.get(timeout)
+                if event is None:
+                    break
+                seen += 1
+                if writer is not None:
+                    writer.write({"event": subscription.kind, "data": event})
+                else:
+                    cprint(format_event(subscription.kind, event), "green")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            subscription.stop()
+            if writer is not None:
+                writer.close()
+        return seen
+
+    def _watch(
+        self,
+        kind,
+        params,
+        node,
+        count,
+        duration,
+        queueSize,
+        sample,
+        drop,
+        output,
+        background,
+    ):
+        if background and output in (None, "-"):
+            cprint("Background watches need an output file", "red")
+            return 1
+        try:
+            subscription = Subscription(
+                watch_uri(node),
+                kind,
+                params,
+                queue_size=queueSize,
+                sample=sample,
+                drop=drop,
+            ).start()
+        except ValueError as e:
+            cprint("{}".format(e), "red")
+            return 1
+
+        writer = None if output is None else open_writer(output, "ndjson", [])
+        if background:
+            threading.Thread(
+                target=self._consume,
+                args=(subscription, count, duration, writer),
+                daemon=True,
+            ).start()
+            cprint(
+                "Watching {} into {} (watch stats / watch stop)".format(kind, output),
+                "cyan",
+            )
+            return 0
+
+        seen = self._consume(subscription, count, duration, writer)
+        if subscription.error is not None:
+            cprint("Subscription failed: {}".format(subscription.error), "red")
+            return 1
+        cprint(
+            "{} events received, {} shown, {} sampled out, {} dropped".format(
+                subscription.received, seen, subscription.skipped, subscription.dropped
+            ),
+            "cyan",
+        )
+        return 0
+
+    @command("heads")
+    @argument("node", description="WebSocket node (default: the connected node)")
+    @argument("count", description="Stop after this many events")
+    @argument("duration", description="Stop after this many seconds")
+    @argument(
+        "queueSize", description="Events buffered before pushing back on the node"
+    )
+    @argument("sample", description="Only show one event out of sample")
+    @argument("drop", description="Drop events instead of pushing back when behind")
+    @argument(
+        "output", description="Write events as NDJSON to this file (- for stdout)"
+    )
+    @argument("background", description="Keep watching while the shell is used")
+    def heads(
+        self,
+        node: str = None,
+        count: int = None,
+        duration: int = None,
+        queueSize: int = DEFAULT_QUEUE_SIZE,
+        sample: int = 1,
+        drop: bool = False,
+        output: str = None,
+        background: bool = False,
+    ):
+        """
+        Stream new block headers (eth_subscribe newHeads)
+        """
+        return self._watch(
+            "newHeads",
+            None,
+            node,
+            count,
+            duration,
+            queueSize,
+            sample,
+            drop,
+            output,
+            background,
+        )
+
+    @command("logs")
+    @argument("address", description="Only logs emitted by these contract(s)")
+    @argument("topics", description="Topic filters, by position (empty for any)")
+    @argument("node", description="WebSocket node (default: the connected node)")
+    @argument("count", description="Stop after this many events")
+    @argument("duration", description="Stop after this many seconds")
+    @argument(
+        "queueSize", description="Events buffered before pushing back on the node"
+    )
+    @argument("sample", description="Only show one event out of sample")
+    @argument("drop", description="Drop events instead of pushing back when behind")
+    @argument(
+        "output", description="Write events as NDJSON to this file (- for stdout)"
+    )
+    @argument("background", description="Keep watching while the shell is used")
+    def logs(
+        self,
+        address: typing.List[str] = None,
+        topics: typing.List[str] = None,
+        node: str = None,
+        count: int = None,
+        duration: int = None,
+        queueSize: int = DEFAULT_QUEUE_SIZE,
+        sample: int = 1,
+        drop: bool = False,
+        output: str = None,
+        background: bool = False,
+    ):
+        """
+        Stream logs matching address/topics filters (eth_subscribe logs)
+        """
+        params = {}
+        if address:
+            params["address"] = address
+        if topics:
+            params["topics"] = [topic or None for topic in topics]
+        return self._watch(
+            "logs",
+            params,
+            node,
+            count,
+            duration,
+            queueSize,
+            sample,
+            drop,
+            output,
+            background,
+        )
+
+    @command("pending")
+    @argument("node", description="WebSocket node (default: the connected node)")
+    @argument("count", description="Stop after this many events")
+    @argument("duration", description="Stop after this many seconds")
+    @argument(
+        "queueSize", description="Events buffered before pushing back on the node"
+    )
+    @argument("sample", description="Only show one event out of sample")
+    @argument("drop", description="Drop events instead of pushing back when behind")
+    @argument(
+        "output", description="Write events as NDJSON to this file (- for stdout)"
+    )
+    @argument("background", description="Keep watching while the shell is used")
+    def pending(
+        self,
+        node: str = None,
+        count: int = None,
+        duration: int = None,
+        queueSize: int = DEFAULT_QUEUE_SIZE,
+        sample: int = 1,
+        drop: bool = False,
+        output: str = None,
+        background: bool = False,
+    ):
+        """
+        Stream hashes of new pending transactions (eth_subscribe newPendingTransactions)
+        """
+        return self._watch(
+            "newPendingTransactions",
+            None,
+            node,
+            count,
+            duration,
+            queueSize,
+            sample,
+            drop,
+            output,
+            background,
+        )
+
+    @command("stop")
+    def stop(self):
+        """
+        Stop the running subscription
+        """
+        subscription = subscriptions.current()
+        if subscription is None or not subscription.running:
+            cprint("No running subscription", "yellow")
+            return 0
+        subscription.stop()
+        cprint("Stopped watching {}".format(subscription.kind), "green")
+        return 0
+
+    @command("stats")
+    def stats(self):
+        """
+        Counters of the last subscription
+        """
+        subscription = subscriptions.current()
+        if subscription is None:
+            cprint("No subscription yet", "yellow")
+            return 0
+        cprint(
+            "{}: {} received, {} delivered, {} sampled out, {} dropped".format(
+                subscription.kind,
+                subscription.received,
+                subscription.delivered,
+                subscription.skipped,
+                subscription.dropped,
+            ),
+            "green",
+        )
+        cprint(
+            "{:.1f} events/s, last event waited {:.3f}s in the queue".format(
+                subscription.rate, subscription.lag
+            ),
+            "green",
+        )
+        if subscription.error is not None:
+            cprint("Subscription failed: {}".format(subscription.error), "red")
+        return 0
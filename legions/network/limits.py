@@ -0,0 +1,286 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+# Retries of a request failing with a retryable error (rate limit, 5xx, timeout...)
+DEFAULT_RETRIES = 3
+
+# Backoff before the nth retry: random between 0 and BACKOFF_BASE * 2^n seconds,
+# at most BACKOFF_MAX
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 8
+
+# Consecutive failures after which a host is considered down, and seconds it is
+# failed fast before a request is let through again
+DEFAULT_FAILURES = 5
+DEFAULT_RESET = 30
+
+# HTTP statuses worth retrying, the ones also meaning the host is unwell
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+HOST_FAILURE_STATUSES = {500, 502, 503, 504}
+
+# Error messages (and code) of JSON-RPC responses refused by a rate limit. Range
+# errors of eth_getLogs share code -32005, they are told apart by their message.
+RATE_LIMIT_ERRORS = [
+    "rate limit",
+    "rate exceeded",
+    "too many requests",
+    "request count exceeded",
+    "capacity exceeded",
+]
+RATE_LIMIT_CODE = 429
+
+
+def is_rate_limit_error(error: dict) -> bool:
+    message = str(error.get("message", "")).lower()
+    return error.get("code") == RATE_LIMIT_CODE or any(
+        limit in message for limit in RATE_LIMIT_ERRORS
+    )
+
+
+class RateLimitError(Exception):
+    """
+    The node answered, but refused the request because of its rate limit
+    """
+
+
+class CircuitOpenError(ConnectionError):
+    """
+    The host failed too often recently, the request was not sent
+    """
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average, in bursts of up to burst
+    """
+
+    def __init__(self, rate: float = None, burst: int = None) -> None:
+        self.rate = rate
+        self.burst = burst or max(1, int(rate or 1))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cost: int = 1) -> float:
+        """
+        Take cost tokens, waiting for them if needed, and return the seconds waited
+        """
+        if not self.rate:
+            return 0
+        cost = min(cost, self.burst)
+        waited = 0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= cost:
+                    self._tokens -= cost
+                    return waited
+                wait = (cost - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class CircuitBreaker:
+    """
+    Fails fast once failures requests in a row failed, until reset seconds have
+    passed; the next request then decides whether the host is back
+    """
+
+    def __init__(
+        self, failures: int = DEFAULT_FAILURES, reset: float = DEFAULT_RESET
+    ) -> None:
+        self.failures = failures
+        self.reset = reset
+        self._failed = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset:
+                return "open"
+            return "half-open"
+
+    def check(self, host: str) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.reset - (time.monotonic() - self._opened_at)
+        if remaining > 0:
+            raise CircuitOpenError(
+                "{} failed {} times in a row, not retrying for {:.0f}s".format(
+                    host, self._failed, remaining
+                )
+            )
+
+    def success(self) -> None:
+        with self._lock:
+            self._failed = 0
+            self._opened_at = None
+
+    def failure(self) -> None:
+        with self._lock:
+            self._failed += 1
+            if self._failed >= self.failures:
+                self._opened_at = time.monotonic()
+
+
+class HostPolicy:
+    """
+    Rate limit, retries and circuit breaker of the requests sent to one host
+    """
+
+    def __init__(
+        self,
+        host: str,
+        rate: float = None,
+        burst: int = None,
+        retries: int = DEFAULT_RETRIES,
+        failures: int = DEFAULT_FAILURES,
+        reset: float = DEFAULT_RESET,
+    ) -> None:
+        self.host = host
+        self.retries = retries
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failures, reset)
+        self.requests = 0
+        self.retried = 0
+        self.throttled = 0
+
+    def backoff(self, attempt: int, retry_after: float = None) -> float:
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        return max(delay, retry_after or 0)
+
+    def call(self, send, cost: int = 1, idempotent: bool = True):
+        """
+        send() within the rate limit, retried with backoff on retryable errors
+
+        A request which is not idempotent (e.g. eth_sendRawTransaction) may
+        have reached the node when it timed out or failed with a 5xx, it is
+        only retried when the node explicitly refused it for its rate limit.
+        """
+        attempt = 0
+        while True:
+            self.breaker.check(self.host)
+            if self.bucket.acquire(cost):
+                self.throttled += 1
+            self.requests += 1
+            try:
+                result = send()
+            except Exception as e:
+                retryable, host_failure, retry_after = classify(e)
+                if not idempotent and not is_rate_limited(e):
+                    retryable = False
+                if host_failure:
+                    self.breaker.failure()
+                if not retryable or attempt >= self.retries:
+                    raise
+                time.sleep(self.backoff(attempt, retry_after))
+                attempt += 1
+                self.retried += 1
+                continue
+            self.breaker.success()
+            return result
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.bucket.rate,
+            "burst": self.bucket.burst,
+            "retries": self.retries,
+            "circuit": self.breaker.state,
+            "requests": self.requests,
+            "retried": self.retried,
+            "throttled": self.throttled,
+        }
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """
+    Whether the node refused the request for its rate limit, without handling it
+    """
+    if isinstance(error, RateLimitError):
+        return True
+    return (
+        isinstance(error, requests.HTTPError)
+        and error.response is not None
+        and error.response.status_code == 429
+    )
+
+
+def classify(error: Exception) -> tuple:
+    """
+    (retryable, host failure, seconds to wait if the host said so) of an error
+    """
+    if isinstance(error, RateLimitError):
+        return True, False, None
+    if isinstance(error, CircuitOpenError):
+        return False, False, None
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        retry_after = error.response.headers.get("Retry-After")
+        try:
+            retry_after = float(retry_after) if retry_after else None
+        except ValueError:
+            # An HTTP date, rare enough to fall back to the backoff
+            retry_after = None
+        return (
+            status in RETRY_STATUSES,
+            status in HOST_FAILURE_STATUSES,
+            retry_after,
+        )
+    if isinstance(error, requests.ReadTimeout):
+        # The request may be too heavy for the node, sending it again would not help
+        return False, True, None
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True, True, None
+    return False, False, None
+
+
+_policies = {}
+_settings = {}
+_lock = threading.Lock()
+
+
+def host_of(url: str) -> str:
+    return urlparse(url).netloc or url
+
+
+def configure(url: str, **settings) -> HostPolicy:
+    """
+    Set the rate (requests per second), burst, retries, failures and reset of
+    the host of url (a URL or host[:port]); None settings keep their value
+    """
+    host = host_of(url) if "://" in url else url
+    with _lock:
+        merged = dict(_settings.get(host, {}))
+        merged.update({k: v for k, v in settings.items() if v is not None})
+        _settings[host] = merged
+        _policies[host] = HostPolicy(host, **merged)
+        return _policies[host]
+
+
+def policy(url: str) -> HostPolicy:
+    """
+    HostPolicy of the host of url, with the default settings until configured
+    """
+    host = host_of(url)
+    with _lock:
+        if host not in _policies:
+            _policies[host] = HostPolicy(host, **_settings.get(host, {}))
+        return _policies[host]
+
+
+def policies() -> dict:
+    with _lock:
+        return dict(_policies)
@@ -0,0 +1,245 @@
+# Kept free of web3 imports like session.py: the status bar and the stats
+# command read the metrics without loading web3.
+import bisect
+import collections
+import contextlib
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets, the last bucket
+# holds everything slower
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# Latencies kept per method to compute quantiles, the most recent ones
+MAX_SAMPLES = 1000
+
+# Commands whose metrics are kept for the stats command
+MAX_COMMANDS = 50
+
+
+def quantile(samples, q: float):
+    """
+    q quantile of samples, None without samples
+    """
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def bucket_label(position: int) -> str:
+    if position < len(LATENCY_BUCKETS):
+        return "<= {}s".format(LATENCY_BUCKETS[position])
+    return "> {}s".format(LATENCY_BUCKETS[-1])
+
+
+class MethodStats:
+    """
+    Calls, errors, response bytes and latencies of one JSON-RPC method
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.samples = collections.deque(maxlen=MAX_SAMPLES)
+
+    def add(self, seconds: float, size: int = None, error: bool = False) -> None:
+        self.calls += 1
+        self.errors += bool(error)
+        self.bytes += size or 0
+        self.seconds += seconds
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.samples.append(seconds)
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "seconds": self.seconds,
+            "p50": quantile(self.samples, 0.5),
+            "p95": quantile(self.samples, 0.95),
+            "max": max(self.samples) if self.samples else None,
+            "histogram": {
+                bucket_label(i): count for i, count in enumerate(self.buckets) if count
+            },
+        }
+
+
+class RPCStats:
+    """
+    Metrics of the JSON-RPC calls sent to the node(s), per method
+
+    A batch is one request (round trip) of several calls: each of its calls is
+    counted with the latency of the whole batch and an even share of its bytes.
+    """
+
+    def __init__(self, name: str = "session") -> None:
+        self.name = name
+        self.started = time.time()
+        self.finished = None
+        self.status = None
+        self.requests = 0
+        self.methods = collections.defaultdict(MethodStats)
+        self._lock = threading.Lock()
+
+    def record(
+        self, methods: list, seconds: float, size: int = None, errors: list = None
+    ) -> None:
+        share = size // len(methods) if size and methods else None
+        with self._lock:
+            self.requests += 1
+            for i, method in enumerate(methods):
+                self.methods[method].add(seconds, share, errors[i] if errors else False)
+
+    def total(self) -> MethodStats:
+        """
+        Metrics of all the methods together
+        """
+        total = MethodStats()
+        with self._lock:
+            for stats in self.methods.values():
+                total.calls += stats.calls
+                total.errors += stats.errors
+                total.bytes += stats.bytes
+                total.seconds += stats.seconds
+                total.buckets = [a + b for a, b in zip(total.buckets, stats.buckets)]
+                total.samples.extend(stats.samples)
+        return total
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            methods = {name: stats.as_dict() for name, stats in self.methods.items()}
+        return {
+            "name": self.name,
+            "started": self.started,
+            "finished": self.finished,
+            "status": self.status,
+            "requests": self.requests,
+            "total": self.total().as_dict(),
+            "methods": methods,
+        }
+
+
+_session = RPCStats()
+_commands = collections.deque(maxlen=MAX_COMMANDS)
+_current = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def background():
+    """
+    Calls made by this thread within the block (health checks...) only count
+    for the session, not for the running command
+    """
+    _local.background = True
+    try:
+        yield
+    finally:
+        _local.background = False
+
+
+def record(methods: list, seconds: float, size: int = None, errors: list = None):
+    """
+    Record a request of methods (one per call of a batch) answered in seconds
+    with size bytes, errors telling which calls failed
+    """
+    with _lock:
+        current = None if getattr(_local, "background", False) else _current
+    _session.record(methods, seconds, size, errors)
+    if current is not None:
+        current.record(methods, seconds, size, errors)
+
+
+def is_error(response) -> bool:
+    return isinstance(response, dict) and response.get("error") is not None
+
+
+def measure(methods: list, send):
+    """
+    Run send(), which returns (responses, response size or None), record its
+    latency, size and errors and return the responses
+    """
+    started = time.monotonic()
+    try:
+        responses, size = send()
+    except Exception:
+        record(methods, time.monotonic() - started, errors=[True] * len(methods))
+        raise
+    if isinstance(responses, list):
+        errors = [is_error(response) for response in responses]
+    else:
+        errors = [is_error(responses)] * len(methods)
+    record(methods, time.monotonic() - started, size, errors)
+    return responses
+
+
+def start_command(name: str = None) -> RPCStats:
+    """
+    Record the calls made from now on under a new command
+    """
+    global _current
+    with _lock:
+        _current = RPCStats(name)
+        _commands.append(_current)
+        return _current
+
+
+def end_command(name: str = None, status=None) -> None:
+    global _current
+    with _lock:
+        if _current is None:
+            return
+        if name:
+            _current.name = name
+        _current.status = status
+        _current.finished = time.time()
+        _current = None
+
+
+def current() -> RPCStats:
+    """
+    Metrics of the running command, None between commands
+    """
+    with _lock:
+        return _current
+
+
+def session() -> RPCStats:
+    return _session
+
+
+def commands() -> list:
+    """
+    Metrics of the last MAX_COMMANDS commands, oldest first
+    """
+    with _lock:
+        return list(_commands)
+
+
+def last_command() -> RPCStats:
+    """
+    Metrics of the running command, or of the last one, None before any
+    """
+    with _lock:
+        return _commands[-1] if _commands else None
+
+
+def reset() -> None:
+    global _session, _current
+    with _lock:
+        _session = RPCStats()
+        _commands.clear()
+        _current = None
+
+
+def export() -> dict:
+    return {
+        "session": session().as_dict(),
+        "commands": [stats.as_dict() for stats in commands()],
+    }
@@ -0,0 +1,123 @@
+try:
+    from eth_abi import decode, encode
+except ImportError:  # eth-abi < 3
+    from eth_abi import decode_abi as decode, encode_abi as encode
+from web3 import Web3
+
+# Multicall3 is deployed at the same address on mainnet and most other chains
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+# Calls packed into a single aggregate3 eth_call by default
+DEFAULT_MULTICALL_SIZE = 500
+
+AGGREGATE3 = "0x82ad56cb"  # aggregate3((address,bool,bytes)[])
+GET_ETH_BALANCE = "0x4d2301cc"  # getEthBalance(address)
+
+# ERC-20 views
+BALANCE_OF = "0x70a08231"  # balanceOf(address)
+DECIMALS = "0x313ce567"  # decimals()
+SYMBOL = "0x95d89b41"  # symbol()
+
+
+def selector_call(selector: str, types: list = None, args: list = None) -> bytes:
+    """
+    Calldata of a function call: its 4 bytes selector and ABI encoded args
+    """
+    data = Web3.toBytes(hexstr=selector)
+    if types:
+        data += encode(types, args)
+    return data
+
+
+def encode_aggregate3(calls: list) -> str:
+    """
+    Calldata of Multicall3.aggregate3 for (target, calldata) calls, each one
+    allowed to fail without reverting the others
+    """
+    return Web3.toHex(
+        selector_call(
+            AGGREGATE3,
+            ["(address,bool,bytes)[]"],
+            [[(Web3.toChecksumAddress(target), True, data) for target, data in calls]],
+        )
+    )
+
+
+def decode_aggregate3(result: str) -> list:
+    """
+    (success, return data) of every call of an aggregate3 result
+    """
+    return list(decode(["(bool,bytes)[]"], Web3.toBytes(hexstr=result))[0])
+
+
+def decode_symbol(data: bytes) -> str:
+    """
+    Token symbol returned as a string, or as bytes32 by older tokens (e.g. MKR)
+    """
+    if len(data) == 32:
+        return data.rstrip(b"\0").decode("utf-8", "replace")
+    return decode(["string"], data)[0]
+
+
+class Multicall:
+    """
+    Multicall3 contract of the connected chain, used to answer many read-only
+    calls with one eth_call at a given block
+    """
+
+    def __init__(self, w3, block: int, address: str = MULTICALL3_ADDRESS) -> None:
+        self.w3 = w3
+        self.block = block
+        self.address = address
+
+    def available(self) -> bool:
+        """
+        Whether the contract is deployed at the block
+        """
+        try:
+            code = self.w3.eth.getCode(self.address, block_identifier=self.block)
+        except Exception:
+            return False
+        return len(code) > 0
+
+    def request(self, calls: list) -> tuple:
+        """
+        (method, params) of the eth_call aggregating calls
+        """
+        return (
+            "eth_call",
+            [{"to": self.address, "data": encode_aggregate3(calls)}, hex(self.block)],
+        )
+
+    def aggregate(self, calls: list) -> list:
+        """
+        (success, return data) of each (target, calldata) call
+        """
+        response = self.w3.provider.make_request(*self.request(calls))
+        if "error" in response:
+            raise ValueError(
+                "Multicall failed: {}".format(
+                    response["error"].get("message", response["error"])
+                )
+            )
+        return decode_aggregate3(response["result"])
+
+    def eth_balance_call(self, address: str) -> tuple:
+        return (
+            self.address,
+            selector_call(
+                GET_ETH_BALANCE, ["address"], [Web3.toChecksumAddress(address)]
+            ),
+        )
+
+    @staticmethod
+    def token_call(token: str, selector: str, holder: str = None) -> tuple:
+        """
+        (target, calldata) of an ERC-20 view, balanceOf taking the holder
+        """
+        if holder is None:
+            return token, selector_call(selector)
+        return (
+            token,
+            selector_call(selector, ["address"], [Web3.toChecksumAddress(holder)]),
+        )
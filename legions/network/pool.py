@@ -0,0 +1,121 @@
+# Kept free of web3 imports like session.py: connections are only created when
+# a command fans out to several chains.
+import os
+import re
+import threading
+
+from legions.utils.chains import registry as chain_registry
+from legions.utils.concurrency import run_concurrently
+
+# ${NAME} placeholders of the rpc URLs of chains.json (e.g. ${INFURA_API_KEY})
+RPC_VARIABLE = re.compile(r"\$\{(\w+)\}")
+
+# Seconds a chain is given to answer a fanned out query
+DEFAULT_CHAIN_TIMEOUT = 10
+
+
+class ConnectionPool:
+    """
+    Web3 connections kept open per chain (chainId or shortName of the chain
+    registry) or per endpoint URL, to run the same query on several chains
+
+    A chain is reached through the rpc endpoints of chains.json which do not
+    need a missing variable (set in variables or the environment), together
+    when it has several (see FailoverProvider), unless set_endpoint picked
+    another node.
+    """
+
+    def __init__(
+        self, registry=chain_registry, timeout: int = 10, variables: dict = None
+    ) -> None:
+        self.registry = registry
+        self.timeout = timeout
+        self.variables = variables or {}
+        self._endpoints = {}
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def chain(self, spec) -> dict:
+        """
+        Chain of the registry named by spec (chainId or shortName), None for an
+        unknown chain or an endpoint URL
+        """
+        spec = str(spec).strip()
+        if spec.isdigit():
+            return self.registry.by_chain_id(int(spec))
+        if "://" in spec or os.path.exists(spec):
+            return None
+        return self.registry.by_short_name(spec)
+
+    def endpoints(self, chain: dict) -> list:
+        """
+        rpc URLs of chain usable as is, with their variables filled in
+        """
+        urls = []
+        for url in chain.get("rpc", []):
+            missing = False
+            for name in RPC_VARIABLE.findall(url):
+                value = os.environ.get(name, self.variables.get(name))
+                if value is None:
+                    missing = True
+                    break
+                url = url.replace("${" + name + "}", value)
+            if not missing:
+                urls.append(url)
+        return urls
+
+    def set_endpoint(self, spec, node: str) -> None:
+        """
+        Reach the chain named by spec through node
+        """
+        with self._lock:
+            self._endpoints[str(spec)] = node
+            self._connections.pop(str(spec), None)
+
+    def endpoint(self, spec) -> str:
+        spec = str(spec).strip()
+        if spec in self._endpoints:
+            return self._endpoints[spec]
+        chain = self.chain(spec)
+        if chain is None:
+            if "://" in spec or os.path.exists(spec):
+                return spec
+            raise ValueError("Unknown chain {}".format(spec))
+        endpoints = self.endpoints(chain)
+        if not endpoints:
+            raise ValueError("No usable rpc endpoint for {}".format(chain["name"]))
+        return ",".join(endpoints)
+
+    def label(self, spec) -> str:
+        chain = self.chain(spec)
+        return spec if chain is None else chain["name"]
+
+    def get(self, spec):
+        """
+        Web3 connected to the chain or endpoint spec, created on first use
+        """
+        from legions.network.web3 import Web3
+
+        key = str(spec).strip()
+        with self._lock:
+            w3 = self._connections.get(key)
+        if w3 is None:
+            w3 = Web3()
+            w3.connect(self.endpoint(key), timeout=self.timeout)
+            with self._lock:
+                w3 = self._connections.setdefault(key, w3)
+        return w3
+
+    def run(self, specs: list, query, timeout: float = DEFAULT_CHAIN_TIMEOUT):
+        """
+        Run query(w3) on every chain or endpoint of specs concurrently and yield
+        (spec, result, error) as soon as each one answers
+
+        A chain still silent after timeout seconds is yielded with a
+        futures.TimeoutError, so the slowest chain sets the total latency.
+        """
+        tasks = {spec: (lambda spec=spec: query(self.get(spec))) for spec in specs}
+        yield from run_concurrently(tasks, max_workers=len(tasks), timeout=timeout)
+
+    def __len__(self) -> int:
+        return len(self._connections)
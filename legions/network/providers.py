@@ -0,0 +1,572 @@
+import codecs
+import collections
+import json
+import socket
+import threading
+import time
+from concurrent import futures
+
+import requests
+from urllib3.exceptions import NewConnectionError
+from web3 import HTTPProvider, WebsocketProvider
+from web3.providers.base import JSONBaseProvider
+
+from legions.network import limits, metrics, transport
+
+# Bytes read from the IPC socket at once
+IPC_CHUNK_SIZE = 64 * 1024
+
+
+def order_batch_response(requests: list, responses) -> list:
+    """
+    Match the responses of a JSON-RPC batch to its requests by id
+
+    Nodes are free to answer a batch in any order (or to answer the whole batch
+    with a single error object), so the responses are returned in the order of
+    the requests and missing ones are replaced by an error response.
+    """
+    if isinstance(responses, dict):
+        # The node rejected the batch as a whole
+        return [dict(responses, id=request["id"]) for request in requests]
+
+    by_id = {response.get("id"): response for response in responses}
+    return [
+        by_id.get(
+            request["id"],
+            {
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "error": {"code": -32603, "message": "Missing response in batch"},
+            },
+        )
+        for request in requests
+    ]
+
+
+def refused(item) -> bool:
+    """
+    Whether a JSON-RPC response was refused by a rate limit (the call was not
+    run)
+    """
+    error = item.get("error") if isinstance(item, dict) else None
+    return isinstance(error, dict) and limits.is_rate_limit_error(error)
+
+
+def rate_limited(response) -> bool:
+    """
+    Whether a JSON-RPC response (or every response of a batch) was refused by a
+    rate limit, so the whole request can be sent again
+    """
+    items = response if isinstance(response, list) else [response]
+    return bool(items) and all(refused(item) for item in items)
+
+
+class BatchHTTPProvider(HTTPProvider):
+    """
+    HTTPProvider which can also send several calls in one JSON-RPC batch
+
+    Requests go through the shared keep-alive session of legions.network.transport
+    instead of web3's own per-endpoint sessions, within the rate limit, retries
+    and circuit breaker of the host (see legions.network.limits). Every call is
+    recorded in legions.network.metrics.
+    """
+
+    def post(self, data: bytes, methods: list) -> bytes:
+        """
+        Send data, the request of methods, within the limits of the host; only
+        requests made of idempotent reads are retried after a failure
+        """
+        kwargs = self.get_request_kwargs()
+        kwargs.setdefault("timeout", 10)
+
+        def send():
+            response = transport.post(self.endpoint_uri, data=data, **kwargs)
+            response.raise_for_status()
+            content = response.content
+            # Cheap test first, most answers carry no error at all
+            if b'"error"' in content and rate_limited(json.loads(content)):
+                raise limits.RateLimitError(
+                    "{} rate limited the request".format(self.endpoint_uri)
+                )
+            return content
+
+        return limits.policy(self.endpoint_uri).call(
+            send, len(methods), all(is_hedgeable(method) for method in methods)
+        )
+
+    def make_request(self, method, params):
+        self.logger.debug(
+            "Making request HTTP. URI: %s, Method: %s", self.endpoint_uri, method
+        )
+
+        def send():
+            raw_response = self.post(self.encode_rpc_request(method, params), [method])
+            return self.decode_rpc_response(raw_response), len(raw_response)
+
+        return metrics.measure([method], send)
+
+    def encode_batch_request(self, calls: list) -> list:
+        return [
+            {
+                "jsonrpc": "2.0",
+                "method": method,
+                "params": params or [],
+                "id": next(self.request_counter),
+            }
+            for method, params in calls
+        ]
+
+    def make_batch_request(self, calls: list) -> list:
+        """
+        Send a list of (method, params) in a single POST and return the raw
+        responses in the same order
+
+        Calls of the batch refused by the node's rate limit while the others
+        ran are sent again on their own (the others never are), within the
+        retries of the host.
+        """
+        responses = self._send_batch(calls)
+        policy = limits.policy(self.endpoint_uri)
+        attempt = 0
+        while True:
+            retry = [i for i, response in enumerate(responses) if refused(response)]
+            if not retry or attempt >= policy.retries:
+                return responses
+            time.sleep(policy.backoff(attempt))
+            attempt += 1
+            policy.retried += 1
+            answers = self._send_batch([calls[i] for i in retry])
+            for i, response in zip(retry, answers):
+                responses[i] = response
+
+    def _send_batch(self, calls: list) -> list:
+        requests = self.encode_batch_request(calls)
+
+        def send():
+            raw_response = self.post(
+                json.dumps(requests).encode("utf-8"), [method for method, _ in calls]
+            )
+            responses = self.decode_rpc_response(raw_response)
+            return order_batch_response(requests, responses), len(raw_response)
+
+        return metrics.measure([method for method, _ in calls], send)
+
+
+class PipelinedIPCProvider(JSONBaseProvider):
+    """
+    IPC provider keeping one socket open to the node and pipelining requests on it
+
+    Requests are written as soon as they are made, without waiting for the
+    previous answers; a reader thread parses the responses from the stream as
+    they arrive and hands each one to its request by JSON-RPC id. Concurrent
+    callers (and batches) therefore share the socket instead of queueing on it.
+    """
+
+    def __init__(self, ipc_path: str, timeout: float = 10) -> None:
+        self.ipc_path = ipc_path
+        self.timeout = timeout
+        self._sock = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        super().__init__()
+
+    def __str__(self) -> str:
+        return "IPC connection {0}".format(self.ipc_path)
+
+    def _connect(self) -> socket.socket:
+        with self._lock:
+            if self._sock is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(self.ipc_path)
+                # The reader waits on the socket for as long as it stays open
+                sock.settimeout(None)
+                self._sock = sock
+                threading.Thread(target=self._read, args=(sock,), daemon=True).start()
+            return self._sock
+
+    def _read(self, sock: socket.socket) -> None:
+        decoder = json.JSONDecoder()
+        text = codecs.getincrementaldecoder("utf-8")()
+        buffer = ""
+        error = None
+        try:
+            while True:
+                chunk = sock.recv(IPC_CHUNK_SIZE)
+                if not chunk:
+                    raise ConnectionError("IPC connection closed by the node")
+                buffer += text.decode(chunk)
+                # A response is only complete once a closing bracket arrived,
+                # no need to parse the partial ones
+                if not buffer.rstrip().endswith(("}", "]")):
+                    continue
+                while buffer:
+                    buffer = buffer.lstrip()
+                    try:
+                        response, end = decoder.raw_decode(buffer)
+                    except ValueError:
+                        break
+                    buffer = buffer[end:]
+                    self._dispatch(response, end)
+        except Exception as e:
+            error = e
+        finally:
+            self._close(sock, error)
+
+    def _dispatch(self, response, size: int) -> None:
+        items = response if isinstance(response, list) else [response]
+        for item in items:
+            with self._lock:
+                future = self._pending.pop(item.get("id"), None)
+            if future is not None:
+                # Size of the JSON text of the response, read by the metrics
+                future.response_size = size // len(items)
+                future.set_result(item)
+
+    def _close(self, sock: socket.socket, error: Exception) -> None:
+        """
+        Drop a broken socket and fail the requests still waiting on it
+        """
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+            pending, self._pending = self._pending, {}
+        sock.close()
+        for future in pending.values():
+            future.set_exception(error or ConnectionError("IPC connection closed"))
+
+    def _send(self, request: dict) -> futures.Future:
+        sock = self._connect()
+        future = futures.Future()
+        with self._lock:
+            self._pending[request["id"]] = future
+        try:
+            with self._write_lock:
+                sock.sendall(json.dumps(request).encode("utf-8"))
+        except OSError as e:
+            self._close(sock, e)
+        return future
+
+    def _encode(self, method, params) -> dict:
+        return {
+            "jsonrpc": "2.0",
+            "method": method,
+            "params": params or [],
+            "id": next(self.request_counter),
+        }
+
+    def _wait(self, request: dict, future: futures.Future) -> dict:
+        try:
+            return future.result(self.timeout)
+        except futures.TimeoutError:
+            with self._lock:
+                self._pending.pop(request["id"], None)
+            raise
+
+    def make_request(self, method, params):
+        def send():
+            request = self._encode(method, params)
+            future = self._send(request)
+            return self._wait(request, future), future.response_size
+
+        return metrics.measure([method], send)
+
+    def make_batch_request(self, calls: list) -> list:
+        """
+        Pipeline a list of (method, params) and return the responses in the
+        same order
+        """
+
+        def send():
+            requests = [self._encode(method, params) for method, params in calls]
+            pending = [(request, self._send(request)) for request in requests]
+            responses = [self._wait(request, future) for request, future in pending]
+            return responses, sum(future.response_size for _, future in pending)
+
+        return metrics.measure([method for method, _ in calls], send)
+
+    def disconnect(self) -> None:
+        with self._lock:
+            sock = self._sock
+        if sock is not None:
+            # Unblocks the reader, which then fails whatever is still pending
+            sock.shutdown(socket.SHUT_RDWR)
+
+
+class MeteredWebsocketProvider(WebsocketProvider):
+    """
+    WebsocketProvider recording its calls in legions.network.metrics (without
+    their size, web3 only hands back the parsed response)
+    """
+
+    def make_request(self, method, params):
+        def send():
+            return (
+                super(MeteredWebsocketProvider, self).make_request(method, params),
+                None,
+            )
+
+        return metrics.measure([method], send)
+
+
+# Methods whose answer does not depend on the node asked nor change anything on
+# it, which may therefore be sent to two endpoints at once
+HEDGED_PREFIXES = ("eth_get", "eth_call", "eth_estimateGas", "net_", "web3_")
+HEDGED_METHODS = {
+    "eth_blockNumber",
+    "eth_chainId",
+    "eth_gasPrice",
+    "eth_protocolVersion",
+    "eth_syncing",
+}
+# eth_get* methods reading filters, which only exist on the node which made them
+NOT_HEDGED_METHODS = {"eth_getFilterChanges", "eth_getFilterLogs"}
+
+
+def is_hedgeable(method: str) -> bool:
+    if method in NOT_HEDGED_METHODS:
+        return False
+    return method in HEDGED_METHODS or method.startswith(HEDGED_PREFIXES)
+
+
+def not_sent(error: Exception) -> bool:
+    """
+    Whether a request failed before reaching the node (connection refused,
+    unknown host, open circuit...), so it is safe to send it elsewhere
+    """
+    if isinstance(
+        error,
+        (limits.CircuitOpenError, requests.ConnectTimeout, ConnectionRefusedError),
+    ):
+        return True
+    if isinstance(error, FileNotFoundError):
+        # IPC socket missing
+        return True
+    if isinstance(error, requests.ConnectionError) and error.args:
+        # urllib3 wraps the cause of its last attempt in a MaxRetryError
+        reason = getattr(error.args[0], "reason", error.args[0])
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+# Latencies needed before an endpoint's quantiles are trusted
+MIN_LATENCY_SAMPLES = 10
+
+
+class Endpoint:
+    """
+    One of the endpoints of a FailoverProvider and what was observed of it
+    """
+
+    def __init__(self, provider, samples: int = 200) -> None:
+        self.provider = provider
+        self.latencies = collections.deque(maxlen=samples)
+        self.failures = 0
+        self.dropped_until = 0
+        self.head = None
+        self.lagging = False
+
+    def __str__(self) -> str:
+        return getattr(self.provider, "endpoint_uri", None) or str(self.provider)
+
+    def quantile(self, q: float):
+        """
+        q quantile of the recent latencies, None without enough samples
+        """
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def healthy(self, now: float) -> bool:
+        return not self.lagging and now >= self.dropped_until
+
+
+class FailoverProvider(JSONBaseProvider):
+    """
+    Provider spreading requests over several endpoints of the same chain
+
+    A request goes to the healthy endpoint with the lowest median latency. If
+    it has not answered after the hedge quantile (p95) of its latencies, the
+    same request is sent to the next endpoint and whichever answers first wins.
+    Only the calls which any node answers the same are hedged (see
+    is_hedgeable). The others (transactions, account and admin calls...) are
+    sent to a single endpoint and never fail over once sent, even on a timeout:
+    they only move on to the next endpoint when they could not reach the first
+    one at all (see not_sent).
+
+    An endpoint failing max_failures times in a row is dropped for cooldown
+    seconds; one whose head is more than max_lag blocks behind the others
+    (checked every head_interval seconds) is skipped until it catches up.
+    """
+
+    def __init__(
+        self,
+        providers: list,
+        hedge_quantile: float = 0.95,
+        default_hedge_delay: float = 1.0,
+        min_hedge_delay: float = 0.05,
+        max_failures: int = 3,
+        cooldown: float = 30,
+        max_lag: int = 5,
+        head_interval: float = 15,
+    ) -> None:
+        self.endpoints = [Endpoint(provider) for provider in providers]
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.max_lag = max_lag
+        self.head_interval = head_interval
+        self.hedged = 0
+        self._heads_at = None
+        self._lock = threading.Lock()
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=max(4, 4 * len(self.endpoints))
+        )
+        super().__init__()
+
+    def __str__(self) -> str:
+        return "Failover over {}".format(", ".join(map(str, self.endpoints)))
+
+    def ranked(self) -> list:
+        """
+        Healthy endpoints, fastest first, or all of them if none is healthy
+        """
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if e.healthy(now)] or list(self.endpoints)
+        # Endpoints without enough samples keep their place at the front
+        return sorted(healthy, key=lambda e: e.quantile(0.5) or 0)
+
+    def hedge_delay(self, endpoint: Endpoint) -> float:
+        delay = endpoint.quantile(self.hedge_quantile)
+        if delay is None:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, delay)
+
+    def _call(self, endpoint: Endpoint, send):
+        started = time.monotonic()
+        try:
+            response = send(endpoint.provider)
+        except Exception:
+            with self._lock:
+                endpoint.failures += 1
+                if endpoint.failures >= self.max_failures:
+                    endpoint.dropped_until = time.monotonic() + self.cooldown
+            raise
+        with self._lock:
+            endpoint.latencies.append(time.monotonic() - started)
+            endpoint.failures = 0
+        return response
+
+    def _request(self, send, hedge: bool):
+        self._check_heads()
+        endpoints = self.ranked()
+        if not hedge:
+            for position, endpoint in enumerate(endpoints):
+                try:
+                    return self._call(endpoint, send)
+                except Exception as e:
+                    if position == len(endpoints) - 1 or not not_sent(e):
+                        raise
+
+        # Hedge with the next endpoint once the first is slower than usual, and
+        # fail over to the following ones when all those sent to failed
+        pending = {}
+        error = None
+        for position, endpoint in enumerate(endpoints):
+            pending[self._executor.submit(self._call, endpoint, send)] = endpoint
+            last = position == len(endpoints) - 1
+            while pending:
+                done, _ = futures.wait(
+                    pending,
+                    timeout=None if last else self.hedge_delay(endpoint),
+                    return_when=futures.FIRST_COMPLETED,
+                )
+                if not done:
+                    with self._lock:
+                        self.hedged += 1
+                    break
+                for future in done:
+                    del pending[future]
+                    try:
+                        return future.result()
+                    except Exception as e:
+                        error = e
+                if not last:
+                    break
+        raise error
+
+    def make_request(self, method, params):
+        return self._request(
+            lambda provider: provider.make_request(method, params),
+            is_hedgeable(method),
+        )
+
+    def make_batch_request(self, calls: list) -> list:
+        def send(provider):
+            if hasattr(provider, "make_batch_request"):
+                return provider.make_batch_request(calls)
+            return [provider.make_request(method, params) for method, params in calls]
+
+        return self._request(send, all(is_hedgeable(m) for m, _ in calls))
+
+    def _check_heads(self) -> None:
+        """
+        Ask every endpoint for its head now and then, in the background, and
+        mark the ones too far behind as lagging
+        """
+        now = time.monotonic()
+        with self._lock:
+            if len(self.endpoints) < 2 or (
+                self._heads_at is not None and now - self._heads_at < self.head_interval
+            ):
+                return
+            self._heads_at = now
+
+        def head(endpoint):
+            try:
+                # Not part of the command running meanwhile
+                with metrics.background():
+                    response = endpoint.provider.make_request("eth_blockNumber", [])
+                endpoint.head = int(response["result"], 16)
+            except Exception:
+                endpoint.head = None
+
+        def check():
+            list(self._executor.map(head, self.endpoints))
+            heads = [e.head for e in self.endpoints if e.head is not None]
+            for endpoint in self.endpoints:
+                # Endpoints which did not answer are left to the failure count
+                if endpoint.head is not None:
+                    endpoint.lagging = endpoint.head < max(heads) - self.max_lag
+
+        threading.Thread(target=check, daemon=True).start()
+
+    def status(self) -> list:
+        """
+        (endpoint, p50, p95, state) of every endpoint
+        """
+        now = time.monotonic()
+        return [
+            (
+                str(endpoint),
+                endpoint.quantile(0.5),
+                endpoint.quantile(0.95),
+                (
+                    "lagging"
+                    if endpoint.lagging
+                    else "dropped"
+                    if not endpoint.healthy(now)
+                    else "ok"
+                ),
+            )
+            for endpoint in self.endpoints
+        ]
+
+    def disconnect(self) -> None:
+        for endpoint in self.endpoints:
+            if hasattr(endpoint.provider, "disconnect"):
+                endpoint.provider.disconnect()
@@ -0,0 +1,248 @@
+import json
+import os
+import threading
+
+from legions.utils.cache import CACHE_DIR, LRUCache, SQLiteCache
+
+# Blocks below the head after which a block is considered final
+DEFAULT_CONFIRMATIONS = 12
+
+RPC_CACHE_FILE = os.path.join(CACHE_DIR, "rpc.sqlite")
+
+# Position of the block parameter of the methods whose result is fully
+# determined by it
+BLOCK_PARAMS = {
+    "eth_getBalance": 1,
+    "eth_getCode": 1,
+    "eth_getTransactionCount": 1,
+    "eth_call": 1,
+    "eth_getStorageAt": 2,
+    "eth_getBlockByNumber": 0,
+    "eth_getBlockTransactionCountByNumber": 0,
+    "eth_getTransactionByBlockNumberAndIndex": 0,
+    "eth_getUncleCountByBlockNumber": 0,
+}
+
+# Methods addressing a block by its hash, their result never changes
+BLOCK_HASH_METHODS = [
+    "eth_getBlockByHash",
+    "eth_getBlockTransactionCountByHash",
+    "eth_getTransactionByBlockHashAndIndex",
+    "eth_getUncleCountByBlockHash",
+]
+
+# Methods addressing a transaction, final once its block is
+TRANSACTION_METHODS = ["eth_getTransactionByHash", "eth_getTransactionReceipt"]
+
+
+class RPCCache:
+    """
+    Cache of JSON-RPC results which cannot change anymore
+
+    Results at a block hash, or at a block number at least confirmations blocks
+    below the head, are kept in an in-memory LRU in front of an on-disk store,
+    and shared between sessions. Results of more recent blocks are not cached.
+
+    The head is never fetched for the cache: it is learnt from the
+    eth_blockNumber and latest block answers going through it, and from the
+    last session on the same chain. A block the known head does not prove final
+    is simply not cached. make_request(method, params) is only used to learn the
+    chain, once, when a result may be final: its chainId (Ethereum and Ethereum
+    Classic share their genesis block) and its genesis hash (which tells apart
+    two runs of a development chain). Nodes without eth_chainId are not cached.
+    """
+
+    def __init__(
+        self,
+        make_request,
+        confirmations: int = DEFAULT_CONFIRMATIONS,
+        path: str = RPC_CACHE_FILE,
+        memory_size: int = 4096,
+    ) -> None:
+        self.make_request = make_request
+        self.confirmations = confirmations
+        self.memory = LRUCache(memory_size)
+        self.disk = SQLiteCache(path)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forget the chain and head, e.g. after connecting to another node
+        """
+        with self._lock:
+            self._chain = None
+            self._head_number = None
+
+    def _call(self, method: str, params: list):
+        response = self.make_request(method, params)
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response["result"]
+
+    def chain(self) -> str:
+        if self._chain is None:
+            chain_id = int(self._call("eth_chainId", []), 16)
+            genesis = self._call("eth_getBlockByNumber", ["0x0", False])
+            self._chain = "{}:{}".format(chain_id, genesis["hash"])
+            # The head only moves forward, the one of the last session is
+            # good enough to tell final blocks
+            known_head = self.disk.get(self._key("head"))
+            self._set_head(known_head)
+            if self._head_number is not None and self._head_number != known_head:
+                self.disk.set(self._key("head"), self._head_number)
+        return self._chain
+
+    def _set_head(self, number: int) -> None:
+        if number is None:
+            return
+        with self._lock:
+            if self._head_number is not None and number <= self._head_number:
+                return
+            self._head_number = number
+        if self._chain is not None:
+            self.disk.set(self._key("head"), number)
+
+    def observe(self, method: str, params: list, response: dict) -> None:
+        """
+        Learn the head from a response which tells it
+        """
+        result = response.get("result") if isinstance(response, dict) else None
+        try:
+            if method == "eth_blockNumber" and result is not None:
+                self._set_head(int(result, 16))
+            elif (
+                method == "eth_getBlockByNumber"
+                and params
+                and params[0] == "latest"
+                and isinstance(result, dict)
+            ):
+                self._set_head(int(result["number"], 16))
+        except (TypeError, ValueError, KeyError):
+            pass
+
+    def _key(self, *parts) -> str:
+        return json.dumps([self._chain] + list(parts), sort_keys=True)
+
+    def _final(self, number: int) -> bool:
+        head = self._head_number
+        return head is not None and number <= head - self.confirmations
+
+    @staticmethod
+    def block_of(method: str, params: list):
+        """
+        Block a call is made at: a number, "hash" for calls pinned to a block
+        hash, None if the result may still change (latest, pending...) or the
+        method is not cached at all
+        """
+        if method in BLOCK_HASH_METHODS:
+            return "hash"
+        if method not in BLOCK_PARAMS:
+            return None
+        index = BLOCK_PARAMS[method]
+        block = params[index] if len(params) > index else "latest"
+        if isinstance(block, dict) and "blockHash" in block:
+            return "hash"
+        if block == "earliest":
+            return 0
+        if isinstance(block, int):
+            return block
+        if isinstance(block, str) and block.startswith("0x"):
+            return int(block, 16)
+        return None
+
+    def scope(self, method: str, params: list):
+        """
+        "final" if the result of method(params) may be cached, None otherwise
+        """
+        block = self.block_of(method, params)
+        if block is None:
+            return None
+        if block == "hash":
+            self.chain()
+            return "final"
+        # A block the head seen so far does not prove final needs no chain
+        if self._head_number is not None and not self._final(block):
+            return None
+        self.chain()
+        return "final" if self._final(block) else None
+
+    def get(self, method: str, params: list):
+        """
+        Cached response of method(params), None if not cached
+        """
+        try:
+            if method in TRANSACTION_METHODS:
+                self.chain()
+                scope = "final"
+            else:
+                scope = self.scope(method, params)
+        except Exception:
+            # Cannot tell the chain or head, do not risk a wrong answer
+            return None
+        if scope is None:
+            return None
+        key = self._key(method, params)
+
+        response = self.memory.get(key)
+        if response is None:
+            response = self.disk.get(key)
+            if response is not None:
+                self.memory.set(key, response)
+
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def set(self, method: str, params: list, response: dict) -> None:
+        self.observe(method, params, response)
+        if "error" in response or response.get("result") is None:
+            return
+        try:
+            if method in TRANSACTION_METHODS:
+                self.chain()
+                block = response["result"].get("blockNumber")
+                scope = None
+                if block is not None and self._final(int(block, 16)):
+                    scope = "final"
+            else:
+                scope = self.scope(method, params)
+        except Exception:
+            return
+        if scope is None:
+            return
+        key = self._key(method, params)
+
+        # The id belongs to the request which fetched it
+        response = {"jsonrpc": "2.0", "result": response["result"]}
+        self.memory.set(key, response)
+        self.disk.set(key, response)
+
+    def request(self, method: str, params: list, make_request) -> dict:
+        """
+        Answer from the cache, or through make_request and cache the response
+        """
+        response = self.get(method, params)
+        if response is not None:
+            return dict(response)
+        response = make_request(method, params)
+        self.set(method, params, response)
+        return response
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0,
+            "memory": len(self.memory),
+            "disk": len(self.disk),
+        }
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.disk.clear()
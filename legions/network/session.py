@@ -0,0 +1,56 @@
+# Kept free of web3 imports: this module is loaded when Legions starts, web3 only
+# once a command talks to a node.
+import os
+
+from legions.utils.cache import CACHE_DIR
+
+# Number of calls sent in a single JSON-RPC batch by default
+DEFAULT_BATCH_SIZE = 100
+
+# Blocks per eth_getLogs call to start with
+DEFAULT_LOG_CHUNK = 2000
+
+# Ways of fetching blocks: header fields only, with the transaction hashes or
+# with the full transactions
+BLOCK_MODES = ["header", "hashes", "full"]
+
+# Symbol and decimals of the ERC-20 tokens seen, per chain
+TOKEN_CACHE_FILE = os.path.join(CACHE_DIR, "tokens.json")
+
+
+class LazyWeb3:
+    """
+    Stand-in for the shared Web3 instance. The real one is created and connected
+    to default_node on first use, so neither web3 nor a provider are set up
+    before a command needs them.
+    """
+
+    def __init__(self, default_node: str) -> None:
+        object.__setattr__(self, "_default_node", default_node)
+        object.__setattr__(self, "_w3", None)
+
+    @property
+    def loaded(self) -> bool:
+        return self._w3 is not None
+
+    def _load(self):
+        if self._w3 is None:
+            from legions.network.web3 import Web3
+
+            w3 = Web3()
+            w3.connect(self._default_node)
+            # LEGIONS_RPC_CACHE=0 turns the persistent cache of immutable results off
+            if os.environ.get("LEGIONS_RPC_CACHE", "1") != "0":
+                w3.enable_cache()
+            object.__setattr__(self, "_w3", w3)
+        return self._w3
+
+    def __getattr__(self, name: str):
+        # Dunder lookups (hasattr(w3, "__command") by nubia's command loader,
+        # copy, pickle...) must not trigger the import
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._load(), name, value)
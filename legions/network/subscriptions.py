@@ -0,0 +1,201 @@
+import asyncio
+import collections
+import json
+import queue
+import threading
+import time
+
+# Subscriptions supported by eth_subscribe
+SUBSCRIPTION_TYPES = ["newHeads", "logs", "newPendingTransactions"]
+
+# Events kept waiting for the consumer by default
+DEFAULT_QUEUE_SIZE = 1000
+
+# Seconds over which the event rate is measured
+RATE_WINDOW = 10
+
+# How often blocked loops check whether they were stopped
+POLL_INTERVAL = 0.1
+
+# Last subscription started, shown in the status bar
+_current = None
+
+
+def current():
+    """
+    Most recently started Subscription, None if there never was one
+    """
+    return _current
+
+
+class Subscription:
+    """
+    eth_subscribe stream of a WebSocket node, read on a background thread into a
+    bounded queue
+
+    Once the queue is full the reader stops reading from the socket until the
+    consumer catches up, or discards new events if drop is set. With sample=N
+    only one event out of N is queued.
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        kind: str,
+        params: dict = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        sample: int = 1,
+        drop: bool = False,
+        timeout: float = 10,
+    ) -> None:
+        if kind not in SUBSCRIPTION_TYPES:
+            raise ValueError("Unknown subscription type: {}".format(kind))
+        self.uri = uri
+        self.kind = kind
+        self.params = params
+        self.sample = max(1, sample)
+        self.drop = drop
+        self.timeout = timeout
+        self.subscription_id = None
+        self.events = queue.Queue(maxsize=max(1, queue_size))
+
+        # Counters
+        self.received = 0
+        self.delivered = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.lag = 0.0
+        self.error = None
+
+        self._received_at = collections.deque()
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._thread = None
+        self._started = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and not self._done.is_set()
+
+    @property
+    def rate(self) -> float:
+        """
+        Events received per second over the last RATE_WINDOW seconds
+        """
+        now = time.monotonic()
+        while self._received_at and self._received_at[0] < now - RATE_WINDOW:
+            self._received_at.popleft()
+        if self._started is None:
+            return 0.0
+        # Over the time watched so far while the window is not full yet
+        return len(self._received_at) / max(min(RATE_WINDOW, now - self._started), 1)
+
+    def start(self) -> "Subscription":
+        global _current
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        _current = self
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.timeout)
+
+    def get(self, timeout: float = None):
+        """
+        Next event, None once the subscription ended or after timeout seconds
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = POLL_INTERVAL
+            if end is not None:
+                wait = min(wait, end - time.monotonic())
+                if wait <= 0:
+                    return None
+            try:
+                queued_at, event = self.events.get(timeout=wait)
+            except queue.Empty:
+                if self._done.is_set() and self.events.empty():
+                    return None
+                continue
+            self.delivered += 1
+            self.lag = time.monotonic() - queued_at
+            return event
+
+    def __iter__(self):
+        while True:
+            event = self.get()
+            if event is None:
+                return
+            yield event
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._listen())
+        except Exception as e:
+            self.error = e
+        finally:
+            loop.close()
+            self._done.set()
+
+    async def _listen(self) -> None:
+        import websockets
+
+        async with websockets.connect(self.uri, max_size=None) as ws:
+            params = [self.kind] + ([self.params] if self.params else [])
+            await ws.send(
+                json.dumps(
+                    {
+                        "jsonrpc": "2.0",
+                        "id": 1,
+                        "method": "eth_subscribe",
+                        "params": params,
+                    }
+                )
+            )
+            reply = json.loads(await asyncio.wait_for(ws.recv(), self.timeout))
+            if "error" in reply:
+                raise ValueError(reply["error"].get("message", reply["error"]))
+            self.subscription_id = reply["result"]
+
+            while not self._stop.is_set():
+                try:
+                    message = await asyncio.wait_for(ws.recv(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    continue
+                message = json.loads(message)
+                if message.get("method") != "eth_subscription":
+                    continue
+                self.received += 1
+                self._received_at.append(time.monotonic())
+                if (self.received - 1) % self.sample:
+                    self.skipped += 1
+                    continue
+                await self._put((time.monotonic(), message["params"]["result"]))
+
+            await ws.send(
+                json.dumps(
+                    {
+                        "jsonrpc": "2.0",
+                        "id": 2,
+                        "method": "eth_unsubscribe",
+                        "params": [self.subscription_id],
+                    }
+                )
+            )
+
+    async def _put(self, item) -> None:
+        while not self._stop.is_set():
+            try:
+                self.events.put_nowait(item)
+                return
+            except queue.Full:
+                if self.drop:
+                    self.dropped += 1
+                    return
+            # Not reading the socket meanwhile pushes back on the node
+            await asyncio.sleep(POLL_INTERVAL / 10)
@@ -0,0 +1,77 @@
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+# Keep-alive connections kept open per host
+DEFAULT_POOL_SIZE = 10
+
+# Send small JSON-RPC requests right away and notice dead idle connections
+SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+
+_session = None
+_pool_size = DEFAULT_POOL_SIZE
+_lock = threading.Lock()
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """
+    HTTPAdapter keeping pool_size connections per host open, with TCP_NODELAY
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE) -> None:
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = SOCKET_OPTIONS
+        return super().init_poolmanager(*args, **kwargs)
+
+
+def _mount(session: requests.Session, pool_size: int) -> None:
+    # Close the replaced adapter, or its pools keep their sockets open
+    replaced = {session.adapters.get(prefix) for prefix in ("http://", "https://")}
+    for old in replaced - {None}:
+        old.close()
+    adapter = KeepAliveAdapter(pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+def get_session() -> requests.Session:
+    """
+    requests Session shared by every HTTP call Legions makes (node, ENS subgraph...)
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            _mount(_session, _pool_size)
+        return _session
+
+
+def set_pool_size(pool_size: int) -> None:
+    """
+    Number of keep-alive connections kept per host, takes effect on new pools
+    """
+    global _pool_size
+    if pool_size < 1:
+        raise ValueError("The pool size must be at least 1")
+    with _lock:
+        if pool_size == _pool_size:
+            return
+        _pool_size = pool_size
+        if _session is not None:
+            _mount(_session, pool_size)
+
+
+def post(url: str, timeout: float = 10, **kwargs) -> requests.Response:
+    return get_session().post(url, timeout=timeout, **kwargs)
+
+
+def get(url: str, timeout: float = 10, **kwargs) -> requests.Response:
+    return get_session().get(url, timeout=timeout, **kwargs)
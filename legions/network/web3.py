@@ -1,7 +1,78 @@
+import collections
 import os
+import itertools
+import time
+from concurrent import futures
 
+from hexbytes import HexBytes
 from web3 import Web3 as _web3
-from web3 import IPCProvider, HTTPProvider, WebsocketProvider
+from web3 import HTTPProvider
+
+from legions.network import limits, transport
+from legions.network.multicall import (
+    BALANCE_OF,
+    DECIMALS,
+    DEFAULT_MULTICALL_SIZE,
+    SYMBOL,
+    Multicall,
+    decode_symbol,
+)
+from legions.network.providers import (
+    BatchHTTPProvider,
+    FailoverProvider,
+    MeteredWebsocketProvider,
+    PipelinedIPCProvider,
+)
+from legions.network.rpc_cache import DEFAULT_CONFIRMATIONS, RPC_CACHE_FILE, RPCCache
+from legions.network.session import (
+    BLOCK_MODES,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_LOG_CHUNK,
+)
+from legions.utils.concurrency import map_ordered
+
+# Most blocks per eth_getLogs call
+MAX_LOG_CHUNK = 500000
+
+# Chunks returning fewer logs than this are doubled for the next calls
+LOG_GROWTH_THRESHOLD = 1000
+
+# Error messages (and code) of nodes refusing a range with too many results
+LOG_LIMIT_ERRORS = [
+    "more than",
+    "too many",
+    "too large",
+    "response size",
+    "block range",
+    "range is too",
+    "limit exceeded",
+    "query timeout",
+    "timed out",
+]
+LOG_LIMIT_CODE = -32005
+
+
+def is_log_limit_error(error: dict) -> bool:
+    """
+    Whether an eth_getLogs error means the range has to be narrowed
+    """
+    message = str(error.get("message", "")).lower()
+    return error.get("code") == LOG_LIMIT_CODE or any(
+        limit in message for limit in LOG_LIMIT_ERRORS
+    )
+
+
+def rpc_cache_middleware(make_request, w3):
+    """
+    Answer immutable calls from w3.rpc_cache when it is enabled
+    """
+
+    def middleware(method, params):
+        if w3.rpc_cache is None:
+            return make_request(method, params)
+        return w3.rpc_cache.request(method, params, make_request)
+
+    return middleware
 
 
 class Web3(_web3):
@@ -12,25 +83,466 @@ class Web3(_web3):
     def __init__(self) -> None:
         self.node_uri = None
 
+        # Pinned block session mode, see pin_block()
+        self.block_pinning = False
+        self.pinned_block = None
+        self.pin_ttl = None
+        self._pinned_at = None
+
+        # Cache of immutable results, see enable_cache()
+        self.rpc_cache = None
+
         super().__init__(HTTPProvider("null"))
+        # Innermost, so it sees the calls and responses as sent over the wire
+        self.middleware_onion.inject(rpc_cache_middleware, "rpc_cache", layer=0)
+
+    def connect(self, node: str, timeout: int = 10, pool_size: int = None) -> None:
+        """
+        Point the provider at node (HTTP(S) URL, ws:// URL or IPC path)
 
-    def connect(self, node: str, timeout: int = 10) -> None:
+        HTTP nodes share the keep-alive session of legions.network.transport,
+        pool_size sets how many connections it keeps open per host.
+
+        Several nodes of the same chain, separated by commas, are used together
+        through a FailoverProvider (hedged requests, failover).
+        """
+        if pool_size is not None:
+            transport.set_pool_size(pool_size)
+        if hasattr(self.provider, "disconnect"):
+            self.provider.disconnect()
         self.node_uri = node
+        # The snapshot belongs to the previous node, take a new one on next use
+        self.pinned_block = None
+        if self.rpc_cache is not None:
+            self.rpc_cache.reset()
+
+        nodes = [n.strip() for n in node.split(",") if n.strip()]
+        if len(nodes) > 1:
+            self.provider = FailoverProvider(
+                [self.make_provider(n, timeout) for n in nodes]
+            )
+        else:
+            self.provider = self.make_provider(node, timeout)
 
+    @staticmethod
+    def make_provider(node: str, timeout: int = 10):
+        """
+        Provider of a single node (HTTP(S) URL, ws:// URL or IPC path)
+        """
         try:
             if os.path.exists(node):
-                self.provider = IPCProvider(node)
-                return
+                return PipelinedIPCProvider(node, timeout=timeout)
         except OSError:
             pass
 
         if node.startswith("https://") or node.startswith("http://"):
-            self.provider = HTTPProvider(node, request_kwargs={"timeout": timeout})
-        elif node.startswith("ws://"):
-            self.provider = WebsocketProvider(
-                node, websocket_kwargs={"timeout": timeout}
+            return BatchHTTPProvider(node, request_kwargs={"timeout": timeout})
+        elif node.startswith("ws://") or node.startswith("wss://"):
+            return MeteredWebsocketProvider(node, websocket_kwargs={"timeout": timeout})
+        else:
+            raise ValueError(
+                "The provided node is not valid. It must start with 'http://' or 'https://' or 'ws://' or 'wss://' or a path to an IPC socket file."
             )
+
+    def set_limits(self, **settings) -> list:
+        """
+        Configure the rate limit, retries and circuit breaker (see
+        legions.network.limits.configure) of the HTTP node(s) connected to
+        """
+        providers = getattr(self.provider, "endpoints", None)
+        if providers is None:
+            providers = [self.provider]
         else:
+            providers = [endpoint.provider for endpoint in providers]
+        return [
+            limits.configure(provider.endpoint_uri, **settings)
+            for provider in providers
+            if isinstance(provider, BatchHTTPProvider)
+        ]
+
+    def enable_cache(
+        self, confirmations: int = DEFAULT_CONFIRMATIONS, path: str = RPC_CACHE_FILE
+    ) -> RPCCache:
+        """
+        Cache the results which can no longer change (at a block hash, or at a
+        block at least confirmations deep) in memory and on disk at path
+        """
+        self.rpc_cache = RPCCache(
+            lambda method, params: self.provider.make_request(method, params),
+            confirmations=confirmations,
+            path=path,
+        )
+        return self.rpc_cache
+
+    def disable_cache(self) -> None:
+        self.rpc_cache = None
+
+    def pin_block(self, ttl: int = None) -> int:
+        """
+        Snapshot the head block and use it for every query without an explicit
+        block, until refreshed (pin_block again) or ttl seconds have passed
+        """
+        self.block_pinning = True
+        self.pin_ttl = ttl
+        self.pinned_block = self.eth.blockNumber
+        self._pinned_at = time.monotonic()
+        return self.pinned_block
+
+    def unpin_block(self) -> None:
+        self.block_pinning = False
+        self.pinned_block = None
+        self.pin_ttl = None
+        self._pinned_at = None
+
+    def resolve_block(self, block=None):
+        """
+        Block to run a query at: block if given, else the pinned block, else the
+        current head
+        """
+        if block is not None:
+            return block
+        if not self.block_pinning:
+            return self.eth.blockNumber
+        if self.pinned_block is None or (
+            self.pin_ttl and time.monotonic() - self._pinned_at > self.pin_ttl
+        ):
+            self.pin_block(self.pin_ttl)
+        return self.pinned_block
+
+    def batch_request(self, calls, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        Send (method, params) calls in batches of batch_size and yield the raw
+        JSON-RPC responses in the order of the calls.
+
+        calls can be any iterable (e.g. a generator), only one batch is kept in
+        memory at a time. Providers without batch support get the calls one by one.
+        """
+        calls = iter(calls)
+        while True:
+            chunk = list(itertools.islice(calls, max(1, batch_size)))
+            if not chunk:
+                return
+            responses = [None] * len(chunk)
+            if self.rpc_cache is not None:
+                responses = [self.rpc_cache.get(*call) for call in chunk]
+            missing = [i for i, response in enumerate(responses) if response is None]
+            if hasattr(self.provider, "make_batch_request") and missing:
+                fetched = self.provider.make_batch_request([chunk[i] for i in missing])
+            else:
+                fetched = (self.provider.make_request(*chunk[i]) for i in missing)
+            for i, response in zip(missing, fetched):
+                responses[i] = response
+                if self.rpc_cache is not None:
+                    self.rpc_cache.set(*chunk[i], response)
+            yield from responses
+
+    def iter_storage(
+        self,
+        address: str,
+        start: int,
+        count: int,
+        block=None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        """
+        Yield (slot, value) for count storage slots of address starting at start,
+        reading every slot once through batch_request
+        """
+        block_identifier = "latest" if block is None else block
+        if isinstance(block_identifier, int):
+            block_identifier = hex(block_identifier)
+
+        slots = range(start, start + count)
+        calls = (
+            ("eth_getStorageAt", [address, hex(slot), block_identifier])
+            for slot in slots
+        )
+        for slot, response in zip(slots, self.batch_request(calls, batch_size)):
+            if "error" in response:
+                raise ValueError(response["error"])
+            yield slot, HexBytes(response["result"])
+
+    def iter_blocks(
+        self,
+        start: int,
+        end: int,
+        mode: str = "hashes",
+        batch_size: int = 20,
+        concurrency: int = 4,
+    ):
+        """
+        Yield the blocks start to end (included) in order, as returned by the node
+
+        The range is fetched in batches of batch_size blocks, concurrency batches
+        at a time, and each block is yielded as soon as all the ones before it are.
+        """
+        if mode not in BLOCK_MODES:
             raise ValueError(
-                "The provided node is not valid. It must start with 'http://' or 'https://' or 'ws://' or a path to an IPC socket file."
+                "Unknown mode {}, expected one of {}".format(mode, BLOCK_MODES)
             )
+        batch_size = max(1, batch_size)
+
+        def fetch(first):
+            numbers = range(first, min(first + batch_size, end + 1))
+            calls = [
+                ("eth_getBlockByNumber", [hex(number), mode == "full"])
+                for number in numbers
+            ]
+            return list(zip(numbers, self.batch_request(calls, batch_size)))
+
+        for chunk in map_ordered(
+            fetch, range(start, end + 1, batch_size), max_workers=concurrency
+        ):
+            for number, response in chunk:
+                if "error" in response:
+                    raise ValueError(
+                        "Failed to fetch block {}: {}".format(
+                            number, response["error"].get("message", response["error"])
+                        )
+                    )
+                block = response["result"]
+                if block is None:
+                    raise ValueError("Block {} does not exist yet".format(number))
+                if mode == "header":
+                    # A copy, the response may be shared with the RPC cache
+                    block = {
+                        key: value
+                        for key, value in block.items()
+                        if key not in ("transactions", "uncles")
+                    }
+                yield block
+
+    def iter_logs(
+        self,
+        start: int,
+        end: int,
+        address=None,
+        topics: list = None,
+        chunk_size: int = DEFAULT_LOG_CHUNK,
+        concurrency: int = 4,
+    ):
+        """
+        Yield the logs of blocks start to end (included) matching the address and
+        topics filters, in block order
+
+        The range is queried in chunks, concurrency at a time. A chunk the node
+        refuses for returning too much is split in two and retried, and the chunk
+        size grows back while chunks return few logs.
+        """
+        log_filter = {}
+        if address:
+            log_filter["address"] = address
+        if topics:
+            log_filter["topics"] = topics
+
+        def fetch(first, last):
+            params = dict(log_filter, fromBlock=hex(first), toBlock=hex(last))
+            try:
+                return self.provider.make_request("eth_getLogs", [params])
+            except Exception as e:
+                # e.g. the HTTP request timed out on a huge range
+                return {"error": {"message": str(e)}}
+
+        executor = futures.ThreadPoolExecutor(max_workers=max(1, concurrency))
+        pending = collections.deque()
+        size = max(1, chunk_size)
+        next_start = start
+
+        def submit(first, last):
+            return first, last, executor.submit(fetch, first, last)
+
+        try:
+            while pending or next_start <= end:
+                while len(pending) < concurrency and next_start <= end:
+                    last = min(next_start + size - 1, end)
+                    pending.append(submit(next_start, last))
+                    next_start = last + 1
+
+                first, last, future = pending.popleft()
+                response = future.result()
+                error = response.get("error")
+                if error is not None:
+                    if not is_log_limit_error(error) or first == last:
+                        raise ValueError(
+                            "Failed to get logs of blocks {} - {}: {}".format(
+                                first, last, error.get("message", error)
+                            )
+                        )
+                    # Retry both halves before anything after them
+                    middle = (first + last) // 2
+                    size = max(1, (last - first + 1) // 2)
+                    pending.appendleft(submit(middle + 1, last))
+                    pending.appendleft(submit(first, middle))
+                    continue
+
+                logs = response["result"]
+                if len(logs) < LOG_GROWTH_THRESHOLD:
+                    size = min(size * 2, MAX_LOG_CHUNK)
+                yield from logs
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def iter_balances(
+        self,
+        addresses,
+        block: int,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        concurrency: int = 4,
+        multicall: bool = None,
+    ):
+        """
+        Yield (address, wei) for every address at block, in order
+
+        Balances are read with Multicall3's getEthBalance, DEFAULT_MULTICALL_SIZE
+        per eth_call, when the contract is deployed at block (or multicall is
+        True), and with JSON-RPC batches of eth_getBalance otherwise or when the
+        detected contract refuses the call. concurrency calls are in flight at
+        once. A balance which could not be read is None.
+        """
+        detect = multicall is None
+        if detect:
+            multicall = Multicall(self, block).available()
+        aggregator = Multicall(self, block) if multicall else None
+        chunk_size = DEFAULT_MULTICALL_SIZE if multicall else batch_size
+
+        def fetch_balances(chunk):
+            calls = [("eth_getBalance", [a, hex(block)]) for a in chunk]
+            return [
+                int(response["result"], 16) if "result" in response else None
+                for response in self.batch_request(calls, batch_size)
+            ]
+
+        def chunks():
+            addresses_ = iter(addresses)
+            while True:
+                chunk = list(itertools.islice(addresses_, max(1, chunk_size)))
+                if not chunk:
+                    return
+                yield chunk
+
+        def fetch(chunk):
+            if aggregator is None:
+                return list(zip(chunk, fetch_balances(chunk)))
+            try:
+                results = aggregator.aggregate(
+                    [aggregator.eth_balance_call(address) for address in chunk]
+                )
+            except ValueError:
+                if not detect:
+                    raise
+                # Some contract is there but does not behave like Multicall3
+                return list(zip(chunk, fetch_balances(chunk)))
+            balances = [
+                self.toInt(data) if success and data else None
+                for success, data in results
+            ]
+            return list(zip(chunk, balances))
+
+        for balances in map_ordered(fetch, chunks(), max_workers=concurrency):
+            yield from balances
+
+    def iter_calls(
+        self,
+        calls,
+        block: int,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        concurrency: int = 4,
+        multicall: bool = None,
+    ):
+        """
+        Yield (success, return data) of every (target, calldata) eth_call at
+        block, in order
+
+        Calls are aggregated by Multicall3, DEFAULT_MULTICALL_SIZE per eth_call,
+        when the contract is deployed at block (or multicall is True), and sent
+        as JSON-RPC batches of eth_call otherwise.
+        """
+        if multicall is None:
+            multicall = Multicall(self, block).available()
+        aggregator = Multicall(self, block) if multicall else None
+        chunk_size = DEFAULT_MULTICALL_SIZE if multicall else batch_size
+
+        def chunks():
+            calls_ = iter(calls)
+            while True:
+                chunk = list(itertools.islice(calls_, max(1, chunk_size)))
+                if not chunk:
+                    return
+                yield chunk
+
+        def fetch(chunk):
+            if aggregator is not None:
+                return aggregator.aggregate(chunk)
+            requests = [
+                ("eth_call", [{"to": target, "data": self.toHex(data)}, hex(block)])
+                for target, data in chunk
+            ]
+            return [
+                (
+                    (True, self.toBytes(hexstr=response["result"]))
+                    if "result" in response
+                    else (False, b"")
+                )
+                for response in self.batch_request(requests, batch_size)
+            ]
+
+        for results in map_ordered(fetch, chunks(), max_workers=concurrency):
+            yield from results
+
+    def token_metadata(self, tokens: list, block: int, cache=None, **kwargs) -> dict:
+        """
+        {"symbol", "decimals"} of every token, None for the fields a token does
+        not answer
+
+        Tokens found in cache (a JSONFileCache) are not queried, the others are
+        read at block with iter_calls(**kwargs) and added to it.
+        """
+        chain = self.eth.chainId
+        metadata = {}
+        missing = []
+        for token in tokens:
+            known = cache.get("{}:{}".format(chain, token.lower())) if cache else None
+            if known is None:
+                missing.append(token)
+            else:
+                metadata[token] = known
+
+        calls = []
+        for token in missing:
+            calls.append(Multicall.token_call(token, SYMBOL))
+            calls.append(Multicall.token_call(token, DECIMALS))
+        results = list(self.iter_calls(calls, block, **kwargs))
+
+        for position, token in enumerate(missing):
+            (symbol_ok, symbol), (decimals_ok, decimals) = results[
+                2 * position : 2 * position + 2
+            ]
+            try:
+                symbol = decode_symbol(symbol) if symbol_ok and symbol else None
+            except Exception:
+                symbol = None
+            decimals = self.toInt(decimals) if decimals_ok and decimals else None
+            if decimals is not None and decimals > 255:
+                decimals = None
+            metadata[token] = {"symbol": symbol, "decimals": decimals}
+            if cache is not None and symbol is not None and decimals is not None:
+                cache.set("{}:{}".format(chain, token.lower()), metadata[token])
+        return metadata
+
+    def iter_token_balances(self, holders, tokens: list, block: int, **kwargs):
+        """
+        Yield (holder, token, balance) for every holder and token at block, in
+        order, balance being None when balanceOf failed
+
+        The balanceOf calls go through iter_calls(**kwargs).
+        """
+        pairs, pairs_ = itertools.tee(
+            (holder, token) for holder in holders for token in tokens
+        )
+        calls = (Multicall.token_call(t, BALANCE_OF, h) for h, t in pairs_)
+        for (holder, token), (success, data) in zip(
+            pairs, self.iter_calls(calls, block, **kwargs)
+        ):
+            yield holder, token, self.toInt(data) if success and len(data) else None
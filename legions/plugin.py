@@ -4,10 +4,18 @@
 
 
 import argparse
+import json
+import os
 from legions.context import LegionContext
+from legions.network import metrics
 from legions.statusbar import LegionStatusBar
 from nubia import PluginInterface, CompletionDataSource
 from nubia.internal.blackcmd import CommandBlacklist
+from nubia.internal.usage_logger_interface import UsageLoggerInterface
+
+# File the RPC metrics are written to (as JSON) after a command run from the
+# command line, where the stats command cannot see them
+RPC_STATS_ENV = "LEGIONS_RPC_STATS"
 
 
 class LegionPlugin(PluginInterface):
@@ -75,7 +83,7 @@ class LegionPlugin(PluginInterface):
         Override this and return you own usage logger.
         Must be a subtype of UsageLoggerInterface.
         """
-        return None
+        return RPCMetricsLogger(context)
 
     def get_status_bar(self, context):
         """
@@ -90,6 +98,29 @@ class LegionPlugin(PluginInterface):
         return blacklister
 
 
+class RPCMetricsLogger(UsageLoggerInterface):
+    """
+    Records the RPC calls of every command separately (see the stats command)
+    """
+
+    def pre_exec(self):
+        metrics.start_command()
+
+    def post_exec(self, cmd, params, result, is_cli):
+        # Interactive params are the rest of the line, cli ones the whole argv
+        words = params.split() if isinstance(params, str) else list(params or [])
+        if is_cli and cmd in words:
+            words = words[words.index(cmd) + 1 :]
+        if words and "=" not in words[0] and not words[0].startswith("-"):
+            cmd = "{} {}".format(cmd, words[0])
+        metrics.end_command(cmd, result)
+
+        path = os.environ.get(RPC_STATS_ENV)
+        if is_cli and path:
+            with open(path, "w") as f:
+                json.dump(metrics.export(), f, indent=2)
+
+
 class ConfigFileCompletionDataSource(CompletionDataSource):
     def get_all(self):
         return ["/tmp/c1", "/tmp/c2"]
@@ -4,6 +4,8 @@
 from pygments.token import Token
 
 from legions.context import context
+from legions.commands.commands import w3
+from legions.network import metrics, subscriptions
 from nubia import statusbar
 
 
@@ -25,10 +27,52 @@ class LegionStatusBar(statusbar.StatusBar):
             is_verbose = (Token.Warn, "ON")
         else:
             is_verbose = (Token.Info, "OFF")
-        return [
+        tokens = [
             (Token.Toolbar, "Legions"),
             spacer,
             (Token.Toolbar, "Verbose "),
             spacer,
             is_verbose,
         ]
+        # Do not load web3 just to draw the status bar
+        if w3.loaded and w3.block_pinning:
+            tokens.extend(
+                [
+                    spacer,
+                    (Token.Toolbar, "Block "),
+                    spacer,
+                    (Token.Info, "#{} (pinned)".format(w3.pinned_block)),
+                ]
+            )
+        last = metrics.last_command()
+        if last is not None and last.requests:
+            total = last.total()
+            tokens.extend(
+                [
+                    spacer,
+                    (Token.Toolbar, "RPC "),
+                    spacer,
+                    (
+                        Token.Warn if total.errors else Token.Info,
+                        "{} calls p50 {:.0f}ms".format(
+                            total.calls, metrics.quantile(total.samples, 0.5) * 1000
+                        ),
+                    ),
+                ]
+            )
+        subscription = subscriptions.current()
+        if subscription is not None and subscription.running:
+            tokens.extend(
+                [
+                    spacer,
+                    (Token.Toolbar, "Watch {}".format(subscription.kind)),
+                    spacer,
+                    (
+                        Token.Warn if subscription.dropped else Token.Info,
+                        "{:.1f}/s lag {:.2f}s dropped {}".format(
+                            subscription.rate, subscription.lag, subscription.dropped
+                        ),
+                    ),
+                ]
+            )
+        return tokens
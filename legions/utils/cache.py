@@ -0,0 +1,140 @@
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Directory holding the caches kept between Legions sessions
+CACHE_DIR = os.environ.get(
+    "LEGIONS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".legions")
+)
+
+
+class JSONFileCache:
+    """
+    Key/value store persisted as a single JSON file, with an optional TTL on reads
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                # Missing or corrupted cache, start over
+                self._entries = {}
+        return self._entries
+
+    def get(self, key: str, ttl: float = None):
+        """
+        Value stored under key, None if missing or older than ttl seconds
+        """
+        with self._lock:
+            entry = self._load().get(key)
+        if entry is None:
+            return None
+        if ttl is not None and time.time() - entry["stored"] > ttl:
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            self._load()[key] = {"stored": time.time(), "value": value}
+
+    def save(self) -> None:
+        with self._lock:
+            entries = dict(self._load())
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Write to a temporary file first so a crash never leaves a broken cache
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, default=str)
+        os.replace(tmp_path, self.path)
+
+
+class LRUCache:
+    """
+    Thread safe mapping keeping only the maxsize most recently used entries
+    """
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache:
+    """
+    Key/value store kept in a SQLite database, for caches too large to be
+    rewritten as a whole like JSONFileCache
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT)"
+            )
+        return self._db
+
+    def get(self, key: str):
+        """
+        Value stored under key, None if missing
+        """
+        with self._lock:
+            row = (
+                self._connect()
+                .execute("SELECT value FROM cache WHERE key = ?", (key,))
+                .fetchone()
+            )
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            with self._connect() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                    (key, json.dumps(value)),
+                )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            with self._connect() as db:
+                db.execute("DELETE FROM cache")
@@ -0,0 +1,185 @@
+import glob
+import json
+import os
+import threading
+
+from legions.utils.cache import CACHE_DIR
+
+# Chain list bundled with Legions, source: https://chainid.network/
+CHAINS_FILE = os.path.join(os.path.dirname(__file__), "chains.json")
+
+# Parsed chains, rebuilt whenever a chain file changes. Stored as JSON, never
+# pickle: the cache directory may be writable by someone else.
+CHAINS_CACHE_FILE = os.path.join(CACHE_DIR, "chains-cache.json")
+
+# Chain files of private networks, in the same format as chains.json (a list of
+# chains or a single one). Their chains take precedence over the bundled ones.
+USER_CHAINS_DIR = os.path.join(CACHE_DIR, "chains")
+USER_CHAINS_ENV = "LEGIONS_CHAINS"  # more files, separated by os.pathsep
+
+# Bumped whenever the layout of the cache changes
+CACHE_VERSION = 2
+
+
+def user_chain_files() -> list:
+    files = sorted(glob.glob(os.path.join(USER_CHAINS_DIR, "*.json")))
+    return files + [
+        path for path in os.environ.get(USER_CHAINS_ENV, "").split(os.pathsep) if path
+    ]
+
+
+class ChainRegistry:
+    """
+    Chains known to Legions, indexed by chainId, networkId and shortName
+
+    The chain files are only read on the first lookup, and only when they
+    changed since the indexes were last cached on disk (at cache_path, None not
+    to cache them).
+    """
+
+    def __init__(self, files: list = None, cache_path: str = CHAINS_CACHE_FILE) -> None:
+        # Without files, the bundled chains and the user chain files
+        if files is None:
+            files = [CHAINS_FILE] + user_chain_files()
+        self.files = list(files)
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._chains = None
+
+    def add_file(self, path: str) -> None:
+        """
+        Add the chains of a user file, overriding the known ones with the same id
+        """
+        with self._lock:
+            self.files.append(path)
+            self._chains = None
+
+    def _signature(self) -> list:
+        # Lists, not tuples, to compare equal once read back from the JSON cache
+        signature = []
+        for path in self.files:
+            try:
+                stat = os.stat(path)
+                signature.append([os.path.abspath(path), stat.st_mtime, stat.st_size])
+            except OSError:
+                signature.append([os.path.abspath(path), None, None])
+        return signature
+
+    def _parse(self) -> list:
+        chains = {}
+        for path in self.files:
+            try:
+                with open(path, "r") as f:
+                    content = json.load(f)
+            except (OSError, ValueError) as e:
+                print("Failed to load chains from {} - {}".format(path, e))
+                continue
+            for chain in content if isinstance(content, list) else [content]:
+                if isinstance(chain, dict) and "chainId" in chain:
+                    chains[int(chain["chainId"])] = chain
+        return list(chains.values())
+
+    def _read_cache(self, signature: list) -> dict:
+        if self.cache_path is None:
+            return None
+        try:
+            with open(self.cache_path, "r") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            # Missing or corrupted cache, parse the files again
+            return None
+        if not isinstance(cached, dict):
+            return None
+        if cached.get("version") != CACHE_VERSION or cached.get("files") != signature:
+            return None
+        return cached
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._chains is not None:
+                return
+            signature = self._signature()
+            cached = self._read_cache(signature)
+            if cached is not None:
+                self._index(cached["chains"])
+                return
+
+            self._index(self._parse())
+            if self.cache_path is not None:
+                self._save(signature)
+
+    def _index(self, chains: list) -> None:
+        # Rebuilt rather than cached: JSON would turn the int keys into strings
+        self._by_chain_id = {}
+        self._by_network_id = {}
+        self._by_short_name = {}
+        for position, chain in enumerate(chains):
+            self._by_chain_id[int(chain["chainId"])] = position
+            if chain.get("networkId") is not None:
+                self._by_network_id.setdefault(int(chain["networkId"]), []).append(
+                    position
+                )
+            if chain.get("shortName"):
+                self._by_short_name[chain["shortName"].lower()] = position
+        self._chains = chains
+
+    def _save(self, signature: list) -> None:
+        cached = {
+            "version": CACHE_VERSION,
+            "files": signature,
+            "chains": self._chains,
+        }
+        try:
+            os.makedirs(
+                os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True
+            )
+            # Write to a temporary file first so a crash never leaves a broken cache
+            tmp_path = "{}.{}.tmp".format(self.cache_path, os.getpid())
+            with open(tmp_path, "w") as f:
+                json.dump(cached, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            # A read-only home only costs parsing the files on every run
+            pass
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self._chains)
+
+    def __iter__(self):
+        self._load()
+        return iter(self._chains)
+
+    def by_chain_id(self, chain_id: int) -> dict:
+        """
+        Chain with this chainId, None if unknown
+        """
+        self._load()
+        position = self._by_chain_id.get(int(chain_id))
+        return None if position is None else self._chains[position]
+
+    def by_network_id(self, network_id: int) -> list:
+        """
+        Chains with this networkId (several chains may share one)
+        """
+        self._load()
+        return [self._chains[p] for p in self._by_network_id.get(int(network_id), [])]
+
+    def by_short_name(self, short_name: str) -> dict:
+        """
+        Chain with this shortName (case insensitive), None if unknown
+        """
+        self._load()
+        position = self._by_short_name.get(short_name.lower())
+        return None if position is None else self._chains[position]
+
+    def name(self, chain_id: int) -> str:
+        """
+        Name of the chain with this chainId, None if unknown
+        """
+        chain = self.by_chain_id(chain_id)
+        return None if chain is None else chain.get("name")
+
+
+# Shared by every command, loaded on first use
+registry = ChainRegistry()
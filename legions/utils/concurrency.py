@@ -0,0 +1,101 @@
+import collections
+import itertools
+import time
+from concurrent import futures
+
+# How often queued tasks are checked for having started (and their timeout begun)
+POLL_INTERVAL = 0.05
+
+
+def run_concurrently(
+    tasks: dict, max_workers: int = 8, timeout: float = None, total_timeout=None
+):
+    """
+    Run the callables of tasks (name -> callable) on a thread pool and yield
+    (name, result, error) as soon as each one finishes.
+
+    A task running for longer than timeout seconds, or still unfinished once the
+    total_timeout budget is spent, is yielded with a futures.TimeoutError instead
+    of holding back the others. Its thread is left to finish in the background.
+    """
+    executor = futures.ThreadPoolExecutor(max_workers=max(1, max_workers))
+    started = {}
+
+    def track(name, fn):
+        def run():
+            started[name] = time.monotonic()
+            return fn()
+
+        return run
+
+    names = {executor.submit(track(name, fn)): name for name, fn in tasks.items()}
+    pending = set(names)
+    budget_end = None if total_timeout is None else time.monotonic() + total_timeout
+
+    def deadline(future):
+        ends = []
+        if timeout is not None and names[future] in started:
+            ends.append(started[names[future]] + timeout)
+        if budget_end is not None:
+            ends.append(budget_end)
+        return min(ends) if ends else None
+
+    try:
+        while pending:
+            deadlines = [d for d in map(deadline, pending) if d is not None]
+            if timeout is not None and any(names[f] not in started for f in pending):
+                deadlines.append(time.monotonic() + POLL_INTERVAL)
+            wait_for = None
+            if deadlines:
+                wait_for = max(0, min(deadlines) - time.monotonic())
+            done, pending = futures.wait(
+                pending, timeout=wait_for, return_when=futures.FIRST_COMPLETED
+            )
+
+            for future in done:
+                try:
+                    yield names[future], future.result(), None
+                except Exception as e:
+                    yield names[future], None, e
+
+            now = time.monotonic()
+            expired = {
+                f for f in pending if deadline(f) is not None and deadline(f) <= now
+            }
+            for future in expired:
+                future.cancel()
+                yield names[future], None, futures.TimeoutError(
+                    "timed out after {:.1f}s".format(
+                        now - started.get(names[future], now)
+                    )
+                )
+            pending -= expired
+    finally:
+        executor.shutdown(wait=False)
+
+
+def map_ordered(fn, items, max_workers: int = 8, prefetch: int = None):
+    """
+    Apply fn to items on a thread pool and yield the results in the order of
+    items, each one as soon as it and all the earlier ones are done.
+
+    At most prefetch (default twice max_workers) items are in flight, so items
+    may be a long generator and a slow consumer does not pile up results. An
+    exception raised by fn is raised when its result is reached.
+    """
+    items = iter(items)
+    prefetch = max(1, prefetch or 2 * max_workers)
+    executor = futures.ThreadPoolExecutor(max_workers=max(1, max_workers))
+    pending = collections.deque(
+        executor.submit(fn, item) for item in itertools.islice(items, prefetch)
+    )
+    try:
+        while pending:
+            result = pending.popleft().result()
+            for item in itertools.islice(items, 1):
+                pending.append(executor.submit(fn, item))
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
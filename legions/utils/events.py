@@ -0,0 +1,74 @@
+import re
+
+# name(type [indexed] [name], ...)
+EVENT_SIGNATURE = re.compile(r"^\s*(\w+)\s*\((.*)\)\s*$")
+
+# Types whose indexed value is replaced by its keccak hash in the topic
+DYNAMIC_TYPES = re.compile(r"^(string|bytes)$|\[\d*\]$")
+
+
+class Event:
+    """
+    Event parsed from a human readable signature, e.g.
+    "Transfer(address indexed from, address indexed to, uint256 value)"
+    """
+
+    def __init__(self, signature: str) -> None:
+        match = EVENT_SIGNATURE.match(signature)
+        if match is None or "(" in match.group(2):
+            raise ValueError(
+                "Invalid event signature (tuples are not supported): {}".format(
+                    signature
+                )
+            )
+        self.name = match.group(1)
+        self.inputs = []
+        for position, param in enumerate(filter(None, match.group(2).split(","))):
+            words = param.split()
+            indexed = "indexed" in words[1:]
+            words = [word for word in words if word != "indexed"]
+            name = words[1] if len(words) > 1 else "arg{}".format(position)
+            self.inputs.append((words[0], name, indexed))
+
+    @property
+    def signature(self) -> str:
+        return "{}({})".format(self.name, ",".join(t for t, _, _ in self.inputs))
+
+    @property
+    def topic(self) -> str:
+        from web3 import Web3
+
+        return Web3.keccak(text=self.signature).hex()
+
+    def decode(self, log: dict) -> dict:
+        """
+        Arguments of the event emitted by log, by name
+        """
+        from web3 import Web3
+
+        try:
+            from eth_abi import decode
+        except ImportError:  # eth-abi < 3
+            from eth_abi import decode_abi as decode
+
+        topics = log["topics"][1:]
+        indexed = [(t, n) for t, n, i in self.inputs if i]
+        data = [(t, n) for t, n, i in self.inputs if not i]
+        if len(topics) != len(indexed):
+            raise ValueError("Log does not match {}".format(self.signature))
+
+        args = {}
+        for (type_, name), topic in zip(indexed, topics):
+            if DYNAMIC_TYPES.search(type_):
+                # Only the hash of the value is in the log
+                args[name] = topic
+            else:
+                args[name] = decode([type_], Web3.toBytes(hexstr=topic))[0]
+        values = decode([t for t, _ in data], Web3.toBytes(hexstr=log["data"]))
+        args.update(zip([n for _, n in data], values))
+
+        # Keep the values JSON friendly
+        for name, value in args.items():
+            if isinstance(value, bytes):
+                args[name] = Web3.toHex(value)
+        return args
@@ -0,0 +1,138 @@
+import csv
+import json
+import os
+import sys
+
+# Output formats supported by the streaming exports
+EXPORT_FORMATS = ["ndjson", "csv"]
+
+
+class RecordWriter:
+    """
+    Streams dict records to a file (or stdout) one line at a time
+    """
+
+    def __init__(self, stream, fields: list, close: bool = True) -> None:
+        self.stream = stream
+        self.fields = fields
+        self._close = close
+
+    def write(self, record: dict) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+    def tell(self) -> int:
+        return self.stream.tell()
+
+    def close(self) -> None:
+        self.flush()
+        if self._close:
+            self.stream.close()
+
+
+class NDJSONWriter(RecordWriter):
+    """
+    One JSON object per line
+    """
+
+    def write(self, record: dict) -> None:
+        self.stream.write(json.dumps(record, default=str) + "\n")
+
+
+class CSVWriter(RecordWriter):
+    """
+    Comma separated values, with a header line unless appending to a file
+    """
+
+    def __init__(
+        self, stream, fields: list, close: bool = True, header: bool = True
+    ) -> None:
+        super().__init__(stream, fields, close)
+        self._writer = csv.DictWriter(stream, fieldnames=fields, extrasaction="ignore")
+        if header:
+            self._writer.writeheader()
+
+    def write(self, record: dict) -> None:
+        self._writer.writerow(record)
+
+
+def open_writer(output: str, fmt: str, fields: list, offset: int = None):
+    """
+    Open a RecordWriter of format fmt on output ("-" or None for stdout).
+
+    If offset is given the existing file is truncated to offset and written from
+    there, which is how an interrupted export is resumed.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(
+            "Unknown format {}, expected one of {}".format(fmt, EXPORT_FORMATS)
+        )
+
+    if output in (None, "-"):
+        stream, close, header = sys.stdout, False, True
+    elif offset is not None:
+        stream = open(output, "r+", newline="")
+        stream.seek(offset)
+        stream.truncate()
+        close, header = True, offset == 0
+    else:
+        stream, close, header = open(output, "w", newline=""), True, True
+
+    if fmt == "csv":
+        return CSVWriter(stream, fields, close=close, header=header)
+    return NDJSONWriter(stream, fields, close=close)
+
+
+def read_rows(input: str):
+    """
+    Yield the CSV rows of input ("-" or None for stdin), stripped, skipping blank
+    lines and # comments
+    """
+    stream = sys.stdin if input in (None, "-") else open(input, "r", newline="")
+    try:
+        for row in csv.reader(stream):
+            row = [value.strip() for value in row]
+            if row and row[0] and not row[0].startswith("#"):
+                yield row
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def read_column(input: str):
+    """
+    Yield the first column of every row of input (see read_rows)
+    """
+    for row in read_rows(input):
+        yield row[0]
+
+
+class Checkpoint:
+    """
+    Small JSON file next to an export recording how far it got
+    """
+
+    def __init__(self, output: str) -> None:
+        self.path = "{}.checkpoint".format(output)
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, **state) -> None:
+        # Write to a temporary file first so a crash never leaves a broken checkpoint
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
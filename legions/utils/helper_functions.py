@@ -1,14 +1,33 @@
-import requests
-import json
+import importlib.util
 import os
+import sys
 from termcolor import cprint
 
 
 ChainID_JSON = "chains.json"
 
 
+def lazy_import(name: str):
+    """
+    Module which is only really imported on first attribute access
+
+    Keeps heavy dependencies (teatime's plugins, ...) out of Legions' startup.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
 def checkConnection(url, verbose=None):
-    r = requests.get(url, timeout=5)
+    from legions.network import transport
+
+    r = transport.get(url, timeout=5)
     if verbose:
         cprint("Status Code: {}".format(r.status_code), "grey")
         cprint("Response: {}".format(r.text), "grey")
@@ -18,17 +37,34 @@ def checkConnection(url, verbose=None):
         return False
 
 
+def decodeStorageSlot(value):
+    """
+    Best effort representation of a storage slot value: text if it decodes, int otherwise
+    """
+    from web3 import Web3
+
+    # TODO: make this smarter, detect the variable and show proper represantation of it .
+    try:
+        return Web3.toText(value)
+    except Exception:
+        try:
+            return Web3.toInt(value)
+        except Exception:
+            return None
+
+
 def getChainName(ChainID, json_file=ChainID_JSON):
-    # chain list Source: https://chainid.network/
-    # TODO: make this nicer
+    """
+    Name of the chain with id ChainID, "Unknown" if it is not in the registry
+    """
+    from legions.utils.chains import ChainRegistry, registry
 
+    if json_file != ChainID_JSON:
+        registry = ChainRegistry(
+            [os.path.join(os.path.dirname(__file__), json_file)], cache_path=None
+        )
     try:
-        with open(os.path.join(os.path.dirname(__file__), json_file), "r") as f:
-            chains_dict = json.load(f)
-        for chain in chains_dict:
-            print
-            if chain.get("chainId", None) == ChainID:
-                return chain.get("name")
+        return registry.name(ChainID) or "Unknown"
     except Exception as e:
         print("Failed to find the chainID for {} - {}".format(ChainID, e))
-        return ""
+        return "Unknown"
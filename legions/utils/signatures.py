@@ -0,0 +1,114 @@
+import itertools
+import os
+from concurrent import futures
+
+# Signatures handed to a worker process at once
+DEFAULT_RECOVER_CHUNK = 256
+
+
+def normalize_v(v: int) -> int:
+    """
+    Recovery id (0 or 1) of a signature's v, whether it is given as 0/1, as
+    27/28 (eth_sign) or with an EIP-155 chain id (35 + 2 * chainId + id)
+    """
+    if v in (0, 1):
+        return v
+    if v in (27, 28):
+        return v - 27
+    if v >= 35:
+        return (v - 35) % 2
+    raise ValueError("Invalid signature v: {}".format(v))
+
+
+def message_hash(data: str = None, data_hash: str = None) -> bytes:
+    """
+    Hash recovered against: data_hash as is, or the EIP-191 ("\\x19Ethereum
+    Signed Message:\\n" + length) hash of data, read as hex when it starts with
+    0x and as text otherwise
+    """
+    from eth_utils import to_bytes
+
+    if data_hash is not None:
+        digest = to_bytes(hexstr=data_hash)
+        if len(digest) != 32:
+            raise ValueError("Hash must be 32 bytes, got {}".format(len(digest)))
+        return digest
+
+    from eth_account.messages import _hash_eip191_message, encode_defunct
+
+    if data.startswith("0x"):
+        return _hash_eip191_message(encode_defunct(hexstr=data))
+    return _hash_eip191_message(encode_defunct(text=data))
+
+
+def recover(digest: bytes, signature: str) -> str:
+    """
+    Checksum address which signed digest, signature being r, s and v (65 bytes)
+    """
+    from eth_keys import keys
+    from eth_utils import to_bytes
+
+    sig = to_bytes(hexstr=signature)
+    if len(sig) != 65:
+        raise ValueError("Signature must be 65 bytes, got {}".format(len(sig)))
+    vrs = (
+        normalize_v(sig[64]),
+        int.from_bytes(sig[:32], "big"),
+        int.from_bytes(sig[32:64], "big"),
+    )
+    public_key = keys.Signature(vrs=vrs).recover_public_key_from_msg_hash(digest)
+    return public_key.to_checksum_address()
+
+
+def recover_row(row: tuple, hashed: bool = False) -> tuple:
+    """
+    (address, None) of a (data or hash, signature) row, (None, error) if it
+    cannot be recovered
+    """
+    try:
+        message, signature = row[0], row[1]
+        if hashed:
+            digest = message_hash(data_hash=message)
+        else:
+            digest = message_hash(data=message)
+        return recover(digest, signature), None
+    except Exception as e:
+        return None, "{}".format(e) or type(e).__name__
+
+
+def _recover_chunk(rows: list, hashed: bool) -> list:
+    return [recover_row(row, hashed) for row in rows]
+
+
+def recover_many(
+    rows, hashed: bool = False, processes: int = None, chunk_size: int = None
+):
+    """
+    Yield recover_row of every row, in order, recovered on a pool of processes
+    (default one per core)
+
+    Rows are sent to the workers chunk_size at a time and at most two chunks per
+    worker are in flight, so rows may be a long generator.
+    """
+    processes = processes or os.cpu_count() or 1
+    chunk_size = max(1, chunk_size or DEFAULT_RECOVER_CHUNK)
+    rows = iter(rows)
+
+    def chunks():
+        while True:
+            chunk = [tuple(row) for row in itertools.islice(rows, chunk_size)]
+            if not chunk:
+                return
+            yield chunk
+
+    with futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        chunks_ = chunks()
+        pending = [
+            executor.submit(_recover_chunk, chunk, hashed)
+            for chunk in itertools.islice(chunks_, 2 * processes)
+        ]
+        while pending:
+            results = pending.pop(0).result()
+            for chunk in itertools.islice(chunks_, 1):
+                pending.append(executor.submit(_recover_chunk, chunk, hashed))
+            yield from results
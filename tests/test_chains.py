@@ -0,0 +1,80 @@
+import json
+import os
+import pickle
+
+from legions.utils.chains import CHAINS_FILE, ChainRegistry
+from legions.utils.helper_functions import getChainName
+
+
+class Exploit:
+    """
+    Creates a directory when unpickled
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def __reduce__(self):
+        return (os.mkdir, (self.path,))
+
+
+def test_registry_indexes_and_user_chains(tmp_path):
+    """
+    Tests that user chain files add private networks and override the bundled
+    chains with the same id.
+    """
+    user_file = tmp_path / "private.json"
+    user_file.write_text(
+        json.dumps(
+            [
+                {"name": "Devnet", "chainId": 1337, "networkId": 1, "shortName": "dev"},
+                {"name": "Mainnet fork", "chainId": 1, "shortName": "eth"},
+            ]
+        )
+    )
+    registry = ChainRegistry([CHAINS_FILE], cache_path=str(tmp_path / "c.json"))
+    assert registry.name(1) == "Ethereum Mainnet"
+
+    registry.add_file(str(user_file))
+    assert registry.name(1) == "Mainnet fork"
+    assert registry.by_chain_id(1337)["name"] == "Devnet"
+    assert registry.by_short_name("DEV")["chainId"] == 1337
+    assert 1337 in [chain["chainId"] for chain in registry.by_network_id(1)]
+    assert registry.by_chain_id(424242) is None
+
+
+def test_registry_cache_follows_files(tmp_path, monkeypatch):
+    chains_file = tmp_path / "chains.json"
+    chains_file.write_text(json.dumps([{"name": "A", "chainId": 5}]))
+    cache_path = str(tmp_path / "chains-cache.json")
+    assert ChainRegistry([str(chains_file)], cache_path).name(5) == "A"
+    with open(cache_path) as f:
+        assert json.load(f)["chains"] == [{"name": "A", "chainId": 5}]
+
+    # Loaded from the cache, without parsing the files
+    parse = ChainRegistry._parse
+    monkeypatch.setattr(ChainRegistry, "_parse", None)
+    assert ChainRegistry([str(chains_file)], cache_path).name(5) == "A"
+
+    monkeypatch.setattr(ChainRegistry, "_parse", parse)
+    chains_file.write_text(json.dumps([{"name": "Renamed", "chainId": 5}]))
+    assert ChainRegistry([str(chains_file)], cache_path).name(5) == "Renamed"
+
+
+def test_registry_ignores_pickled_cache(tmp_path):
+    """
+    Tests that a pickle at the cache path is never unpickled, only replaced.
+    """
+    chains_file = tmp_path / "chains.json"
+    chains_file.write_text(json.dumps([{"name": "A", "chainId": 5}]))
+    cache_path = tmp_path / "chains-cache.json"
+    cache_path.write_bytes(pickle.dumps(Exploit(str(tmp_path / "pwned"))))
+
+    assert ChainRegistry([str(chains_file)], str(cache_path)).name(5) == "A"
+    assert not (tmp_path / "pwned").exists()
+    assert json.loads(cache_path.read_text())["chains"][0]["name"] == "A"
+
+
+def test_get_chain_name():
+    assert getChainName(1) == "Ethereum Mainnet"
+    assert getChainName(424242) == "Unknown"
@@ -0,0 +1,56 @@
+import time
+from concurrent import futures
+
+from legions.utils.concurrency import map_ordered, run_concurrently
+
+
+def test_run_concurrently_yields_as_completed():
+    """
+    Tests that tasks run in parallel and are yielded in completion order.
+    """
+    tasks = {
+        "slow": lambda: time.sleep(0.3) or "slow",
+        "fast": lambda: "fast",
+        "broken": lambda: 1 / 0,
+    }
+
+    start = time.monotonic()
+    results = list(run_concurrently(tasks, max_workers=3))
+
+    assert time.monotonic() - start < 0.6
+    assert [name for name, _, _ in results][-1] == "slow"
+    by_name = {name: (result, error) for name, result, error in results}
+    assert by_name["fast"] == ("fast", None)
+    assert isinstance(by_name["broken"][1], ZeroDivisionError)
+
+
+def test_run_concurrently_timeout_does_not_block_others():
+    """
+    Tests that a hanging task is reported as timed out without delaying the rest.
+    """
+    tasks = {"hangs": lambda: time.sleep(2), "ok": lambda: time.sleep(0.1) or 1}
+
+    start = time.monotonic()
+    results = {name: error for name, _, error in run_concurrently(tasks, timeout=0.3)}
+
+    assert time.monotonic() - start < 1
+    assert results["ok"] is None
+    assert isinstance(results["hangs"], futures.TimeoutError)
+
+
+def test_map_ordered_keeps_input_order():
+    """
+    Tests that results come back in input order with a bounded number in flight.
+    """
+    running = []
+
+    def work(i):
+        running.append(i)
+        time.sleep(0.05 if i % 2 else 0.01)
+        return i * 2
+
+    results = map_ordered(work, range(20), max_workers=4, prefetch=4)
+
+    assert next(results) == 0
+    assert len(running) <= 5
+    assert list(results) == [i * 2 for i in range(1, 20)]
@@ -0,0 +1,25 @@
+from legions.utils.events import Event
+
+TRANSFER = "Transfer(address indexed from, address indexed to, uint256 value)"
+
+
+def test_event_topic_and_decode():
+    event = Event(TRANSFER)
+    log = {
+        "topics": [
+            event.topic,
+            "0x" + "00" * 12 + "11" * 20,
+            "0x" + "00" * 12 + "22" * 20,
+        ],
+        "data": "0x{:064x}".format(5),
+    }
+
+    assert event.signature == "Transfer(address,address,uint256)"
+    assert event.topic == (
+        "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+    )
+    assert event.decode(log) == {
+        "from": "0x" + "11" * 20,
+        "to": "0x" + "22" * 20,
+        "value": 5,
+    }
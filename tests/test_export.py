@@ -0,0 +1,46 @@
+import json
+
+from legions.utils.export import Checkpoint, open_writer
+
+
+def test_ndjson_resume_truncates_to_checkpoint(tmp_path):
+    """
+    Tests that resuming an export drops whatever was written after the last
+    checkpoint.
+    """
+    output = str(tmp_path / "storage.ndjson")
+    checkpoint = Checkpoint(output)
+
+    writer = open_writer(output, "ndjson", ["slot"])
+    writer.write({"slot": "0x0"})
+    writer.flush()
+    checkpoint.save(next=1, offset=writer.tell())
+    writer.write({"slot": "0x1"})  # written but never checkpointed
+    writer.close()
+
+    state = checkpoint.load()
+    writer = open_writer(output, "ndjson", ["slot"], offset=state["offset"])
+    writer.write({"slot": "0x1"})
+    writer.close()
+    checkpoint.clear()
+
+    with open(output) as f:
+        assert [json.loads(line)["slot"] for line in f] == ["0x0", "0x1"]
+    assert checkpoint.load() is None
+
+
+def test_csv_header_written_once(tmp_path):
+    output = str(tmp_path / "storage.csv")
+
+    writer = open_writer(output, "csv", ["slot", "hex"])
+    writer.write({"slot": "0x0", "hex": "0x00"})
+    writer.flush()
+    offset = writer.tell()
+    writer.close()
+
+    writer = open_writer(output, "csv", ["slot", "hex"], offset=offset)
+    writer.write({"slot": "0x1", "hex": "0x01"})
+    writer.close()
+
+    with open(output) as f:
+        assert f.read().splitlines() == ["slot,hex", "0x0,0x00", "0x1,0x01"]
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+from web3.providers import BaseProvider
+
+from legions.network.providers import BatchHTTPProvider, FailoverProvider
+
+
+class NodeProvider(BaseProvider):
+    """
+    Fake node answering after delay seconds, or failing, at head block head
+    """
+
+    def __init__(self, name: str, delay: float = 0, fail: bool = False, head=100):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.head = head
+        self.methods = []
+
+    def make_request(self, method, params):
+        self.methods.append(method)
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("{} is down".format(self.name))
+        result = hex(self.head) if method == "eth_blockNumber" else self.name
+        return {"jsonrpc": "2.0", "id": 1, "result": result}
+
+
+def test_slow_endpoint_is_hedged():
+    slow, fast = NodeProvider("slow", delay=1), NodeProvider("fast")
+    provider = FailoverProvider([slow, fast], default_hedge_delay=0.05)
+
+    started = time.monotonic()
+    assert provider.make_request("eth_getBalance", [])["result"] == "fast"
+    assert time.monotonic() - started < 0.5
+    assert provider.hedged == 1
+
+    # Calls with side effects are never duplicated
+    slow.delay = 0
+    provider.make_request("eth_sendRawTransaction", ["0x00"])
+    assert "eth_sendRawTransaction" not in fast.methods
+
+
+def test_writes_only_fail_over_when_not_sent():
+    """
+    Tests that a transaction moves on to the next endpoint when the first one
+    refuses the connection, but not once a node may have received it.
+    """
+    dead = BatchHTTPProvider("http://127.0.0.1:1", request_kwargs={"timeout": 1})
+    up = NodeProvider("up")
+    provider = FailoverProvider([dead, up], head_interval=60)
+    assert provider.make_request("eth_sendRawTransaction", ["0x00"])["result"] == "up"
+
+    down = NodeProvider("down", fail=True)
+    provider = FailoverProvider([down, up], head_interval=60)
+    with pytest.raises(ConnectionError):
+        provider.make_request("eth_sendRawTransaction", ["0x00"])
+    assert up.methods.count("eth_sendRawTransaction") == 1
+
+
+def test_failing_endpoint_is_dropped():
+    down, up = NodeProvider("down", fail=True), NodeProvider("up")
+    provider = FailoverProvider([down, up], max_failures=2, head_interval=60)
+
+    for _ in range(3):
+        assert provider.make_request("eth_chainId", [])["result"] == "up"
+
+    assert down.methods.count("eth_chainId") == 2
+    assert [state for _, _, _, state in provider.status()] == ["dropped", "ok"]
+
+
+def test_lagging_endpoint_is_skipped():
+    behind, ahead = NodeProvider("behind", head=90), NodeProvider("ahead", head=100)
+    provider = FailoverProvider([behind, ahead], max_lag=5)
+
+    provider.make_request("eth_chainId", [])
+    end = time.monotonic() + 2
+    while not provider.endpoints[0].lagging and time.monotonic() < end:
+        time.sleep(0.01)
+
+    assert provider.make_request("eth_chainId", [])["result"] == "ahead"
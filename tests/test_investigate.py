@@ -0,0 +1,65 @@
+import time
+
+from legions.commands.commands import run_probes, summarize_probes
+
+
+def test_probes_time_out_independently():
+    """
+    Tests that a hanging probe is reported as timed out without holding back
+    the others, and that the summary groups the probes by namespace.
+    """
+
+    def denied():
+        raise ValueError("method not found")
+
+    probes = {
+        "admin_datadir": lambda: "/data",
+        "admin_nodeInfo": lambda: time.sleep(5),
+        "shh_version": denied,
+        "eth_getBalance 0x01": lambda: 1,
+        "eth_getBalance 0x02": lambda: 2,
+    }
+    started = time.monotonic()
+    results = run_probes(probes, timeout=0.2, budget_end=started + 10)
+
+    assert time.monotonic() - started < 2
+    statuses = {name: status for name, status, _ in results}
+    assert statuses == {
+        "admin_datadir": "exposed",
+        "admin_nodeInfo": "timed out",
+        "shh_version": "denied",
+        "eth_getBalance 0x01": "exposed",
+        "eth_getBalance 0x02": "exposed",
+    }
+    assert sorted(summarize_probes(results)) == [
+        ["admin", "admin_datadir", "", "admin_nodeInfo"],
+        ["eth", "eth_getBalance x2", "", ""],
+        ["shh", "", "shh_version", ""],
+    ]
+
+
+class HangingNode:
+    """
+    Stand-in for w3 whose web3_clientVersion never answers
+    """
+
+    def isConnected(self):
+        return True
+
+    @property
+    def clientVersion(self):
+        time.sleep(2)
+        return "Geth/v1.9.25"
+
+
+def test_admin_client_version_within_deadline(monkeypatch):
+    """
+    Tests that a node hanging on web3_clientVersion does not hold the command
+    past the probe timeout.
+    """
+    from legions.commands import commands
+
+    monkeypatch.setattr(commands, "w3", HangingNode())
+    started = time.monotonic()
+    commands.Investigate().investigate_admin(timeout=0.2, budget=5)
+    assert time.monotonic() - started < 1
@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from legions.network import limits
+from legions.network.providers import BatchHTTPProvider
+from legions.network.web3 import Web3
+
+
+class LimitedHandler(BaseHTTPRequestHandler):
+    """
+    Refuses the first calls: with HTTP 429, then with a JSON-RPC rate limit error
+    """
+
+    def do_POST(self):
+        call = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.calls += 1
+        if self.server.calls == 1:
+            self.send_response(429)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.server.calls == 2:
+            error = {"code": -32005, "message": "project ID request rate exceeded"}
+            body = {"jsonrpc": "2.0", "id": call["id"], "error": error}
+        else:
+            body = {"jsonrpc": "2.0", "id": call["id"], "result": "0x1"}
+        body = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(limits, "BACKOFF_BASE", 0.001)
+
+
+def test_rate_limited_calls_are_retried():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LimitedHandler)
+    server.daemon_threads = True
+    server.calls = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        w3 = Web3()
+        w3.connect("http://127.0.0.1:{}".format(server.server_port))
+        (policy,) = w3.set_limits(retries=2)
+
+        assert w3.eth.blockNumber == 1
+        assert server.calls == 3
+        assert policy.stats()["retried"] == 2
+        assert policy.stats()["circuit"] == "closed"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_token_bucket_rate():
+    bucket = limits.TokenBucket(rate=50, burst=1)
+    started = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - started >= 0.09
+
+
+def test_circuit_breaker_fails_fast():
+    policy = limits.HostPolicy("dead:8545", retries=1, failures=2, reset=60)
+    sent = []
+
+    def send():
+        sent.append(1)
+        raise requests.ConnectionError("refused")
+
+    with pytest.raises(requests.ConnectionError):
+        policy.call(send)
+    assert len(sent) == 2
+
+    with pytest.raises(limits.CircuitOpenError):
+        policy.call(send)
+    assert len(sent) == 2
+    assert policy.breaker.state == "open"
+
+
+def test_writes_only_retried_when_rate_limited():
+    """
+    Tests that a request which is not idempotent is not sent again after a
+    failure which may have reached the node, only after a rate limit.
+    """
+    policy = limits.HostPolicy("node:8545", retries=2)
+    sent = []
+
+    def send(status):
+        def send():
+            sent.append(status)
+            response = requests.Response()
+            response.status_code = status
+            raise requests.HTTPError(response=response)
+
+        return send
+
+    with pytest.raises(requests.HTTPError):
+        policy.call(send(503), idempotent=False)
+    assert sent == [503]
+
+    with pytest.raises(requests.HTTPError):
+        policy.call(send(429), idempotent=False)
+    assert sent == [503, 429, 429, 429]
+
+
+class PartlyLimitedHandler(BaseHTTPRequestHandler):
+    """
+    Refuses eth_blockNumber the first time for its rate limit, runs the rest
+    """
+
+    def answer(self, call):
+        self.server.methods.append(call["method"])
+        if call["method"] == "eth_blockNumber" and self.server.refused == 0:
+            self.server.refused += 1
+            error = {"code": -32005, "message": "rate limit exceeded"}
+            return {"jsonrpc": "2.0", "id": call["id"], "error": error}
+        return {"jsonrpc": "2.0", "id": call["id"], "result": call["method"]}
+
+    def do_POST(self):
+        calls = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        body = json.dumps([self.answer(call) for call in calls]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_partly_refused_batch_only_resends_refused_calls():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PartlyLimitedHandler)
+    server.daemon_threads = True
+    server.methods, server.refused = [], 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        provider = BatchHTTPProvider("http://127.0.0.1:{}".format(server.server_port))
+        responses = provider.make_batch_request(
+            [("eth_sendRawTransaction", ["0x00"]), ("eth_blockNumber", [])]
+        )
+
+        assert [r["result"] for r in responses] == [
+            "eth_sendRawTransaction",
+            "eth_blockNumber",
+        ]
+        assert server.methods == [
+            "eth_sendRawTransaction",
+            "eth_blockNumber",
+            "eth_blockNumber",
+        ]
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,106 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from legions.network import metrics
+from legions.network.providers import BatchHTTPProvider
+
+
+class NodeHandler(BaseHTTPRequestHandler):
+    """
+    Answers eth_blockNumber, fails every other method
+    """
+
+    def answer(self, call: dict) -> dict:
+        if call["method"] == "eth_blockNumber":
+            return {"jsonrpc": "2.0", "id": call["id"], "result": "0x1"}
+        error = {"code": -32601, "message": "method not found"}
+        return {"jsonrpc": "2.0", "id": call["id"], "error": error}
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if isinstance(request, list):
+            response = [self.answer(call) for call in request]
+        else:
+            response = self.answer(request)
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def node():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), NodeHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    metrics.reset()
+    yield "http://127.0.0.1:{}".format(server.server_port)
+    metrics.reset()
+    server.shutdown()
+    server.server_close()
+
+
+def test_calls_recorded_per_command(node):
+    """
+    Tests that calls and batches are counted per method, with their errors and
+    bytes, both for the running command and the session.
+    """
+    provider = BatchHTTPProvider(node)
+    provider.make_request("eth_blockNumber", [])
+
+    metrics.start_command()
+    provider.make_batch_request(
+        [("eth_blockNumber", []), ("eth_blockNumber", []), ("eth_foo", [])]
+    )
+    metrics.end_command("query blocks", 0)
+
+    command = metrics.last_command().as_dict()
+    assert command["name"] == "query blocks"
+    assert command["requests"] == 1
+    assert command["total"]["calls"] == 3
+    assert command["methods"]["eth_blockNumber"]["errors"] == 0
+    assert command["methods"]["eth_foo"]["errors"] == 1
+    assert command["total"]["bytes"] > 0
+
+    session = metrics.export()["session"]
+    assert session["requests"] == 2
+    assert session["methods"]["eth_blockNumber"]["calls"] == 3
+    assert sum(session["total"]["histogram"].values()) == 4
+
+
+def test_failed_requests_are_errors():
+    metrics.reset()
+    provider = BatchHTTPProvider("http://127.0.0.1:1", request_kwargs={"timeout": 1})
+    with pytest.raises(Exception):
+        provider.make_request("eth_chainId", [])
+
+    method = metrics.session().as_dict()["methods"]["eth_chainId"]
+    assert (method["calls"], method["errors"], method["bytes"]) == (1, 1, 0)
+    metrics.reset()
+
+
+def test_quantile():
+    assert metrics.quantile([], 0.5) is None
+    assert metrics.quantile([0.3, 0.1, 0.2], 0.5) == 0.2
+
+
+def test_background_calls_not_charged_to_command():
+    metrics.reset()
+    command = metrics.start_command()
+    metrics.record(["eth_call"], 0.01)
+    with metrics.background():
+        metrics.record(["eth_blockNumber"], 0.01)
+    metrics.end_command("query balance", 0)
+
+    assert list(command.methods) == ["eth_call"]
+    assert metrics.session().total().calls == 2
+    assert metrics.current() is None
+    metrics.reset()
@@ -0,0 +1,142 @@
+from web3.providers import BaseProvider
+
+from legions.network.multicall import (
+    AGGREGATE3,
+    DECIMALS,
+    MULTICALL3_ADDRESS,
+    SYMBOL,
+    decode,
+    encode,
+)
+from legions.network.web3 import Web3
+from legions.utils.cache import JSONFileCache
+
+
+class BalanceProvider(BaseProvider):
+    """
+    Fake node where the balance of an address is its last byte, with Multicall3
+    deployed or not
+    """
+
+    def __init__(self, multicall: bool = True):
+        self.multicall = multicall
+        self.calls = []
+
+    def answer(self, target: str, data: bytes):
+        """
+        (success, return data) of a call aggregated by Multicall3
+        """
+        if data[-1] == 11:
+            # getEthBalance of the last address always fails
+            return False, b""
+        return True, encode(["uint256"], [data[-1]])
+
+    def make_request(self, method, params):
+        self.calls.append(method)
+        if method == "eth_getCode":
+            deployed = (
+                self.multicall and params[0].lower() == MULTICALL3_ADDRESS.lower()
+            )
+            result = "0x6080" if deployed else "0x"
+        elif method == "eth_call":
+            data = Web3.toBytes(hexstr=params[0]["data"])
+            assert Web3.toHex(data[:4]) == AGGREGATE3
+            (calls,) = decode(["(address,bool,bytes)[]"], data[4:])
+            results = [self.answer(target, data) for target, _, data in calls]
+            result = Web3.toHex(encode(["(bool,bytes)[]"], [results]))
+        elif method == "eth_getBalance":
+            result = hex(int(params[0], 16) & 0xFF)
+        return {"jsonrpc": "2.0", "id": len(self.calls), "result": result}
+
+    def make_batch_request(self, calls):
+        return [self.make_request(method, params) for method, params in calls]
+
+
+ADDRESSES = ["0x{:040x}".format(i) for i in range(1, 12)]
+
+
+def test_iter_balances_through_multicall():
+    w3 = Web3()
+    w3.provider = BalanceProvider()
+
+    balances = list(w3.iter_balances(ADDRESSES, 10, concurrency=3))
+
+    assert [address for address, _ in balances] == ADDRESSES
+    assert [wei for _, wei in balances] == list(range(1, 11)) + [None]
+    assert w3.provider.calls == ["eth_getCode", "eth_call"]
+
+
+def test_iter_balances_batches_without_multicall():
+    w3 = Web3()
+    w3.provider = BalanceProvider(multicall=False)
+
+    balances = list(w3.iter_balances(ADDRESSES, 10, batch_size=4, concurrency=3))
+
+    assert balances == list(zip(ADDRESSES, range(1, 12)))
+    assert w3.provider.calls.count("eth_getBalance") == len(ADDRESSES)
+
+
+class TokenProvider(BalanceProvider):
+    """
+    Fake node with two ERC-20 tokens, one returning its symbol as bytes32, and
+    an account without code
+    """
+
+    TOKENS = {
+        "0x" + "a1" * 20: (encode(["string"], ["AAA"]), 6),
+        "0x" + "a2" * 20: (b"MKR".ljust(32, b"\0"), 18),
+    }
+
+    def answer(self, target: str, data: bytes):
+        if target.lower() not in self.TOKENS:
+            return False, b""
+        symbol, decimals = self.TOKENS[target.lower()]
+        selector = Web3.toHex(data[:4])
+        if selector == SYMBOL:
+            return True, symbol
+        if selector == DECIMALS:
+            return True, encode(["uint8"], [decimals])
+        return True, encode(["uint256"], [data[-1] * 1000])
+
+    def make_request(self, method, params):
+        if method == "eth_chainId":
+            self.calls.append(method)
+            return {"jsonrpc": "2.0", "id": len(self.calls), "result": "0x1"}
+        if method != "eth_call" or self.multicall:
+            return super().make_request(method, params)
+        self.calls.append(method)
+        success, data = self.answer(
+            params[0]["to"], Web3.toBytes(hexstr=params[0]["data"])
+        )
+        if not success:
+            return {"jsonrpc": "2.0", "id": 1, "error": {"message": "reverted"}}
+        return {"jsonrpc": "2.0", "id": len(self.calls), "result": Web3.toHex(data)}
+
+
+def test_token_balances_and_cached_metadata(tmp_path):
+    """
+    Tests that token metadata is read once and then served from the cache, and
+    that balances come in holder then token order with or without Multicall3.
+    """
+    tokens = list(TokenProvider.TOKENS) + ["0x" + "a3" * 20]
+    holders = ["0x{:040x}".format(i) for i in range(1, 4)]
+    cache = JSONFileCache(str(tmp_path / "tokens.json"))
+
+    for multicall in (True, False):
+        w3 = Web3()
+        w3.provider = TokenProvider(multicall)
+
+        metadata = w3.token_metadata(tokens, 10, cache=cache)
+        assert metadata[tokens[0]] == {"symbol": "AAA", "decimals": 6}
+        assert metadata[tokens[1]] == {"symbol": "MKR", "decimals": 18}
+        assert metadata[tokens[2]] == {"symbol": None, "decimals": None}
+
+        balances = list(w3.iter_token_balances(holders, tokens, 10, batch_size=2))
+        assert balances == [
+            (holder, token, None if token == tokens[2] else 1000 * i)
+            for i, holder in enumerate(holders, 1)
+            for token in tokens
+        ]
+
+    # Only the unknown token was queried again by the second node
+    assert w3.provider.calls.count("eth_call") == 2 + len(holders) * len(tokens)
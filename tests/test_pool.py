@@ -0,0 +1,36 @@
+from legions.network.pool import ConnectionPool
+from legions.utils.chains import CHAINS_FILE, ChainRegistry
+
+
+def pool(**kwargs):
+    return ConnectionPool(ChainRegistry([CHAINS_FILE], cache_path=None), **kwargs)
+
+
+def test_endpoints_from_chain_registry(monkeypatch):
+    """
+    Tests that chains resolve to their first rpc endpoint whose variables are
+    all known, and that URLs are used as they are.
+    """
+    monkeypatch.delenv("INFURA_API_KEY", raising=False)
+    assert pool().endpoint("eth") == "https://api.mycryptoapi.com/eth"
+    assert (
+        pool(variables={"INFURA_API_KEY": "key"}).endpoint("1")
+        == "https://mainnet.infura.io/v3/key,https://api.mycryptoapi.com/eth"
+    )
+    assert pool().endpoint("http://127.0.0.1:8545") == "http://127.0.0.1:8545"
+
+
+def test_run_keeps_one_connection_per_chain():
+    connections = pool()
+    connections.set_endpoint("eth", "http://127.0.0.1:1")
+
+    results = {
+        chain: (result, error)
+        for chain, result, error in connections.run(
+            ["eth", "unknown"], lambda w3: w3.node_uri
+        )
+    }
+
+    assert results["eth"] == ("http://127.0.0.1:1", None)
+    assert "Unknown chain" in str(results["unknown"][1])
+    assert len(connections) == 1
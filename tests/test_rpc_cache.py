@@ -0,0 +1,142 @@
+from web3.providers import BaseProvider
+
+from legions.network.web3 import Web3
+
+
+class ChainProvider(BaseProvider):
+    """
+    Fake node at block head, answering eth_getCode with the block it is asked at
+    """
+
+    def __init__(self, head: int = 100, fork: str = "a", chain_id: int = 1):
+        self.head = head
+        self.fork = fork
+        self.chain_id = chain_id
+        self.calls = []
+
+    def block(self, number: int) -> dict:
+        return {
+            "number": hex(number),
+            "hash": "0x{}{:063x}".format(self.fork, number),
+            "parentHash": "0x{}{:063x}".format(self.fork, number - 1),
+        }
+
+    def make_request(self, method, params):
+        self.calls.append((method, params))
+        if method == "eth_getBlockByNumber":
+            number = self.head if params[0] == "latest" else int(params[0], 16)
+            result = self.block(number)
+            if number == 0:
+                # Same genesis whatever the chain, like Ethereum and Classic
+                result["hash"] = "0x{:064x}".format(0)
+        elif method == "eth_chainId":
+            result = hex(self.chain_id)
+        elif method == "eth_blockNumber":
+            result = hex(self.head)
+        elif method == "eth_getCode":
+            result = "0x{}{:04x}".format(self.fork * 2, int(params[1], 16))
+        else:
+            result = None
+        return {"jsonrpc": "2.0", "id": len(self.calls), "result": result}
+
+    def make_batch_request(self, calls):
+        return [self.make_request(method, params) for method, params in calls]
+
+
+def connect(provider, path):
+    w3 = Web3()
+    w3.provider = provider
+    w3.enable_cache(confirmations=10, path=path)
+    return w3
+
+
+def code_calls(provider):
+    return [call for call in provider.calls if call[0] == "eth_getCode"]
+
+
+def test_final_results_persist_between_sessions(tmp_path):
+    path = str(tmp_path / "rpc.sqlite")
+    address = "0x" + "11" * 20
+
+    first = ChainProvider()
+    w3 = connect(first, path)
+    assert w3.eth.blockNumber == 100
+    assert w3.eth.getCode(address, 50).hex() == "0xaa0032"
+    assert w3.eth.getCode(address, 50).hex() == "0xaa0032"
+    assert len(code_calls(first)) == 1
+
+    # Next session: only the chain id and genesis block are fetched to
+    # recognize the chain
+    second = ChainProvider()
+    w3 = connect(second, path)
+    assert w3.eth.getCode(address, 50).hex() == "0xaa0032"
+    assert second.calls == [
+        ("eth_chainId", []),
+        ("eth_getBlockByNumber", ["0x0", False]),
+    ]
+    assert w3.rpc_cache.stats()["hits"] == 1
+
+
+def test_recent_blocks_cost_no_extra_call(tmp_path):
+    """
+    Tests that a block the known head does not prove final is neither cached
+    nor costs any call besides its own, and that the head is never fetched for
+    the cache.
+    """
+    provider = ChainProvider()
+    w3 = connect(provider, str(tmp_path / "rpc.sqlite"))
+    address = "0x" + "11" * 20
+
+    assert w3.eth.blockNumber == 100
+    w3.eth.getCode(address, 95)
+    w3.eth.getCode(address, 95)
+    assert [method for method, _ in provider.calls] == [
+        "eth_blockNumber",
+        "eth_getCode",
+        "eth_getCode",
+    ]
+
+    # Once the head moved on, the block is final
+    provider.head = 110
+    assert w3.eth.blockNumber == 110
+    w3.eth.getCode(address, 95)
+    w3.eth.getCode(address, 95)
+    assert len(code_calls(provider)) == 3
+    assert ("eth_getBlockByNumber", ["latest", False]) not in provider.calls
+
+
+def test_batch_request_only_sends_misses(tmp_path):
+    provider = ChainProvider()
+    w3 = connect(provider, str(tmp_path / "rpc.sqlite"))
+    address = "0x" + "11" * 20
+
+    w3.eth.blockNumber
+    w3.eth.getCode(address, 40)
+    calls = [("eth_getCode", [address, hex(block)]) for block in (40, 41, 42)]
+    responses = list(w3.batch_request(calls))
+
+    assert [r["result"] for r in responses] == ["0xaa0028", "0xaa0029", "0xaa002a"]
+    assert len(code_calls(provider)) == 3
+
+
+def test_chains_sharing_genesis_kept_apart(tmp_path):
+    """
+    Tests that two chains with the same genesis block but different chain ids
+    (e.g. Ethereum and Ethereum Classic) share neither results nor head.
+    """
+    path = str(tmp_path / "rpc.sqlite")
+    address = "0x" + "11" * 20
+
+    eth = ChainProvider(head=100, fork="a", chain_id=1)
+    w3 = connect(eth, path)
+    w3.eth.blockNumber
+    assert w3.eth.getCode(address, 50).hex() == "0xaa0032"
+
+    etc = ChainProvider(head=60, fork="b", chain_id=61)
+    w3 = connect(etc, path)
+    assert w3.eth.getCode(address, 50).hex() == "0xbb0032"
+    assert len(code_calls(etc)) == 1
+    # The head of Ethereum does not make block 55 final on Classic
+    w3.eth.getCode(address, 55)
+    w3.eth.getCode(address, 55)
+    assert len(code_calls(etc)) == 3
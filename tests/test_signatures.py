@@ -0,0 +1,40 @@
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from web3 import Web3
+
+from legions.utils.signatures import message_hash, normalize_v, recover_many
+
+KEY = "0x28d96497361cfc7cde5f253232d1ea300333891792d5922991d98683e1fb05c6"
+ADDRESS = "0x9541ba003233F53AFC11be1834F1fD26fb7C2060"
+
+
+def sign(message: str, v_offset: int = 0) -> str:
+    signature = Account.sign_message(encode_defunct(text=message), KEY).signature
+    return Web3.toHex(signature[:64] + bytes([signature[64] + v_offset]))
+
+
+def test_normalize_v():
+    assert [normalize_v(v) for v in (0, 1, 27, 28, 37, 38)] == [0, 1, 0, 1, 0, 1]
+
+
+def test_recover_many_in_order():
+    """
+    Tests that signatures are recovered in input order whatever their v, with
+    the message given as text, hex or by its hash, and that a broken row only
+    fails itself.
+    """
+    rows = [
+        ("hello", sign("hello")),
+        ("0x68656c6c6f", sign("hello", -27)),
+        ("bad", "0x12"),
+        ("hello 2", sign("hello 2", 2 * 1 + 35 - 27)),
+    ]
+    results = list(recover_many(rows, processes=2, chunk_size=1))
+
+    assert [address for address, _ in results] == [ADDRESS, ADDRESS, None, ADDRESS]
+    assert "65 bytes" in results[2][1]
+
+    digest = Web3.toHex(message_hash(data="hello"))
+    assert list(recover_many([(digest, sign("hello"))], hashed=True)) == [
+        (ADDRESS, None)
+    ]
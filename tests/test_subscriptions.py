@@ -0,0 +1,81 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+import websockets
+
+from legions.network.subscriptions import Subscription
+
+
+def wait_until(condition, timeout=2):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def node():
+    """
+    WebSocket node pushing 20 newHeads notifications right after eth_subscribe
+    """
+    loop = asyncio.new_event_loop()
+    requests = []
+
+    async def handler(ws, path):
+        async for message in ws:
+            request = json.loads(message)
+            requests.append(request)
+            if request["method"] != "eth_subscribe":
+                continue
+            await ws.send(json.dumps({"jsonrpc": "2.0", "id": 1, "result": "0xab"}))
+            for number in range(20):
+                notification = {
+                    "jsonrpc": "2.0",
+                    "method": "eth_subscription",
+                    "params": {"subscription": "0xab", "result": {"number": number}},
+                }
+                await ws.send(json.dumps(notification))
+
+    server = loop.run_until_complete(
+        websockets.serve(handler, "127.0.0.1", 0, loop=loop)
+    )
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield "ws://127.0.0.1:{}".format(server.sockets[0].getsockname()[1]), requests
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def test_subscription_sampling(node):
+    uri, requests = node
+    subscription = Subscription(uri, "newHeads", sample=5).start()
+
+    events = [subscription.get(2) for _ in range(4)]
+    assert wait_until(lambda: subscription.received == 20)
+    subscription.stop()
+
+    assert [event["number"] for event in events] == [0, 5, 10, 15]
+    assert subscription.skipped == 16
+    assert requests[0]["params"] == ["newHeads"]
+    assert wait_until(lambda: requests[-1]["method"] == "eth_unsubscribe")
+
+
+def test_subscription_drops_when_queue_is_full(node):
+    """
+    Tests that a full queue drops new events with drop set, and otherwise holds
+    the reader back until the consumer catches up.
+    """
+    uri, _ = node
+    dropping = Subscription(uri, "newHeads", queue_size=5, drop=True).start()
+    blocking = Subscription(uri, "newHeads", queue_size=5).start()
+
+    assert wait_until(lambda: dropping.received == 20 and blocking.received == 6)
+    assert dropping.dropped == 15
+    assert blocking.received == 6 and blocking.dropped == 0
+
+    assert [blocking.get(2)["number"] for _ in range(20)] == list(range(20))
+    dropping.stop()
+    blocking.stop()
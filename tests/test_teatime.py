@@ -1,4 +1,24 @@
-from legions.commands.more.teatime import SUPPORTED_BY, SUPPORTED_BY_ALL_CLIENTS, scan
+import json
+import time
+
+from teatime.plugins import Plugin
+from teatime.reporting import Issue, Severity
+
+from legions.utils.cache import JSONFileCache
+
+from legions.commands.more import teatime
+from legions.commands.more.teatime import (
+    SUPPORTED_BY,
+    SUPPORTED_BY_ALL_CLIENTS,
+    detect_node_type,
+    parse_target,
+    read_inventory,
+    run_scan,
+    RPCMemo,
+    scan,
+    plugin_event,
+    summary_event,
+)
 from teatime.plugins.context import NodeType
 
 
@@ -45,3 +65,307 @@ def test_plugin_instantiator():
     plugins = scan.plugin_instantiator.keys()
 
     [scan.plugin_instantiator[p]() for p in plugins]
+
+
+def test_parse_target():
+    """
+    Tests that node URIs are split in the prefix, host and port used by teatime.
+    """
+    assert parse_target("http://127.0.0.1:8545") == ("http://", "127.0.0.1", 8545)
+    assert parse_target("https://node.example.com/rpc") == (
+        "https://",
+        "node.example.com/rpc",
+        8545,
+    )
+    assert parse_target("ws://10.0.0.1:8546")[0] == "ws://"
+
+
+def test_detect_node_type():
+    assert detect_node_type("Geth/v1.9.25-stable/linux-amd64/go1.15.6") == NodeType.GETH
+    assert detect_node_type("Parity-Ethereum//v2.7.2-stable") == NodeType.PARITY
+    assert detect_node_type("besu/v20.10.0") is None
+
+
+def test_read_inventory(tmp_path):
+    """
+    Tests that inventory files skip comments, blank lines and duplicates.
+    """
+    inventory = tmp_path / "nodes.txt"
+    inventory.write_text(
+        "# fleet\nhttp://10.0.0.1:8545\n\nhttp://10.0.0.2:8545  # archive\n"
+        "http://10.0.0.1:8545\n/data/geth.ipc\n"
+    )
+
+    assert read_inventory(str(inventory)) == [
+        "http://10.0.0.1:8545",
+        "http://10.0.0.2:8545",
+        "/data/geth.ipc",
+    ]
+
+
+class SleepyPlugin(Plugin):
+    """
+    Fake plugin recording when it ran
+    """
+
+    def __init__(self, log, name, intrusive):
+        self.log = log
+        self.name = name
+        self.INTRUSIVE = intrusive
+
+    def _check(self, context):
+        time.sleep(0.2)
+        self.log.append(self.name)
+
+
+def test_run_scan_serializes_intrusive_plugins(monkeypatch):
+    """
+    Tests that probes run concurrently and disruptive plugins run after the rest.
+    """
+    log = []
+    instantiator = {
+        "eth1/GethStopRPC": lambda: SleepyPlugin(log, "stop", True),
+        "eth1/AccountCreation": lambda: SleepyPlugin(log, "create", True),
+        "eth1/NodeVersion": lambda: SleepyPlugin(log, "probe", False),
+        "eth1/GethDatadir": lambda: SleepyPlugin(log, "probe", False),
+        "eth1/PeerCountStatus": lambda: SleepyPlugin(log, "probe", False),
+    }
+    monkeypatch.setattr(scan, "plugin_instantiator", instantiator)
+
+    start = time.monotonic()
+    report = run_scan("127.0.0.1", 8545, NodeType.GETH, list(instantiator))
+
+    # 3 probes in parallel + 2 serialized plugins
+    assert time.monotonic() - start < 0.2 * 4
+    assert log == ["probe", "probe", "probe", "create", "stop"]
+    assert set(report.to_dict()) == {
+        "id",
+        "target",
+        "issues",
+        "timestamp",
+        "meta",
+        "ok",
+    }
+    assert report.target == "http://127.0.0.1:8545"
+
+
+class PeerCountPlugin(Plugin):
+    """
+    Fake plugin asking the node for its client version and peer count
+    """
+
+    INTRUSIVE = False
+
+    def _check(self, context):
+        self.get_rpc_json(context.target, "web3_clientVersion")
+        self.get_rpc_json(context.target, "net_peerCount")
+        self.get_rpc_json(context.target, "admin_addPeer", ["enode://"])
+
+
+def test_rpc_memo_sends_identical_calls_once(monkeypatch):
+    """
+    Tests that identical read-only calls of a scan reach the node once, while
+    state-changing methods always go through.
+    """
+    sent = []
+
+    def get_rpc_json(target, method, params=None, idx=0):
+        sent.append(method)
+        time.sleep(0.05)
+        return "0x1"
+
+    monkeypatch.setattr(Plugin, "get_rpc_json", staticmethod(get_rpc_json))
+    monkeypatch.setattr(
+        scan,
+        "plugin_instantiator",
+        {name: PeerCountPlugin for name in SUPPORTED_BY_ALL_CLIENTS[:4]},
+    )
+
+    report = run_scan(
+        "127.0.0.1",
+        8545,
+        NodeType.GETH,
+        SUPPORTED_BY_ALL_CLIENTS[:4],
+        client_version="Geth/v1.9.25",
+    )
+
+    assert sorted(sent) == ["admin_addPeer"] * 4 + ["net_peerCount"]
+    assert report.meta["rpc_memo"] == {"requests": 12, "hits": 7, "hit_rate": 0.583}
+
+
+def test_rpc_memo_skips_intrusive_plugins():
+    memo = RPCMemo()
+    plugin = PeerCountPlugin()
+    plugin.INTRUSIVE = True
+
+    memo.attach(plugin)
+
+    assert plugin.get_rpc_json == Plugin.get_rpc_json
+
+
+class DatadirPlugin(Plugin):
+    """
+    Fake plugin reporting one issue per run
+    """
+
+    INTRUSIVE = False
+    runs = 0
+
+    def _check(self, context):
+        DatadirPlugin.runs += 1
+        context.report.add_issue(
+            Issue(
+                title="Admin datadir access",
+                description="datadir leaked",
+                severity=Severity.LOW,
+                raw_data="/data",
+            )
+        )
+
+
+def test_incremental_scan_reuses_cached_findings(monkeypatch, tmp_path):
+    """
+    Tests that incremental scans reuse unexpired findings and rerun plugins
+    whose cache key changed.
+    """
+    monkeypatch.setattr(
+        scan, "plugin_instantiator", {"eth1/GethDatadir": DatadirPlugin}
+    )
+    cache = JSONFileCache(str(tmp_path / "scan_cache.json"))
+
+    def scan_once(client_version):
+        return run_scan(
+            "127.0.0.1",
+            8545,
+            NodeType.GETH,
+            ["eth1/GethDatadir"],
+            client_version=client_version,
+            cache=cache,
+            incremental=True,
+        )
+
+    assert scan_once("Geth/v1.9.25").meta["cached_plugins"] == []
+    cache.save()
+
+    cache = JSONFileCache(str(tmp_path / "scan_cache.json"))
+    report = scan_once("Geth/v1.9.25")
+    assert DatadirPlugin.runs == 1
+    assert report.meta["cached_plugins"] == ["eth1/GethDatadir"]
+    assert report.to_dict()["issues"][0]["raw"] == '"/data"'
+
+    # An upgraded node is scanned again
+    scan_once("Geth/v1.10.0")
+    assert DatadirPlugin.runs == 2
+
+
+def test_run_scan_streams_plugin_events(monkeypatch):
+    """
+    Tests that every finished plugin is reported through on_plugin.
+    """
+    monkeypatch.setattr(
+        scan,
+        "plugin_instantiator",
+        {"eth1/GethDatadir": DatadirPlugin, "eth1/NodeVersion": DatadirPlugin},
+    )
+    events = []
+
+    report = run_scan(
+        "127.0.0.1",
+        8545,
+        NodeType.GETH,
+        ["eth1/GethDatadir", "eth1/NodeVersion"],
+        on_plugin=lambda *args: events.append(plugin_event(*args)),
+    )
+
+    assert sorted(e["plugin"] for e in events) == [
+        "eth1/GethDatadir",
+        "eth1/NodeVersion",
+    ]
+    assert all(len(e["issues"]) == 1 and not e["cached"] for e in events)
+    summary = summary_event(report)
+    assert summary["event"] == "summary"
+    assert summary["issue_count"] == 2
+    assert "issues" not in summary
+
+
+class BlockingPlugin(Plugin):
+    """
+    Fake intrusive plugin hanging past the fleet deadline
+    """
+
+    INTRUSIVE = True
+    log = []
+
+    def _check(self, context):
+        time.sleep(1.5)
+        BlockingPlugin.log.append("blocking")
+        context.report.add_issue(
+            Issue(
+                title="Late finding",
+                description="found after the deadline",
+                severity=Severity.LOW,
+                raw_data="late",
+            )
+        )
+
+
+class NextPlugin(DatadirPlugin):
+    INTRUSIVE = True
+
+    def _check(self, context):
+        BlockingPlugin.log.append("next")
+        super()._check(context)
+
+
+def test_fleet_abandons_hosts_past_deadline(monkeypatch, tmp_path, capsys):
+    """
+    Tests that a host scan past its deadline stops before its next plugin and
+    that nothing it finds afterwards is streamed.
+    """
+    monkeypatch.setattr(
+        scan,
+        "plugin_instantiator",
+        {"eth1/AccountCreation": BlockingPlugin, "eth1/GethDatadir": NextPlugin},
+    )
+    monkeypatch.setattr(teatime, "SCAN_CACHE_FILE", str(tmp_path / "cache.json"))
+
+    def scan_host(node_uri, plugins, **kwargs):
+        kwargs.pop("timeout")
+        report = run_scan("127.0.0.1", 8545, NodeType.GETH, plugins, **kwargs)
+        return {"report": report}
+
+    monkeypatch.setattr(teatime, "scan_host", scan_host)
+    inventory = tmp_path / "nodes.txt"
+    inventory.write_text("http://10.0.0.1:8545\n")
+    fleet = scan.__new__(scan)
+    fleet.added_plugins = {"eth1/AccountCreation", "eth1/GethDatadir"}
+    fleet.fleet(str(inventory), deadline=1, output="-")
+    time.sleep(1)
+
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [event["event"] for event in events] == ["error", "fleet"]
+    assert BlockingPlugin.log == ["blocking"]
+
+
+class FailingPlugin(Plugin):
+    INTRUSIVE = True
+
+    def _check(self, context):
+        raise RuntimeError("node hung up")
+
+
+def test_run_scan_survives_failing_intrusive_plugin(monkeypatch):
+    """
+    Tests that an intrusive plugin failing does not lose the other findings.
+    """
+    monkeypatch.setattr(
+        scan,
+        "plugin_instantiator",
+        {"eth1/AccountCreation": FailingPlugin, "eth1/GethDatadir": NextPlugin},
+    )
+
+    report = run_scan(
+        "127.0.0.1", 8545, NodeType.GETH, ["eth1/AccountCreation", "eth1/GethDatadir"]
+    )
+
+    assert [issue.title for issue in report.issues] == ["Admin datadir access"]
@@ -0,0 +1,150 @@
+import gzip
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from legions.network import transport
+from legions.network.providers import PipelinedIPCProvider
+from legions.network.web3 import Web3
+
+
+class RPCHandler(BaseHTTPRequestHandler):
+    """
+    Answers every JSON-RPC call with "0x1", gzipped when the client accepts it
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        call = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        body = json.dumps({"jsonrpc": "2.0", "id": call["id"], "result": "0x1"})
+        body = body.encode("utf-8")
+        self.send_response(200)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+            self.server.gzipped += 1
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def node():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RPCHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.gzipped = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_provider_reuses_keep_alive_connection(node):
+    """
+    Tests that consecutive calls share one compressed keep-alive connection.
+    """
+    w3 = Web3()
+    w3.connect("http://127.0.0.1:{}".format(node.server_port))
+
+    assert [w3.eth.blockNumber for _ in range(5)] == [1] * 5
+    assert node.connections == 1
+    assert node.gzipped == 5
+
+
+def test_set_pool_size(node):
+    """
+    Tests that a new pool size replaces the adapter and closes the old pools.
+    """
+    with pytest.raises(ValueError):
+        transport.set_pool_size(0)
+
+    url = "http://127.0.0.1:{}".format(node.server_port)
+    transport.post(url, json={"jsonrpc": "2.0", "id": 1, "method": "eth_blockNumber"})
+    old = transport.get_session().get_adapter(url)
+    assert len(old.poolmanager.pools) > 0
+
+    transport.set_pool_size(4)
+    adapter = transport.get_session().get_adapter(url)
+    assert adapter._pool_maxsize == 4
+    assert len(old.poolmanager.pools) == 0
+    transport.set_pool_size(transport.DEFAULT_POOL_SIZE)
+
+
+def serve_ipc(path: str, expected: int):
+    """
+    Unix socket node which waits for expected requests before answering them
+    all, in reverse order and split across writes
+    """
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+
+    def serve():
+        conn, _ = server.accept()
+        decoder = json.JSONDecoder()
+        buffer = ""
+        requests = []
+        while len(requests) < expected:
+            buffer += conn.recv(4096).decode("utf-8")
+            while buffer:
+                try:
+                    request, end = decoder.raw_decode(buffer)
+                except ValueError:
+                    break
+                requests.append(request)
+                buffer = buffer[end:]
+        payload = "".join(
+            json.dumps({"jsonrpc": "2.0", "id": r["id"], "result": r["params"][0]})
+            + "\n"
+            for r in reversed(requests)
+        ).encode("utf-8")
+        for i in range(0, len(payload), 7):
+            conn.sendall(payload[i : i + 7])
+            time.sleep(0.001)
+        conn.close()
+        server.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+
+
+def test_ipc_requests_are_pipelined(tmp_path):
+    """
+    Tests that requests are all sent before any answer arrives and that the
+    answers are matched back by id.
+    """
+    path = str(tmp_path / "node.ipc")
+    serve_ipc(path, 3)
+    provider = PipelinedIPCProvider(path, timeout=2)
+
+    responses = provider.make_batch_request(
+        [("echo", ["a"]), ("echo", ["b"]), ("echo", ["c"])]
+    )
+
+    assert [response["result"] for response in responses] == ["a", "b", "c"]
+
+
+def test_ipc_fails_pending_requests_when_closed(tmp_path):
+    path = str(tmp_path / "node.ipc")
+    serve_ipc(path, 5)
+    provider = PipelinedIPCProvider(path, timeout=2)
+
+    pending = provider._send(provider._encode("echo", ["a"]))
+    provider.disconnect()
+
+    with pytest.raises(ConnectionError):
+        pending.result(2)
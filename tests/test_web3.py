@@ -0,0 +1,205 @@
+import time
+
+from web3.providers import BaseProvider
+
+from legions.network.providers import order_batch_response
+from legions.network.session import LazyWeb3
+from legions.network.web3 import Web3
+from legions.utils.helper_functions import decodeStorageSlot
+
+
+class StorageProvider(BaseProvider):
+    """
+    Fake provider answering eth_getStorageAt with the slot number as value
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def make_batch_request(self, calls):
+        self.batches.append(calls)
+        return [
+            {"jsonrpc": "2.0", "id": i, "result": "0x{:064x}".format(int(p[1], 16))}
+            for i, (_, p) in enumerate(calls)
+        ]
+
+
+def test_order_batch_response():
+    """
+    Tests that batch responses are matched to their requests by id.
+    """
+    requests = [{"id": 1}, {"id": 2}, {"id": 3}]
+    responses = [{"id": 3, "result": "c"}, {"id": 1, "result": "a"}]
+
+    ordered = order_batch_response(requests, responses)
+
+    assert [r.get("result") for r in ordered] == ["a", None, "c"]
+    assert "error" in ordered[1]
+
+    # A single error object answers the whole batch
+    ordered = order_batch_response(requests, {"error": {"message": "nope"}})
+    assert [r["id"] for r in ordered] == [1, 2, 3]
+    assert all("error" in r for r in ordered)
+
+
+def test_iter_storage_batches_each_slot_once():
+    """
+    Tests that iter_storage reads every slot once, in batches of batch_size.
+    """
+    w3 = Web3()
+    w3.provider = StorageProvider()
+
+    slots = list(w3.iter_storage("0x0", 5, 25, block=1, batch_size=10))
+
+    assert [len(batch) for batch in w3.provider.batches] == [10, 10, 5]
+    assert [slot for slot, _ in slots] == list(range(5, 30))
+    assert all(Web3.toInt(value) == slot for slot, value in slots)
+    assert w3.provider.batches[0][0] == ("eth_getStorageAt", ["0x0", "0x5", "0x1"])
+
+
+def test_decode_storage_slot():
+    assert decodeStorageSlot(Web3.toBytes(text="legions")) == "legions"
+    assert decodeStorageSlot(b"\xff" * 32) == int("ff" * 32, 16)
+
+
+class HeadProvider(BaseProvider):
+    """
+    Fake provider whose head advances by one block on every eth_blockNumber
+    """
+
+    def __init__(self):
+        self.head = 100
+
+    def make_request(self, method, params):
+        assert method == "eth_blockNumber"
+        self.head += 1
+        return {"jsonrpc": "2.0", "id": 0, "result": hex(self.head)}
+
+
+def test_resolve_block_pinned(monkeypatch):
+    """
+    Tests that a pinned block is reused until its TTL expires.
+    """
+    w3 = Web3()
+    w3.provider = HeadProvider()
+
+    assert w3.resolve_block(7) == 7
+    assert w3.resolve_block() == 101
+    assert w3.resolve_block() == 102
+
+    now = [0.0]
+    monkeypatch.setattr("legions.network.web3.time.monotonic", lambda: now[0])
+    assert w3.pin_block(ttl=30) == 103
+    assert w3.resolve_block() == 103
+    now[0] = 31.0
+    assert w3.resolve_block() == 104
+
+    w3.unpin_block()
+    assert w3.resolve_block() == 105
+
+
+def test_lazy_web3_connects_on_first_use():
+    """
+    Tests that the shared instance is only created once a command uses it, and
+    not by nubia's command discovery.
+    """
+    w3 = LazyWeb3("http://127.0.0.1:8545")
+
+    assert not hasattr(w3, "__command")
+    assert not w3.loaded
+
+    assert w3.node_uri == "http://127.0.0.1:8545"
+    assert w3.loaded
+    w3.block_pinning = True
+    assert w3._w3.block_pinning
+
+
+def test_conversions_stay_offline(monkeypatch, capsys):
+    """
+    Tests that the conversion commands do not load the shared instance.
+    """
+    from legions.commands.more.more_commands import Conversions
+
+    def load(self):
+        raise AssertionError("web3 loaded")
+
+    monkeypatch.setattr(LazyWeb3, "_load", load)
+    Conversions().toHex("hi")
+    Conversions().keccak("hi")
+
+    out = capsys.readouterr().out
+    assert "Hex of hi: 0x6869" in out
+    assert "keccak of hi: 0x7624778d" in out
+
+
+class SlowBlockProvider(BaseProvider):
+    """
+    Fake provider answering every eth_getBlockByNumber batch after 0.1s
+    """
+
+    def make_batch_request(self, calls):
+        time.sleep(0.1)
+        return [
+            {
+                "jsonrpc": "2.0",
+                "id": i,
+                "result": {"number": params[0], "transactions": ["0xaa"]},
+            }
+            for i, (_, params) in enumerate(calls)
+        ]
+
+
+def test_iter_blocks_concurrent_in_order():
+    """
+    Tests that block batches are fetched concurrently and yielded in order.
+    """
+    w3 = Web3()
+    w3.provider = SlowBlockProvider()
+
+    start = time.monotonic()
+    blocks = list(w3.iter_blocks(10, 49, mode="header", batch_size=5, concurrency=8))
+
+    assert time.monotonic() - start < 0.5
+    assert [int(block["number"], 16) for block in blocks] == list(range(10, 50))
+    assert "transactions" not in blocks[0]
+
+
+class LogProvider(BaseProvider):
+    """
+    Fake node with one log per block, refusing calls returning more than 50 logs
+    """
+
+    def __init__(self):
+        self.ranges = []
+
+    def make_request(self, method, params):
+        first, last = int(params[0]["fromBlock"], 16), int(params[0]["toBlock"], 16)
+        self.ranges.append((first, last))
+        if last - first + 1 > 50:
+            return {
+                "jsonrpc": "2.0",
+                "id": 1,
+                "error": {
+                    "code": -32005,
+                    "message": "query returned more than 50 results",
+                },
+            }
+        logs = [{"blockNumber": hex(n)} for n in range(first, last + 1)]
+        return {"jsonrpc": "2.0", "id": 1, "result": logs}
+
+
+def test_iter_logs_splits_refused_ranges():
+    """
+    Tests that refused ranges are bisected, results stay in block order and the
+    chunk size grows again afterwards.
+    """
+    w3 = Web3()
+    w3.provider = LogProvider()
+
+    logs = list(w3.iter_logs(0, 299, chunk_size=200, concurrency=1))
+
+    assert [int(log["blockNumber"], 16) for log in logs] == list(range(300))
+    assert (0, 199) in w3.provider.ranges
+    assert (0, 49) in w3.provider.ranges
+    # Small answers double the chunk size, back up to a refused one
+    assert any(last - first + 1 > 50 for first, last in w3.provider.ranges[-3:])